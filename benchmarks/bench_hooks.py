@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run every charm hook against generated topologies and time it.
+
+Each hook runs in a fresh copy of the charm with the fake hook tools from
+fake_juju.py on PATH, so no Juju controller or network is needed. For every
+hook the wall time (median over --runs), the number of processes it started,
+the number of hook tool calls and its peak RSS are reported.
+
+The hooks still touch the local system where the charm does (eg. /etc/ceph
+and /var/lib/charm) and need python-apt, so run this as root in a throwaway
+container or VM of a supported series. System commands the charm runs
+(apt-get, ceph-authtool, systemctl, ...) are stubbed out.
+
+Usage: benchmarks/bench_hooks.py [--topology NAME] [--hook NAME] [--runs N]
+                                 [--python PATH] [--json FILE] [--verbose]
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from collections import OrderedDict
+
+import yaml
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CHARM_ROOT = os.path.dirname(BENCH_DIR)
+
+sys.path.append(os.path.join(CHARM_ROOT, 'hooks'))
+
+import fake_juju  # noqa
+from charmhelpers.contrib.storage.linux.ceph import CephBrokerRq  # noqa
+
+# Mons on the ceph relation and ceph-access relations (one consumer unit
+# each); every topology has a single storage-backend relation to cinder.
+TOPOLOGIES = OrderedDict([
+    ('small', {'mons': 3, 'ceph-access': 1}),
+    ('medium', {'mons': 5, 'ceph-access': 20}),
+    ('large', {'mons': 9, 'ceph-access': 200}),
+])
+
+LOCAL_UNIT = 'cinder-ceph/0'
+REQUEST_ID = '6c1d3e2a-91b4-11e8-8f8b-fa163e2c8a10'
+SECRET_UUID = 'a4e5a1b4-2c5d-4bd9-8a5e-3a1f5c0f7b21'
+CEPH_KEY = 'AQBqYV5bAAAAABAAnCw0bHDIZsz+Wgu3yWTX0A=='
+
+# Remote unit each relation hook is run for, by endpoint.
+REMOTE_UNITS = {
+    'ceph': 'ceph-mon/0',
+    'storage-backend': 'cinder/0',
+    'ceph-access': 'nova-compute/0',
+}
+
+CHARM_CONTENT = ('actions', 'hooks', 'lib', 'templates', 'config.yaml',
+                 'metadata.yaml', 'revision')
+
+# Installed as sitecustomize in the hook's interpreter; counts the
+# processes the hook starts and records its own peak RSS at exit.
+HOOK_STATS = """\
+import atexit
+import json
+import os
+import resource
+import subprocess
+
+_path = os.environ.pop('BENCH_HOOK_STATS', None)
+if _path:
+    _forks = [0]
+    _execute_child = subprocess.Popen._execute_child
+    _system = os.system
+
+    def _counted_execute_child(*args, **kwargs):
+        _forks[0] += 1
+        return _execute_child(*args, **kwargs)
+
+    def _counted_system(command):
+        _forks[0] += 1
+        return _system(command)
+
+    def _write_stats():
+        with open(_path, 'w') as f:
+            json.dump({
+                'forks': _forks[0],
+                'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            }, f)
+
+    subprocess.Popen._execute_child = _counted_execute_child
+    os.system = _counted_system
+    atexit.register(_write_stats)
+"""
+
+
+def charm_hooks():
+    """Names of the hooks shipped in hooks/."""
+    hooks_dir = os.path.join(CHARM_ROOT, 'hooks')
+    names = []
+    for name in os.listdir(hooks_dir):
+        path = os.path.join(hooks_dir, name)
+        if ('.' not in name and os.path.isfile(path) and
+                os.access(path, os.X_OK)):
+            names.append(name)
+    return sorted(names)
+
+
+def charm_config():
+    with open(os.path.join(CHARM_ROOT, 'config.yaml')) as f:
+        options = yaml.safe_load(f)['options']
+    return dict((name, option['default'])
+                for name, option in options.items()
+                if option.get('default') is not None)
+
+
+def generate_model(mons, ceph_access):
+    """Build a model with a completed ceph broker request.
+
+    :param mons: number of ceph-mon units on the ceph relation
+    :param ceph_access: number of ceph-access relations
+    """
+    config = charm_config()
+    rq = CephBrokerRq(request_id=REQUEST_ID)
+    rq.add_op_create_pool(name=LOCAL_UNIT.split('/')[0],
+                          replica_count=config['ceph-osd-replication-count'],
+                          weight=config['ceph-pool-weight'],
+                          group='volumes')
+    ceph_units = OrderedDict()
+    for i in range(mons):
+        ceph_units['ceph-mon/{}'.format(i)] = {
+            'auth': 'cephx',
+            'key': CEPH_KEY,
+            'ceph-public-address': '10.5.1.{}'.format(i + 10),
+            'private-address': '10.5.1.{}'.format(i + 10),
+        }
+    ceph_units['ceph-mon/0']['broker-rsp-' + LOCAL_UNIT.replace('/', '-')] = \
+        json.dumps({'exit-code': 0, 'request-id': REQUEST_ID})
+    relations = {
+        'ceph:0': {
+            'endpoint': 'ceph',
+            'units': ceph_units,
+            'local': {'broker_req': rq.request,
+                      'private-address': '10.5.0.10'},
+        },
+        'storage-backend:1': {
+            'endpoint': 'storage-backend',
+            'units': {'cinder/0': {'private-address': '10.5.0.10'}},
+            'local': {},
+        },
+    }
+    for i in range(ceph_access):
+        relations['ceph-access:{}'.format(i + 2)] = {
+            'endpoint': 'ceph-access',
+            'units': {'nova-compute/{}'.format(i): {
+                'private-address': '10.5.2.{}'.format(i % 250 + 2)}},
+            'local': {},
+        }
+    return {
+        'unit': LOCAL_UNIT,
+        'leader': True,
+        'config': config,
+        'leader-settings': {'secret-uuid': SECRET_UUID},
+        'addresses': {'private-address': '10.5.0.10'},
+        'relations': relations,
+    }
+
+
+def relation_context(hook, model):
+    """Relation environment for a relation hook, empty for other hooks."""
+    for endpoint, unit in REMOTE_UNITS.items():
+        if not hook.startswith(endpoint + '-relation-'):
+            continue
+        for rid, relation in sorted(model['relations'].items()):
+            if unit in relation['units']:
+                return {
+                    'JUJU_RELATION': endpoint,
+                    'JUJU_RELATION_ID': rid,
+                    'JUJU_REMOTE_UNIT': unit,
+                }
+    return {}
+
+
+def _uses_python(path):
+    with open(path) as f:
+        return 'python' in f.readline()
+
+
+def run_hook(hook, model, tools_dir, site_dir, python=None):
+    """Run a hook once in a fresh charm directory.
+
+    :returns: dict of wall time, forks, hook tool calls, peak RSS (KiB) and
+        the exit code.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-hooks-')
+    try:
+        charm_dir = os.path.join(workdir, 'charm')
+        os.mkdir(charm_dir)
+        for name in CHARM_CONTENT:
+            src = os.path.join(CHARM_ROOT, name)
+            dst = os.path.join(charm_dir, name)
+            if os.path.isdir(src):
+                shutil.copytree(src, dst, symlinks=True,
+                                ignore=shutil.ignore_patterns(
+                                    '*.pyc', '__pycache__', '.unit-state.db'))
+            elif os.path.exists(src):
+                shutil.copy(src, dst)
+        model_file = os.path.join(workdir, 'model.json')
+        fake_juju.save_model(model, model_file)
+        stats_file = os.path.join(workdir, 'stats.json')
+
+        env = {
+            'PATH': tools_dir + os.pathsep + os.environ['PATH'],
+            'PYTHONPATH': site_dir,
+            'HOME': workdir,
+            'LANG': 'C.UTF-8',
+            'CHARM_DIR': charm_dir,
+            'JUJU_CHARM_DIR': charm_dir,
+            'JUJU_CONTEXT_ID': '{}-{}-bench'.format(LOCAL_UNIT, hook),
+            'JUJU_HOOK_NAME': hook,
+            'JUJU_MODEL_NAME': 'bench',
+            'JUJU_PRINCIPAL_UNIT': 'cinder/0',
+            'JUJU_UNIT_NAME': LOCAL_UNIT,
+            'UNIT_STATE_DB': os.path.join(workdir, 'state.db'),
+            'BENCH_HOOK_STATS': stats_file,
+            # Ceph admin commands run against an in-memory cluster.
+            'CHARM_CEPH_CLIENT': 'fake',
+            fake_juju.MODEL_ENV: model_file,
+        }
+        env.update(relation_context(hook, model))
+
+        cmd = [os.path.join(charm_dir, 'hooks', hook)]
+        if python and _uses_python(cmd[0]):
+            cmd.insert(0, python)
+        with open(os.path.join(workdir, 'output'), 'w') as out:
+            start = time.time()
+            proc = subprocess.Popen(cmd, cwd=charm_dir, env=env,
+                                    stdout=out, stderr=subprocess.STDOUT)
+            _, status, rusage = os.wait4(proc.pid, 0)
+            wall = time.time() - start
+        proc.returncode = (os.WEXITSTATUS(status) if os.WIFEXITED(status)
+                           else -os.WTERMSIG(status))
+
+        result = {
+            'wall': wall,
+            'forks': None,
+            'tool-calls': 0,
+            # Whole process tree, if the hook's own figure is unavailable.
+            'maxrss': rusage.ru_maxrss,
+            'exit-code': proc.returncode,
+        }
+        if os.path.exists(stats_file):
+            with open(stats_file) as f:
+                stats = json.load(f)
+            result['forks'] = stats['forks']
+            result['maxrss'] = stats['maxrss']
+        if os.path.exists(model_file + '.calls'):
+            with open(model_file + '.calls') as f:
+                result['tool-calls'] = sum(
+                    1 for line in f
+                    if line.strip() in fake_juju.HOOK_TOOLS)
+        if proc.returncode:
+            with open(os.path.join(workdir, 'output')) as f:
+                result['output'] = f.read()
+        return result
+    finally:
+        shutil.rmtree(workdir)
+
+
+def benchmark(topology, hooks, runs, tools_dir, site_dir, python=None):
+    model = generate_model(**dict((k.replace('-', '_'), v)
+                                  for k, v in TOPOLOGIES[topology].items()))
+    results = []
+    for hook in hooks:
+        samples = [run_hook(hook, model, tools_dir, site_dir, python)
+                   for _ in range(runs)]
+        walls = sorted(s['wall'] for s in samples)
+        result = dict(samples[0])
+        result.update({
+            'topology': topology,
+            'hook': hook,
+            'wall': walls[len(walls) // 2],
+            'maxrss': max(s['maxrss'] for s in samples),
+        })
+        results.append(result)
+    return results
+
+
+def print_results(topology, results):
+    params = TOPOLOGIES[topology]
+    print('{} ({} mons, {} ceph-access relations)'.format(
+        topology, params['mons'], params['ceph-access']))
+    print('  {:<34} {:>9} {:>6} {:>6} {:>9} {:>4}'.format(
+        'hook', 'wall ms', 'forks', 'tools', 'rss MiB', 'rc'))
+    for r in results:
+        print('  {:<34} {:>9.1f} {:>6} {:>6} {:>9.1f} {:>4}'.format(
+            r['hook'], r['wall'] * 1000,
+            '-' if r['forks'] is None else r['forks'],
+            r['tool-calls'], r['maxrss'] / 1024.0, r['exit-code']))
+    print()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark charm hooks against generated topologies.')
+    parser.add_argument('--topology', action='append',
+                        choices=list(TOPOLOGIES),
+                        help='topology to run (default: all)')
+    parser.add_argument('--hook', action='append',
+                        help='hook to run (default: all in hooks/)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='runs per hook; the median wall time is used')
+    parser.add_argument('--python',
+                        help='interpreter for python hooks (default: the '
+                             "hook's shebang)")
+    parser.add_argument('--json', metavar='FILE',
+                        help='also write the results to FILE')
+    parser.add_argument('--verbose', action='store_true',
+                        help='show the output of failed hooks')
+    args = parser.parse_args(argv)
+
+    hooks = args.hook or charm_hooks()
+    workdir = tempfile.mkdtemp(prefix='bench-hooks-env-')
+    try:
+        tools_dir = os.path.join(workdir, 'bin')
+        # Run the tools with this interpreter rather than whatever
+        # 'python' resolves to, to keep their start-up cost low.
+        fake_juju.install(tools_dir, sys.executable)
+        site_dir = os.path.join(workdir, 'site')
+        os.mkdir(site_dir)
+        with open(os.path.join(site_dir, 'sitecustomize.py'), 'w') as f:
+            f.write(HOOK_STATS)
+
+        all_results = []
+        for topology in args.topology or list(TOPOLOGIES):
+            results = benchmark(topology, hooks, args.runs, tools_dir,
+                                site_dir, args.python)
+            print_results(topology, results)
+            if args.verbose:
+                for r in results:
+                    if r.get('output'):
+                        print('--- {} ({})'.format(r['hook'], topology))
+                        print(r['output'])
+            all_results.extend(results)
+    finally:
+        shutil.rmtree(workdir)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(all_results, f, indent=2, sort_keys=True)
+    return 1 if any(r['exit-code'] for r in all_results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
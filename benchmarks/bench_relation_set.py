@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the legacy and current hookenv.relation_set paths.
+
+A stand-in relation-set is placed on PATH so only the charm side of the
+call (capability probe, serialization and transport) is measured.
+
+Usage: benchmarks/bench_relation_set.py [ITERATIONS]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import yaml
+from mock import patch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'hooks'))
+
+from charmhelpers.core import hookenv  # noqa
+
+FAKE_RELATION_SET = """#!/bin/sh
+for arg in "$@"; do
+    if [ "$arg" = "--help" ]; then
+        echo "usage: relation-set [options] key=value [key=value ...]"
+        echo "    --file  (= ) file containing key-value pairs"
+        exit 0
+    fi
+done
+cat > /dev/null
+"""
+
+SETTINGS = {
+    'backend_name': 'cinder-ceph',
+    'subordinate_configuration': json.dumps({'cinder': {
+        '/etc/cinder/cinder.conf': {'sections': {'cinder-ceph': [
+            ['volume_backend_name', 'cinder-ceph'],
+            ['volume_driver', 'cinder.volume.drivers.rbd.RBDDriver'],
+            ['rbd_pool', 'cinder-ceph'],
+            ['rbd_user', 'cinder-ceph'],
+            ['rbd_secret_uuid', 'a4e5a1b4-2c5d-4bd9-8a5e-3a1f5c0f7b21'],
+            ['rbd_ceph_conf', '/var/lib/charm/cinder-ceph/ceph.conf'],
+        ]}}}}),
+    'stateless': 'True',
+}
+
+
+def legacy_relation_set(relation_id=None, relation_settings=None):
+    """relation_set as it was before capability caching."""
+    relation_cmd_line = ['relation-set']
+    accepts_file = "--file" in subprocess.check_output(
+        relation_cmd_line + ["--help"], universal_newlines=True)
+    if relation_id is not None:
+        relation_cmd_line.extend(('-r', relation_id))
+    settings = dict(relation_settings)
+    if accepts_file:
+        with tempfile.NamedTemporaryFile(delete=False) as settings_file:
+            settings_file.write(yaml.safe_dump(settings).encode("utf-8"))
+        subprocess.check_call(
+            relation_cmd_line + ["--file", settings_file.name])
+        os.remove(settings_file.name)
+
+
+def main(iterations):
+    workdir = tempfile.mkdtemp()
+    try:
+        tool = os.path.join(workdir, 'relation-set')
+        with open(tool, 'w') as f:
+            f.write(FAKE_RELATION_SET)
+        os.chmod(tool, stat.S_IRWXU)
+        os.environ['PATH'] = workdir + os.pathsep + os.environ['PATH']
+        os.environ['UNIT_STATE_DB'] = os.path.join(workdir, 'state.db')
+        os.environ['JUJU_UNIT_NAME'] = 'cinder-ceph/0'
+
+        results = [('legacy', timeit.timeit(
+            lambda: legacy_relation_set('storage-backend:1', SETTINGS),
+            number=iterations))]
+        for name, version in (('tempfile', '1.25.6-trusty-amd64'),
+                              ('stdin', '2.4.3-bionic-amd64')):
+            hookenv.cache.clear()
+            with patch.object(hookenv, 'juju_version', return_value=version):
+                results.append((name, timeit.timeit(
+                    lambda: hookenv.relation_set('storage-backend:1',
+                                                 SETTINGS),
+                    number=iterations)))
+
+        print('yaml dumper: {}'.format(hookenv._yaml_dumper().__name__))
+        for name, elapsed in results:
+            print('{:<10} {:8.2f} ms/call'.format(
+                name, elapsed * 1000 / iterations))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stand-in Juju hook tools backed by a JSON model file.
+
+This script acts as the hook tool it is invoked as; ``install`` creates a
+directory of links to it (or of wrappers running it with PYTHON) that can be
+put on PATH:
+
+    benchmarks/fake_juju.py install DIR [PYTHON]
+    FAKE_JUJU_MODEL=model.json PATH=DIR:$PATH hooks/config-changed
+
+The model is a JSON document::
+
+    {
+        "unit": "cinder-ceph/0",
+        "leader": true,
+        "config": {"use-syslog": false},
+        "leader-settings": {"secret-uuid": "..."},
+        "resources": {"packages": "/path/to/packages.tar.gz"},
+        "addresses": {"private-address": "10.5.0.10"},
+        "relations": {
+            "ceph:0": {
+                "endpoint": "ceph",
+                "units": {"ceph-mon/0": {"auth": "cephx", "key": "..."}},
+                "local": {"broker_req": "..."}
+            }
+        }
+    }
+
+Tools that change state (relation-set, leader-set, status-set and
+application-version-set) rewrite the model under a lock. Every invocation
+is appended to ``<model>.calls`` and juju-log messages to ``<model>.log``,
+so read-only tools never rewrite the model. A handful of system commands
+the charm runs (apt-get, ceph, systemctl, ...) are stubbed out as well:
+they are recorded and succeed without doing anything.
+"""
+
+from __future__ import print_function
+
+import fcntl
+import json
+import os
+import sys
+
+MODEL_ENV = 'FAKE_JUJU_MODEL'
+TOOL_ENV = 'FAKE_JUJU_TOOL'
+
+HOOK_TOOLS = (
+    'application-version-set',
+    'config-get',
+    'is-leader',
+    'juju-log',
+    'leader-get',
+    'leader-set',
+    'related-units',
+    'relation-get',
+    'relation-ids',
+    'relation-list',
+    'relation-set',
+    'resource-get',
+    'status-get',
+    'status-set',
+    'unit-get',
+)
+
+SYSTEM_STUBS = (
+    'apt-get',
+    'apt-mark',
+    'ceph',
+    'ceph-authtool',
+    'chown',
+    'rados',
+    'rbd',
+    'service',
+    'systemctl',
+    'update-alternatives',
+)
+
+WRAPPER = """\
+#!/bin/sh
+{env}={name} exec "{python}" "{script}" "$@"
+"""
+
+CEPH_VERSION = 'ceph version 13.2.1 (5533ecdc0fda920179d7ad84e0aa65a127b20d77) mimic (stable)'  # noqa
+
+RELATION_SET_USAGE = """\
+Usage: relation-set [options] key=value [key=value ...]
+
+Options:
+--file  (= )
+    file containing key-value pairs
+-r, --relation  (= )
+    specify a relation by id
+"""
+
+
+class ToolError(Exception):
+
+    def __init__(self, message, code=1):
+        super(ToolError, self).__init__(message)
+        self.code = code
+
+
+def model_path():
+    try:
+        return os.environ[MODEL_ENV]
+    except KeyError:
+        raise ToolError('{} is not set'.format(MODEL_ENV))
+
+
+def load_model(path=None):
+    with open(path or model_path()) as f:
+        return json.load(f)
+
+
+def save_model(model, path=None):
+    path = path or model_path()
+    tmp = '{}.{}'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(model, f, indent=1, sort_keys=True)
+    os.rename(tmp, path)
+
+
+class locked_model(object):
+    """Load the model for update; it is saved if the block succeeds."""
+
+    def __enter__(self):
+        self.lock = open(model_path() + '.lock', 'a')
+        fcntl.flock(self.lock, fcntl.LOCK_EX)
+        self.model = load_model()
+        return self.model
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                save_model(self.model)
+        finally:
+            self.lock.close()
+
+
+def record(name, suffix):
+    """Append a line to one of the model's side files."""
+    path = model_path() + suffix
+    with open(path, 'a') as f:
+        f.write(name + '\n')
+
+
+def parse_options(args, options, flags=()):
+    """Split args into a dict of options and a list of positionals.
+
+    :param options: names of options that take a value, eg. ('-r',)
+    :param flags: names of options that do not
+    """
+    opts = {}
+    positional = []
+    args = iter(args)
+    for arg in args:
+        name, sep, value = arg.partition('=')
+        if name in options:
+            opts[name] = value if sep else next(args, None)
+        elif arg in flags:
+            opts[arg] = True
+        elif arg.startswith('--') and arg not in flags and len(arg) > 2:
+            raise ToolError('unrecognized option: {}'.format(arg), 2)
+        else:
+            positional.append(arg)
+    return opts, positional
+
+
+def output(value, opts):
+    if opts.get('--format') == 'json':
+        print(json.dumps(value))
+    elif isinstance(value, dict):
+        for key in sorted(value):
+            print('{}: {}'.format(key, value[key]))
+    elif isinstance(value, list):
+        for item in value:
+            print(item)
+    elif value is not None:
+        print(value)
+
+
+def parse_settings(pairs):
+    settings = {}
+    for pair in pairs:
+        key, sep, value = pair.partition('=')
+        if not sep:
+            raise ToolError('expected "key=value", got "{}"'.format(pair), 2)
+        settings[key] = value
+    return settings
+
+
+def update_settings(data, settings):
+    """Apply settings to data; empty or null values unset the key."""
+    for key, value in settings.items():
+        if value is None or value == '':
+            data.pop(key, None)
+        else:
+            data[key] = value
+
+
+def _relation(model, rid):
+    rid = rid or os.environ.get('JUJU_RELATION_ID')
+    if not rid:
+        raise ToolError('no relation id specified', 2)
+    try:
+        return model['relations'][rid]
+    except KeyError:
+        raise ToolError('invalid value "{}" for option -r: '
+                        'relation not found'.format(rid), 2)
+
+
+def relation_get(args):
+    opts, positional = parse_options(args, ('--format', '-r',
+                                            '--relation'))
+    model = load_model()
+    relation = _relation(model, opts.get('-r') or opts.get('--relation'))
+    attribute = positional[0] if positional else '-'
+    unit = (positional[1] if len(positional) > 1
+            else os.environ.get('JUJU_REMOTE_UNIT'))
+    if unit == model['unit']:
+        data = relation.get('local', {})
+    elif unit in relation['units']:
+        data = relation['units'][unit]
+    else:
+        raise ToolError('cannot read settings for unit "{}": '
+                        'permission denied'.format(unit), 2)
+    output(data if attribute == '-' else data.get(attribute), opts)
+
+
+def relation_set(args):
+    if '--help' in args:
+        print(RELATION_SET_USAGE)
+        return
+    opts, positional = parse_options(args, ('--format', '-r', '--relation',
+                                            '--file'))
+    settings = {}
+    if opts.get('--file'):
+        import yaml
+        if opts['--file'] == '-':
+            settings.update(yaml.safe_load(sys.stdin) or {})
+        else:
+            with open(opts['--file']) as f:
+                settings.update(yaml.safe_load(f) or {})
+    settings.update(parse_settings(positional))
+    with locked_model() as model:
+        relation = _relation(model, opts.get('-r') or opts.get('--relation'))
+        update_settings(relation.setdefault('local', {}), settings)
+
+
+def relation_ids(args):
+    opts, positional = parse_options(args, ('--format',))
+    model = load_model()
+    name = positional[0] if positional else os.environ.get('JUJU_RELATION')
+    rids = [rid for rid, relation in model['relations'].items()
+            if relation['endpoint'] == name]
+    output(sorted(rids, key=lambda r: int(r.rsplit(':', 1)[-1])), opts)
+
+
+def relation_list(args):
+    opts, positional = parse_options(args, ('--format', '-r', '--relation'))
+    model = load_model()
+    relation = _relation(model, opts.get('-r') or opts.get('--relation'))
+    output(sorted(relation['units']), opts)
+
+
+def resource_get(args):
+    opts, positional = parse_options(args, ())
+    if not positional:
+        raise ToolError('missing resource name', 2)
+    path = load_model().get('resources', {}).get(positional[0])
+    if not path:
+        raise ToolError('resource "{}" not found'.format(positional[0]))
+    output(path, opts)
+
+
+def config_get(args):
+    opts, positional = parse_options(args, ('--format',), ('--all', '-a'))
+    config = load_model().get('config', {})
+    output(config.get(positional[0]) if positional else config, opts)
+
+
+def is_leader(args):
+    opts, positional = parse_options(args, ('--format',))
+    output(bool(load_model().get('leader')), opts)
+
+
+def leader_get(args):
+    opts, positional = parse_options(args, ('--format',))
+    settings = load_model().get('leader-settings', {})
+    key = positional[0] if positional else '-'
+    output(settings if key == '-' else settings.get(key), opts)
+
+
+def leader_set(args):
+    opts, positional = parse_options(args, ('--file',))
+    settings = parse_settings(positional)
+    with locked_model() as model:
+        if not model.get('leader'):
+            raise ToolError('cannot write leadership settings: '
+                            'cannot write settings: not the leader')
+        update_settings(model.setdefault('leader-settings', {}), settings)
+
+
+def status_get(args):
+    opts, positional = parse_options(args, ('--format',),
+                                     ('--include-data', '--application'))
+    status = load_model().get('status', {})
+    output({'status': status.get('status', 'unknown'),
+            'message': status.get('message', ''),
+            'status-data': {}}, opts)
+
+
+def status_set(args):
+    opts, positional = parse_options(args, (), ('--application',))
+    if not positional:
+        raise ToolError('invalid status', 2)
+    with locked_model() as model:
+        model['status'] = {
+            'status': positional[0],
+            'message': ' '.join(positional[1:]),
+        }
+
+
+def juju_log(args):
+    opts, positional = parse_options(args, ('-l', '--log-level'),
+                                     ('--debug',))
+    level = opts.get('-l') or opts.get('--log-level') or 'INFO'
+    record('{} {}'.format(level, ' '.join(positional)), '.log')
+
+
+def unit_get(args):
+    opts, positional = parse_options(args, ('--format',))
+    if not positional:
+        raise ToolError('no setting specified', 2)
+    output(load_model().get('addresses', {}).get(positional[0]), opts)
+
+
+def application_version_set(args):
+    opts, positional = parse_options(args, ())
+    with locked_model() as model:
+        model['application-version'] = ' '.join(positional)
+
+
+def system_stub(name, args):
+    if name == 'ceph' and args[:1] in (['-v'], ['--version']):
+        print(CEPH_VERSION)
+
+
+TOOLS = {
+    'application-version-set': application_version_set,
+    'config-get': config_get,
+    'is-leader': is_leader,
+    'juju-log': juju_log,
+    'leader-get': leader_get,
+    'leader-set': leader_set,
+    'related-units': relation_list,
+    'relation-get': relation_get,
+    'relation-ids': relation_ids,
+    'relation-list': relation_list,
+    'relation-set': relation_set,
+    'resource-get': resource_get,
+    'status-get': status_get,
+    'status-set': status_set,
+    'unit-get': unit_get,
+}
+
+
+def install(directory, python=None):
+    """Install every hook tool and system stub in directory.
+
+    :param python: interpreter to run the tools with; by default they are
+        links to this script and use its shebang.
+    """
+    script = os.path.abspath(__file__)
+    if script.endswith('.pyc'):
+        script = script[:-1]
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in HOOK_TOOLS + SYSTEM_STUBS:
+        path = os.path.join(directory, name)
+        if os.path.lexists(path):
+            os.remove(path)
+        if python:
+            with open(path, 'w') as f:
+                f.write(WRAPPER.format(env=TOOL_ENV, name=name,
+                                       python=python, script=script))
+            os.chmod(path, 0o755)
+        else:
+            os.symlink(script, path)
+
+
+def main(argv):
+    name = os.environ.pop(TOOL_ENV, None) or os.path.basename(argv[0])
+    if name not in TOOLS and name not in SYSTEM_STUBS:
+        if len(argv) in (3, 4) and argv[1] == 'install':
+            install(*argv[2:])
+            return 0
+        print(__doc__.split('\n\n')[1].strip(), file=sys.stderr)
+        return 2
+    try:
+        record(name, '.calls')
+        if name in TOOLS:
+            TOOLS[name](argv[1:])
+        else:
+            system_stub(name, argv[1:])
+    except ToolError as e:
+        print('ERROR {}'.format(e), file=sys.stderr)
+        return e.code
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -31,9 +31,23 @@ except ImportError:
         subprocess.check_call(['apt-get', 'install', '-y', 'python3-six'])
     import six  # flake8: noqa
 
-try:
-    import yaml  # flake8: noqa
-except ImportError:
+
+def _module_available(name):
+    """Whether a top-level module can be imported, without importing it."""
+    if sys.version_info.major == 2:
+        import imp
+        try:
+            imp.find_module(name)
+        except ImportError:
+            return False
+        return True
+    import importlib.util
+    return importlib.util.find_spec(name) is not None
+
+
+# NOTE: yaml is only checked for here; loading it is left to the modules
+#       that use it, as most hooks never do.
+if not _module_available('yaml'):
     if sys.version_info.major == 2:
         subprocess.check_call(['apt-get', 'install', '-y', 'python-yaml'])
     else:
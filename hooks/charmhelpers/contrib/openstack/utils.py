@@ -76,12 +76,15 @@ from charmhelpers.core.host import (
     restart_on_change_helper,
 )
 from charmhelpers.fetch import (
-    apt_cache,
     import_key as fetch_import_key,
     add_source as fetch_add_source,
     SourceConfigError,
     GPGKeyError,
-    get_upstream_version
+    get_upstream_version,
+    dpkg_status_stamp,
+    dpkg_status_index,
+    upstream_version,
+    DPKG_UNINSTALLED,
 )
 
 from charmhelpers.fetch.snap import (
@@ -276,6 +279,10 @@ PACKAGE_CODENAMES = {
 
 DEFAULT_LOOPBACK_SIZE = '5G'
 
+# unitdata key holding the application version last set, with the package
+# and dpkg status it was determined from.
+APPLICATION_VERSION_KEY = 'os-application-version'
+
 
 class CompareOpenStackReleases(BasicStringComparator):
     """Provide comparisons of OpenStack releases.
@@ -403,29 +410,25 @@ def get_os_codename_package(package, fatal=True):
                 # Second item in list is Version
                 return line.split()[1]
 
-    import apt_pkg as apt
-
-    cache = apt_cache()
-
     try:
-        pkg = cache[package]
-    except Exception:
+        state, version = dpkg_status_index()[package]
+    except KeyError:
         if not fatal:
             return None
-        # the package is unknown to the current apt cache.
+        # the package is unknown to dpkg.
         e = 'Could not determine version of package with no installation '\
             'candidate: %s' % package
         error_out(e)
 
-    if not pkg.current_ver:
+    if state in DPKG_UNINSTALLED:
         if not fatal:
             return None
         # package is known, but no version is currently installed.
         e = 'Could not determine version of uninstalled package: %s' % package
         error_out(e)
 
-    vers = apt.upstream_version(pkg.current_ver.ver_str)
-    if 'swift' in pkg.name:
+    vers = upstream_version(version)
+    if 'swift' in package:
         # Fully x.y.z match for swift versions
         match = re.match('^(\d+)\.(\d+)\.(\d+)', vers)
     else:
@@ -446,7 +449,7 @@ def get_os_codename_package(package, fatal=True):
     else:
         # < Liberty co-ordinated project versions
         try:
-            if 'swift' in pkg.name:
+            if 'swift' in package:
                 return get_swift_codename(vers)
             else:
                 return OPENSTACK_CODENAMES[vers]
@@ -1570,14 +1573,37 @@ def config_flags_parser(config_flags):
 
 
 def os_application_version_set(package):
-    '''Set version of application for Juju 2.0 and later'''
+    '''Set version of application for Juju 2.0 and later
+
+    The version is cached in unitdata against the dpkg status file and
+    application-version-set is only run when it changes.
+    '''
+    db = unitdata.kv()
+    cached = db.get(APPLICATION_VERSION_KEY) or {}
+    stamp = dpkg_status_stamp()
+    if (stamp and cached.get('package') == package and
+            cached.get('dpkg-status') == list(stamp)):
+        return
+
     application_version = get_upstream_version(package)
     # NOTE(jamespage) if not able to figure out package version, fallback to
     #                 openstack codename version detection.
     if not application_version:
+        # The codename depends on charm config as well as packages; don't
+        # cache it.
+        db.unset(APPLICATION_VERSION_KEY)
         application_version_set(os_release(package))
     else:
-        application_version_set(application_version)
+        if ((cached.get('package'), cached.get('version')) !=
+                (package, application_version)):
+            application_version_set(application_version)
+        if stamp:
+            db.set(APPLICATION_VERSION_KEY, {
+                'package': package,
+                'dpkg-status': list(stamp),
+                'version': application_version,
+            })
+    db.flush()
 
 
 def enable_memcache(source=None, release=None, package=None):
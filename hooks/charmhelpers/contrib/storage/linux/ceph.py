@@ -28,17 +28,20 @@ import math
 import six
 
 import os
+import re
 import shutil
 import json
 import time
 import uuid
 
+from collections import namedtuple
 from subprocess import (
     check_call,
     check_output,
     CalledProcessError,
 )
 from charmhelpers.core.hookenv import (
+    atexit,
     config,
     service_name,
     local_unit,
@@ -62,12 +65,18 @@ from charmhelpers.core.host import (
 )
 from charmhelpers.fetch import (
     apt_install,
+    installed_version,
 )
 from charmhelpers.core.unitdata import kv
+from charmhelpers.contrib.storage.linux.ceph_client import ceph_client
 
 from charmhelpers.core.kernel import modprobe
 from charmhelpers.contrib.openstack.utils import config_flags_parser
 
+CEPH_BIN = '/usr/bin/ceph'
+# unitdata key of the version ceph_version() last read from the ceph CLI.
+CEPH_VERSION_KEY = 'ceph-version'
+
 KEYRING = '/etc/ceph/ceph.client.{}.keyring'
 KEYFILE = '/etc/ceph/ceph.client.{}.key'
 
@@ -91,6 +100,46 @@ DEFAULT_POOL_WEIGHT = 10.0
 LEGACY_PG_COUNT = 200
 DEFAULT_MINIMUM_PGS = 2
 
+# ceph_version() result, with the binary and package version it reflects.
+_ceph_version = {}
+
+# Monitor config-key values this process has read or written, by key.
+# Missing keys are never cached: other units may create them at any time.
+_monitor_keys = {}
+
+# unitdata key prefix for cached cluster queries, see cluster_query().
+CLUSTER_QUERY_KEY = 'ceph-query.'
+# max_age of the queries pool creation repeats, which can live with a
+# slightly stale answer; results are only reused when a caller passes one.
+CLUSTER_QUERY_TTL = {
+    'mon_status': 300,
+    'osd erasure-code-profile get': 600,
+    'osd ls': 300,
+    'osd pool get': 60,
+}
+
+# Pool types as numbered in 'osd dump' and 'osd pool ls detail'.
+POOL_TYPES = {1: 'replicated', 3: 'erasure'}
+
+_JSON_WHITESPACE = re.compile(r'\s*')
+
+
+def confirmation_arg(flag, version=None):
+    """Return the argument confirming a dangerous monitor command.
+
+    Before Nautilus the monitor took the flag as the CephChoices argument
+    'sure'; Nautilus declares it as a CephBool named after the flag.
+
+    :param flag: str: the CLI flag, eg. '--yes-i-really-mean-it'
+    :param version: CephVersion: the ceph release, ceph_version() if None
+    :returns: (name, value) tuple for CephClient.mon_command()
+    """
+    if version is None:
+        version = ceph_version()
+    if version and version >= '14.0.0':
+        return (flag.lstrip('-').replace('-', '_'), True)
+    return ('sure', flag)
+
 
 def validator(value, valid_type, valid_range=None):
     """
@@ -165,10 +214,11 @@ class Pool(object):
         validator(value=cache_pool, valid_type=six.string_types)
         validator(value=mode, valid_type=six.string_types, valid_range=["readonly", "writeback"])
 
-        check_call(['ceph', '--id', self.service, 'osd', 'tier', 'add', self.name, cache_pool])
-        check_call(['ceph', '--id', self.service, 'osd', 'tier', 'cache-mode', cache_pool, mode])
-        check_call(['ceph', '--id', self.service, 'osd', 'tier', 'set-overlay', self.name, cache_pool])
-        check_call(['ceph', '--id', self.service, 'osd', 'pool', 'set', cache_pool, 'hit_set_type', 'bloom'])
+        with ceph_client(self.service).batch() as batch:
+            batch.mon_command('osd tier add', [('pool', self.name), ('tierpool', cache_pool)])
+            batch.mon_command('osd tier cache-mode', [('pool', cache_pool), ('mode', mode)])
+            batch.mon_command('osd tier set-overlay', [('pool', self.name), ('overlaypool', cache_pool)])
+            batch.mon_command('osd pool set', [('pool', cache_pool), ('var', 'hit_set_type'), ('val', 'bloom')])
 
     def remove_cache_tier(self, cache_pool):
         """
@@ -179,22 +229,24 @@ class Pool(object):
         # read-only is easy, writeback is much harder
         mode = get_cache_mode(self.service, cache_pool)
         version = ceph_version()
+        batch = ceph_client(self.service).batch()
         if mode == 'readonly':
-            check_call(['ceph', '--id', self.service, 'osd', 'tier', 'cache-mode', cache_pool, 'none'])
-            check_call(['ceph', '--id', self.service, 'osd', 'tier', 'remove', self.name, cache_pool])
+            batch.mon_command('osd tier cache-mode', [('pool', cache_pool), ('mode', 'none')])
+            batch.mon_command('osd tier remove', [('pool', self.name), ('tierpool', cache_pool)])
 
         elif mode == 'writeback':
-            pool_forward_cmd = ['ceph', '--id', self.service, 'osd', 'tier',
-                                'cache-mode', cache_pool, 'forward']
+            pool_forward_args = [('pool', cache_pool), ('mode', 'forward')]
             if version >= '10.1':
                 # Jewel added a mandatory flag
-                pool_forward_cmd.append('--yes-i-really-mean-it')
+                pool_forward_args.append(
+                    confirmation_arg('--yes-i-really-mean-it', version))
 
-            check_call(pool_forward_cmd)
+            batch.mon_command('osd tier cache-mode', pool_forward_args)
             # Flush the cache and wait for it to return
-            check_call(['rados', '--id', self.service, '-p', cache_pool, 'cache-flush-evict-all'])
-            check_call(['ceph', '--id', self.service, 'osd', 'tier', 'remove-overlay', self.name])
-            check_call(['ceph', '--id', self.service, 'osd', 'tier', 'remove', self.name, cache_pool])
+            batch.rados(['-p', cache_pool, 'cache-flush-evict-all'])
+            batch.mon_command('osd tier remove-overlay', [('pool', self.name)])
+            batch.mon_command('osd tier remove', [('pool', self.name), ('tierpool', cache_pool)])
+        batch.run()
 
     def get_pgs(self, pool_size, percent_data=DEFAULT_POOL_WEIGHT):
         """Return the number of placement groups to use when creating the pool.
@@ -243,7 +295,8 @@ class Pool(object):
 
         # If the expected-osd-count is specified, then use the max between
         # the expected-osd-count and the actual osd_count
-        osd_list = get_osds(self.service)
+        osd_list = get_osds(self.service,
+                            max_age=CLUSTER_QUERY_TTL['osd ls'])
         expected = config('expected-osd-count') or 0
 
         if osd_list:
@@ -307,16 +360,19 @@ class ReplicatedPool(Pool):
             self.app_name = 'unknown'
 
     def create(self):
-        if not pool_exists(self.service, self.name):
+        if not pool_exists(self.service, self.name,
+                           max_age=CLUSTER_QUERY_TTL['osd pool get']):
             # Create it
-            cmd = ['ceph', '--id', self.service, 'osd', 'pool', 'create',
-                   self.name, str(self.pg_num)]
             try:
-                check_call(cmd)
-                # Set the pool replica size
-                update_pool(client=self.service,
-                            pool=self.name,
-                            settings={'size': str(self.replicas)})
+                with ceph_client(self.service).batch() as batch:
+                    batch.mon_command('osd pool create',
+                                      [('pool', self.name),
+                                       ('pg_num', self.pg_num)])
+                    # Set the pool replica size
+                    update_pool(client=self.service,
+                                pool=self.name,
+                                settings={'size': str(self.replicas)},
+                                batch=batch)
                 try:
                     set_app_name_for_pool(client=self.service,
                                           pool=self.name,
@@ -325,6 +381,8 @@ class ReplicatedPool(Pool):
                     log('Could not set app name for pool {}'.format(self.name, level=WARNING))
             except CalledProcessError:
                 raise
+            finally:
+                invalidate_cluster_queries('osd pool get')
 
 
 # Default jerasure erasure coded pool
@@ -340,12 +398,14 @@ class ErasurePool(Pool):
             self.app_name = 'unknown'
 
     def create(self):
-        if not pool_exists(self.service, self.name):
+        if not pool_exists(self.service, self.name,
+                           max_age=CLUSTER_QUERY_TTL['osd pool get']):
             # Try to find the erasure profile information in order to properly
             # size the number of placement groups. The size of an erasure
             # coded placement group is calculated as k+m.
-            erasure_profile = get_erasure_profile(self.service,
-                                                  self.erasure_code_profile)
+            erasure_profile = get_erasure_profile(
+                self.service, self.erasure_code_profile,
+                max_age=CLUSTER_QUERY_TTL['osd erasure-code-profile get'])
 
             # Check for errors
             if erasure_profile is None:
@@ -364,11 +424,12 @@ class ErasurePool(Pool):
             m = int(erasure_profile['m'])
             pgs = self.get_pgs(k + m, self.percent_data)
             # Create it
-            cmd = ['ceph', '--id', self.service, 'osd', 'pool', 'create',
-                   self.name, str(pgs), str(pgs),
-                   'erasure', self.erasure_code_profile]
             try:
-                check_call(cmd)
+                ceph_client(self.service).mon_command(
+                    'osd pool create',
+                    [('pool', self.name), ('pg_num', pgs), ('pgp_num', pgs),
+                     ('pool_type', 'erasure'),
+                     ('erasure_code_profile', self.erasure_code_profile)])
                 try:
                     set_app_name_for_pool(client=self.service,
                                           pool=self.name,
@@ -377,23 +438,76 @@ class ErasurePool(Pool):
                     log('Could not set app name for pool {}'.format(self.name, level=WARNING))
             except CalledProcessError:
                 raise
+            finally:
+                invalidate_cluster_queries('osd pool get')
 
     """Get an existing erasure code profile if it already exists.
        Returns json formatted output"""
 
 
-def get_mon_map(service):
+def cluster_query(service, query, run, max_age=None):
+    """Return the result of a cluster query, reusing a recent one if the
+    caller allows it.
+
+    With a max_age, results are kept in unitdata, saved when the hook
+    completes, so they are shared by later hooks, separately for each
+    cephx user. Failures and empty results (eg. False for a missing pool)
+    are not kept. Helpers that change what a query reports call
+    invalidate_cluster_queries().
+
+    :param service: str: the cephx user the query runs as
+    :param query: str: the query, eg. 'osd ls'; arguments may follow the
+        command, eg. 'osd erasure-code-profile get default'
+    :param run: callable returning the query's result; it must be JSON
+        serialisable
+    :param max_age: int: oldest result, in seconds, the caller accepts, eg.
+        from CLUSTER_QUERY_TTL; None or 0 always asks the cluster
+    """
+    if not max_age:
+        return run()
+    key = '{}{}@{}'.format(CLUSTER_QUERY_KEY, query, service)
+    db = kv()
+    cached = db.get(key)
+    if cached and 0 <= time.time() - cached['time'] < max_age:
+        return cached['value']
+    value = run()
+    if value:
+        db.set(key, {'time': time.time(), 'value': value})
+        atexit(db.flush)
+    return value
+
+
+def invalidate_cluster_queries(*queries):
+    """Forget cached results of queries, and of their variants with
+    arguments, eg. 'osd erasure-code-profile get' forgets every profile,
+    for every cephx user.
+
+    Nothing is written if none of them were cached; otherwise the change
+    is saved with the hook's other unitdata when it completes.
+    """
+    db = kv()
+    for query in queries:
+        prefix = CLUSTER_QUERY_KEY + query
+        if db.getrange(prefix):
+            db.unsetrange(prefix=prefix)
+            atexit(db.flush)
+
+
+def get_mon_map(service, max_age=None):
     """
     Returns the current monitor map.
     :param service: six.string_types. The Ceph user name to run the command under
+    :param max_age: int. Oldest cached map, in seconds, to accept; see
+      cluster_query()
     :return: json string. :raise: ValueError if the monmap fails to parse.
       Also raises CalledProcessError if our ceph command fails
     """
     try:
-        mon_status = check_output(['ceph', '--id', service,
-                                   'mon_status', '--format=json'])
-        if six.PY3:
-            mon_status = mon_status.decode('UTF-8')
+        mon_status = cluster_query(
+            service, 'mon_status',
+            lambda: ceph_client(service).mon_command('mon_status',
+                                                     format='json'),
+            max_age)
         try:
             return json.loads(mon_status)
         except ValueError as v:
@@ -440,14 +554,30 @@ def monitor_key_delete(service, key):
     Deletes a key value pair on the monitor cluster.
     :param key: six.string_types.  The key to delete.
     """
+    monitor_keys_delete(service, [key])
+
+
+def monitor_keys_delete(service, keys):
+    """
+    Delete several keys from the monitor cluster, over one session.
+    :param service: six.string_types. The Ceph user name to run the command under
+    :param keys: list of six.string_types.  The keys to delete.
+    :raise: CephBatchError (a CalledProcessError) naming the first key that
+     could not be deleted; the keys before it were deleted
+    """
+    keys = [str(key) for key in keys]
+    batch = ceph_client(service).batch()
+    for key in keys:
+        batch.mon_command('config-key del', [('key', key)])
     try:
-        check_output(
-            ['ceph', '--id', service,
-             'config-key', 'del', str(key)])
+        batch.run()
     except CalledProcessError as e:
-        log("Monitor config-key put failed with message: {}".format(
+        log("Monitor config-key del failed with message: {}".format(
             e.output))
         raise
+    finally:
+        for key in keys:
+            _monitor_keys.pop(key, None)
 
 
 def monitor_key_set(service, key, value):
@@ -458,52 +588,115 @@ def monitor_key_set(service, key, value):
     :param value: The value to set.  This will be converted to a string
         before setting
     """
+    monitor_keys_set(service, {key: value})
+
+
+def monitor_keys_set(service, values):
+    """
+    Sets several key value pairs on the monitor cluster, over one session.
+    :param service: six.string_types. The Ceph user name to run the command under
+    :param values: dict of keys to values.  Values are converted to strings
+        before setting
+    :raise: CephBatchError (a CalledProcessError) naming the first key that
+     could not be set; the keys before it were set
+    """
+    values = dict((str(key), str(value))
+                  for key, value in six.iteritems(values))
+    batch = ceph_client(service).batch()
+    for key, value in six.iteritems(values):
+        batch.mon_command('config-key put', [('key', key), ('val', value)])
     try:
-        check_output(
-            ['ceph', '--id', service,
-             'config-key', 'put', str(key), str(value)])
+        batch.run()
     except CalledProcessError as e:
         log("Monitor config-key put failed with message: {}".format(
             e.output))
+        for key in values:
+            _monitor_keys.pop(key, None)
         raise
+    _monitor_keys.update(values)
 
 
-def monitor_key_get(service, key):
+def monitor_key_get(service, key, fresh=False):
     """
     Gets the value of an existing key in the monitor cluster.
+
+    Values read or written earlier in the process are reused unless fresh
+    is set; a key another unit changed since then is not noticed, so
+    callers waiting for another unit to change a key must pass fresh=True.
     :param service: six.string_types. The Ceph user name to run the command under
     :param key: six.string_types.  The key to search for.
+    :param fresh: bool.  Always ask the monitors.
     :return: Returns the value of that key or None if not found.
     """
+    key = str(key)
+    if not fresh and key in _monitor_keys:
+        return _monitor_keys[key]
     try:
-        output = check_output(
-            ['ceph', '--id', service,
-             'config-key', 'get', str(key)]).decode('UTF-8')
-        return output
+        output = ceph_client(service).mon_command('config-key get',
+                                                  [('key', key)])
     except CalledProcessError as e:
         log("Monitor config-key get failed with message: {}".format(
             e.output))
+        if e.returncode == errno.ENOENT:
+            _monitor_keys.pop(key, None)
         return None
+    _monitor_keys[key] = output
+    return output
 
 
-def monitor_key_exists(service, key):
+def monitor_keys_get_prefix(service, prefix):
+    """
+    Gets every key in the monitor cluster that starts with prefix, with one
+    'config-key dump'.
+    :param service: six.string_types. The Ceph user name to run the command under
+    :param prefix: six.string_types.  The prefix of the keys to return.
+    :return: dict of keys to values. :raise: CalledProcessError if the dump
+     fails
+    """
+    prefix = str(prefix)
+    client = ceph_client(service)
+    try:
+        output = client.mon_command('config-key dump', [('key', prefix)])
+    except CalledProcessError as e:
+        # Older monitors dump every key and take no prefix
+        if e.returncode != errno.EINVAL:
+            raise
+        output = client.mon_command('config-key dump')
+    values = dict((key, value)
+                  for key, value in six.iteritems(json.loads(output or '{}'))
+                  if key.startswith(prefix))
+    for key in list(_monitor_keys):
+        if key.startswith(prefix) and key not in values:
+            del _monitor_keys[key]
+    _monitor_keys.update(values)
+    return values
+
+
+def monitor_key_exists(service, key, fresh=False):
     """
     Searches for the existence of a key in the monitor cluster.
+
+    A key read or written earlier in the process is known to exist unless
+    fresh is set; a missing key is always looked up.
     :param service: six.string_types. The Ceph user name to run the command under
     :param key: six.string_types.  The key to search for
+    :param fresh: bool.  Always ask the monitors.
     :return: Returns True if the key exists, False if not and raises an
      exception if an unknown error occurs. :raise: CalledProcessError if
      an unknown error occurs
     """
+    key = str(key)
+    if not fresh and key in _monitor_keys:
+        return True
     try:
-        check_call(
-            ['ceph', '--id', service,
-             'config-key', 'exists', str(key)])
+        ceph_client(service).mon_command('config-key exists',
+                                         [('key', key)])
         # I can return true here regardless because Ceph returns
         # ENOENT if the key wasn't found
         return True
     except CalledProcessError as e:
         if e.returncode == errno.ENOENT:
+            _monitor_keys.pop(key, None)
             return False
         else:
             log("Unknown error from ceph config-get exists: {} {}".format(
@@ -511,18 +704,21 @@ def monitor_key_exists(service, key):
             raise
 
 
-def get_erasure_profile(service, name):
+def get_erasure_profile(service, name, max_age=None):
     """
     :param service: six.string_types. The Ceph user name to run the command under
     :param name:
+    :param max_age: int. Oldest cached profile, in seconds, to accept; see
+      cluster_query()
     :return:
     """
     try:
-        out = check_output(['ceph', '--id', service,
-                            'osd', 'erasure-code-profile', 'get',
-                            name, '--format=json'])
-        if six.PY3:
-            out = out.decode('UTF-8')
+        out = cluster_query(
+            service, 'osd erasure-code-profile get {}'.format(name),
+            lambda: ceph_client(service).mon_command(
+                'osd erasure-code-profile get', [('name', name)],
+                format='json'),
+            max_age)
         return json.loads(out)
     except (CalledProcessError, OSError, ValueError):
         return None
@@ -537,10 +733,10 @@ def pool_set(service, pool_name, key, value):
     :param value:
     :return: None.  Can raise CalledProcessError
     """
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'set', pool_name, key,
-           str(value).lower()]
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command(
+            'osd pool set', [('pool', pool_name), ('var', key),
+                             ('val', str(value).lower())])
     except CalledProcessError:
         raise
 
@@ -553,9 +749,9 @@ def snapshot_pool(service, pool_name, snapshot_name):
     :param snapshot_name: six.string_types
     :return: None.  Can raise CalledProcessError
     """
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'mksnap', pool_name, snapshot_name]
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command(
+            'osd pool mksnap', [('pool', pool_name), ('snap', snapshot_name)])
     except CalledProcessError:
         raise
 
@@ -568,9 +764,9 @@ def remove_pool_snapshot(service, pool_name, snapshot_name):
     :param snapshot_name: six.string_types
     :return: None.  Can raise CalledProcessError
     """
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'rmsnap', pool_name, snapshot_name]
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command(
+            'osd pool rmsnap', [('pool', pool_name), ('snap', snapshot_name)])
     except CalledProcessError:
         raise
 
@@ -584,10 +780,10 @@ def set_pool_quota(service, pool_name, max_bytes):
     :return: None.  Can raise CalledProcessError
     """
     # Set a byte quota on a RADOS pool in ceph.
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'set-quota', pool_name,
-           'max_bytes', str(max_bytes)]
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command(
+            'osd pool set-quota', [('pool', pool_name), ('field', 'max_bytes'),
+                                   ('val', str(max_bytes))])
     except CalledProcessError:
         raise
 
@@ -599,9 +795,10 @@ def remove_pool_quota(service, pool_name):
     :param pool_name: six.string_types
     :return: None.  Can raise CalledProcessError
     """
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'set-quota', pool_name, 'max_bytes', '0']
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command(
+            'osd pool set-quota', [('pool', pool_name), ('field', 'max_bytes'),
+                                   ('val', '0')])
     except CalledProcessError:
         raise
 
@@ -615,12 +812,14 @@ def remove_erasure_profile(service, profile_name):
     :param profile_name: six.string_types
     :return: None.  Can raise CalledProcessError
     """
-    cmd = ['ceph', '--id', service, 'osd', 'erasure-code-profile', 'rm',
-           profile_name]
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command('osd erasure-code-profile rm',
+                                         [('name', profile_name)])
     except CalledProcessError:
         raise
+    finally:
+        invalidate_cluster_queries(
+            'osd erasure-code-profile get {}'.format(profile_name))
 
 
 def create_erasure_profile(service, profile_name, erasure_plugin_name='jerasure',
@@ -648,33 +847,40 @@ def create_erasure_profile(service, profile_name, erasure_plugin_name='jerasure'
     validator(failure_domain, six.string_types,
               ['chassis', 'datacenter', 'host', 'osd', 'pdu', 'pod', 'rack', 'region', 'room', 'root', 'row'])
 
-    cmd = ['ceph', '--id', service, 'osd', 'erasure-code-profile', 'set', profile_name,
-           'plugin=' + erasure_plugin_name, 'k=' + str(data_chunks), 'm=' + str(coding_chunks)
-           ]
+    profile = ['plugin=' + erasure_plugin_name, 'k=' + str(data_chunks), 'm=' + str(coding_chunks)]
     if locality is not None and durability_estimator is not None:
         raise ValueError("create_erasure_profile should be called with k, m and one of l or c but not both.")
 
     # failure_domain changed in luminous
     if version and version >= '12.0.0':
-        cmd.append('crush-failure-domain=' + failure_domain)
+        profile.append('crush-failure-domain=' + failure_domain)
     else:
-        cmd.append('ruleset-failure-domain=' + failure_domain)
+        profile.append('ruleset-failure-domain=' + failure_domain)
 
     # Add plugin specific information
     if locality is not None:
         # For local erasure codes
-        cmd.append('l=' + str(locality))
+        profile.append('l=' + str(locality))
     if durability_estimator is not None:
         # For Shec erasure codes
-        cmd.append('c=' + str(durability_estimator))
+        profile.append('c=' + str(durability_estimator))
 
+    args = [('name', profile_name), ('profile', profile)]
     if erasure_profile_exists(service, profile_name):
-        cmd.append('--force')
+        # Nautilus declares force a CephBool; before, it was the choice
+        # '--force'.
+        if version and version >= '14.0.0':
+            args.append(('force', True))
+        else:
+            args.append(('force', '--force'))
 
     try:
-        check_call(cmd)
+        ceph_client(service).mon_command('osd erasure-code-profile set', args)
     except CalledProcessError:
         raise
+    finally:
+        invalidate_cluster_queries(
+            'osd erasure-code-profile get {}'.format(profile_name))
 
 
 def rename_pool(service, old_name, new_name):
@@ -688,8 +894,11 @@ def rename_pool(service, old_name, new_name):
     validator(value=old_name, valid_type=six.string_types)
     validator(value=new_name, valid_type=six.string_types)
 
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'rename', old_name, new_name]
-    check_call(cmd)
+    try:
+        ceph_client(service).mon_command(
+            'osd pool rename', [('srcpool', old_name), ('destpool', new_name)])
+    finally:
+        invalidate_cluster_queries('osd pool get')
 
 
 def erasure_profile_exists(service, name):
@@ -701,61 +910,172 @@ def erasure_profile_exists(service, name):
     """
     validator(value=name, valid_type=six.string_types)
     try:
-        check_call(['ceph', '--id', service,
-                    'osd', 'erasure-code-profile', 'get',
-                    name])
+        ceph_client(service).mon_command('osd erasure-code-profile get',
+                                         [('name', name)])
         return True
     except CalledProcessError:
         return False
 
 
+class PoolInfo(namedtuple('PoolInfo', [
+        'name', 'id', 'type', 'size', 'min_size', 'pg_num', 'cache_mode',
+        'tier_of', 'erasure_code_profile', 'applications',
+        'quota_max_bytes'])):
+    """A pool, as described by 'osd pool ls detail' or 'osd dump'.
+
+    type is 'replicated' or 'erasure', tier_of is the id of the pool this
+    one is a cache tier of (-1 if none) and applications is a sorted list
+    of the applications enabled on the pool.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_json(cls, pool):
+        """Build a PoolInfo from a pool's entry in 'osd dump' output."""
+        return cls(name=pool['pool_name'],
+                   id=pool.get('pool'),
+                   type=POOL_TYPES.get(pool.get('type'), pool.get('type')),
+                   size=pool.get('size'),
+                   min_size=pool.get('min_size'),
+                   pg_num=pool.get('pg_num'),
+                   cache_mode=pool.get('cache_mode', 'none'),
+                   tier_of=pool.get('tier_of', -1),
+                   erasure_code_profile=(
+                       pool.get('erasure_code_profile') or None),
+                   applications=sorted(pool.get('application_metadata', {})),
+                   quota_max_bytes=pool.get('quota_max_bytes', 0))
+
+
+def _skip_json(document, idx, expected=None):
+    """Return the index of the next token in document from idx, after
+    checking the character at idx is expected and stepping past it."""
+    if expected is not None:
+        if not document.startswith(expected, idx):
+            raise ValueError('Expecting {!r}: char {}'.format(expected, idx))
+        idx += 1
+    return _JSON_WHITESPACE.match(document, idx).end()
+
+
+def iter_json_array(document, key=None):
+    """Decode the items of a JSON array one at a time.
+
+    Only the items consumed are decoded, so a caller looking for one item
+    stops paying for the document once it has found it.
+
+    :param document: str: JSON text
+    :param key: str: if given, document is an object and the array is its
+        member named key; members after it are never decoded and those
+        before it are skipped over
+    :raises: ValueError if document is not valid JSON of the expected
+        shape, or has no member named key
+    """
+    decoder = json.JSONDecoder()
+    idx = _skip_json(document, 0)
+    if key is not None:
+        idx = _skip_json(document, idx, '{')
+        while True:
+            if document.startswith('}', idx):
+                raise ValueError('No member named {!r}'.format(key))
+            name, idx = decoder.raw_decode(document, idx)
+            idx = _skip_json(document, _skip_json(document, idx), ':')
+            if name == key:
+                break
+            _, idx = decoder.raw_decode(document, idx)
+            idx = _skip_json(document, idx)
+            if not document.startswith('}', idx):
+                idx = _skip_json(document, idx, ',')
+    idx = _skip_json(document, idx, '[')
+    if document.startswith(']', idx):
+        return
+    while True:
+        item, idx = decoder.raw_decode(document, idx)
+        yield item
+        idx = _skip_json(document, idx)
+        if document.startswith(']', idx):
+            return
+        idx = _skip_json(document, idx, ',')
+
+
+def get_pool_info(service, name):
+    """Describe one RADOS pool.
+
+    Reads 'osd pool ls detail', or the pools in 'osd dump' on releases
+    without it, only as far as the pool.
+
+    :param service: six.string_types. The Ceph user name to run the command under
+    :param name: six.string_types. The pool to describe
+    :return: PoolInfo or None if there is no such pool.  Can raise
+      CalledProcessError
+    """
+    validator(value=service, valid_type=six.string_types)
+    validator(value=name, valid_type=six.string_types)
+    client = ceph_client(service)
+    try:
+        pools = iter_json_array(client.mon_command(
+            'osd pool ls', [('detail', 'detail')], format='json'))
+    except CalledProcessError as e:
+        # Older monitors reject the command as invalid
+        if e.returncode != errno.EINVAL:
+            raise
+        pools = iter_json_array(client.mon_command('osd dump', format='json'),
+                                key='pools')
+    for pool in pools:
+        if pool['pool_name'] == name:
+            return PoolInfo.from_json(pool)
+    return None
+
+
 def get_cache_mode(service, pool_name):
     """
     Find the current caching mode of the pool_name given.
     :param service: six.string_types. The Ceph user name to run the command under
     :param pool_name: six.string_types
-    :return: int or None
+    :return: six.string_types or None
     """
-    validator(value=service, valid_type=six.string_types)
-    validator(value=pool_name, valid_type=six.string_types)
-    out = check_output(['ceph', '--id', service,
-                        'osd', 'dump', '--format=json'])
-    if six.PY3:
-        out = out.decode('UTF-8')
-    try:
-        osd_json = json.loads(out)
-        for pool in osd_json['pools']:
-            if pool['pool_name'] == pool_name:
-                return pool['cache_mode']
+    info = get_pool_info(service, pool_name)
+    if info is None:
         return None
-    except ValueError:
-        raise
+    return info.cache_mode
+
 
+def pool_exists(service, name, max_age=None):
+    """Check to see if a RADOS pool already exists.
+
+    :param max_age: int. Oldest cached answer, in seconds, to accept; see
+      cluster_query(). Only a pool found to exist is cached.
+    """
+    def run():
+        try:
+            ceph_client(service).mon_command(
+                'osd pool get', [('pool', name), ('var', 'size')],
+                format='json')
+        except CalledProcessError as e:
+            if e.returncode == errno.ENOENT:
+                return False
+            raise
+        return True
 
-def pool_exists(service, name):
-    """Check to see if a RADOS pool already exists."""
     try:
-        out = check_output(['rados', '--id', service, 'lspools'])
-        if six.PY3:
-            out = out.decode('UTF-8')
+        return cluster_query(service, 'osd pool get {} size'.format(name),
+                             run, max_age)
     except CalledProcessError:
         return False
 
-    return name in out.split()
 
-
-def get_osds(service):
+def get_osds(service, max_age=None):
     """Return a list of all Ceph Object Storage Daemons currently in the
     cluster.
+
+    :param max_age: int. Oldest cached list, in seconds, to accept; see
+      cluster_query()
     """
     version = ceph_version()
     if version and version >= '0.56':
-        out = check_output(['ceph', '--id', service,
-                            'osd', 'ls',
-                            '--format=json'])
-        if six.PY3:
-            out = out.decode('UTF-8')
-        return json.loads(out)
+        return cluster_query(
+            service, 'osd ls',
+            lambda: json.loads(ceph_client(service).mon_command(
+                'osd ls', format='json')),
+            max_age)
 
     return None
 
@@ -771,31 +1091,66 @@ def install():
 
 def rbd_exists(service, pool, rbd_img):
     """Check to see if a RADOS block device exists."""
-    try:
-        out = check_output(['rbd', 'list', '--id',
-                            service, '--pool', pool])
-        if six.PY3:
-            out = out.decode('UTF-8')
-    except CalledProcessError:
-        return False
+    return ceph_client(service).image_exists(pool, rbd_img)
+
 
-    return rbd_img in out
+def rbd_images_exist(service, pool, names):
+    """Check which of several RADOS block devices exist.
+
+    The pool is listed once, stopping as soon as every name has been seen.
+
+    :param service: six.string_types. The Ceph user name to run the command under
+    :param pool: six.string_types
+    :param names: iterable of image names
+    :return: dict of each name to whether the image exists
+    """
+    wanted = set(names)
+    found = set()
+    if wanted:
+        images = ceph_client(service).list_images(pool)
+        try:
+            for image in images:
+                if image in wanted:
+                    found.add(image)
+                    if found == wanted:
+                        break
+        except CalledProcessError:
+            pass
+        finally:
+            images.close()
+    return dict((name, name in found) for name in wanted)
 
 
 def create_rbd_image(service, pool, image, sizemb):
     """Create a new RADOS block device."""
-    cmd = ['rbd', 'create', image, '--size', str(sizemb), '--id', service,
-           '--pool', pool]
-    check_call(cmd)
+    ceph_client(service).rbd(['create', image, '--size', str(sizemb),
+                              '--pool', pool])
 
 
-def update_pool(client, pool, settings):
-    cmd = ['ceph', '--id', client, 'osd', 'pool', 'set', pool]
-    for k, v in six.iteritems(settings):
-        cmd.append(k)
-        cmd.append(v)
+def update_pool(client, pool, settings, batch=None):
+    """Apply settings to a pool, with one 'osd pool set' per setting.
 
-    check_call(cmd)
+    :param client: Name of the ceph client to use
+    :type client: str
+    :param pool: Pool to update
+    :type pool: str
+    :param settings: setting names and values, eg. {'size': '3'}
+    :type settings: dict
+    :param batch: batch to queue the commands on; if not given they are run
+        straight away, in a batch of their own
+    :type batch: CommandBatch
+
+    :raises: CephBatchError (a CalledProcessError) naming the setting that
+        could not be applied
+    """
+    own_batch = batch is None
+    if own_batch:
+        batch = ceph_client(client).batch()
+    for k, v in six.iteritems(settings):
+        batch.mon_command('osd pool set',
+                          [('pool', pool), ('var', k), ('val', v)])
+    if own_batch:
+        batch.run()
 
 
 def set_app_name_for_pool(client, pool, name):
@@ -812,14 +1167,13 @@ def set_app_name_for_pool(client, pool, name):
     :raises: CalledProcessError if ceph call fails
     """
     if ceph_version() >= '12.0.0':
-        cmd = ['ceph', '--id', client, 'osd', 'pool',
-               'application', 'enable', pool, name]
-        check_call(cmd)
+        ceph_client(client).mon_command('osd pool application enable',
+                                        [('pool', pool), ('app', name)])
 
 
 def create_pool(service, name, replicas=3, pg_num=None):
     """Create a new RADOS pool."""
-    if pool_exists(service, name):
+    if pool_exists(service, name, max_age=CLUSTER_QUERY_TTL['osd pool get']):
         log("Ceph pool {} already exists, skipping creation".format(name),
             level=WARNING)
         return
@@ -827,7 +1181,7 @@ def create_pool(service, name, replicas=3, pg_num=None):
     if not pg_num:
         # Calculate the number of placement groups based
         # on upstream recommended best practices.
-        osds = get_osds(service)
+        osds = get_osds(service, max_age=CLUSTER_QUERY_TTL['osd ls'])
         if osds:
             pg_num = (len(osds) * 100 // replicas)
         else:
@@ -835,17 +1189,25 @@ def create_pool(service, name, replicas=3, pg_num=None):
             # which don't support OSD query from cli
             pg_num = 200
 
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'create', name, str(pg_num)]
-    check_call(cmd)
-
-    update_pool(service, name, settings={'size': str(replicas)})
+    try:
+        with ceph_client(service).batch() as batch:
+            batch.mon_command('osd pool create',
+                              [('pool', name), ('pg_num', pg_num)])
+            update_pool(service, name, settings={'size': str(replicas)},
+                        batch=batch)
+    finally:
+        invalidate_cluster_queries('osd pool get')
 
 
 def delete_pool(service, name):
     """Delete a RADOS pool from ceph."""
-    cmd = ['ceph', '--id', service, 'osd', 'pool', 'delete', name,
-           '--yes-i-really-really-mean-it']
-    check_call(cmd)
+    try:
+        ceph_client(service).mon_command(
+            'osd pool delete',
+            [('pool', name), ('pool2', name),
+             confirmation_arg('--yes-i-really-really-mean-it')])
+    finally:
+        invalidate_cluster_queries('osd pool get')
 
 
 def _keyfile_path(service):
@@ -1076,20 +1438,93 @@ def ensure_ceph_keyring(service, user=None, group=None,
     return True
 
 
+class CephVersion(object):
+    """A Ceph version that compares numerically, so 10.2.0 > 9.2.1.
+
+    Versions also compare with strings, eg. ``ceph_version() >= '12.0.0'``;
+    missing components count as 0, so '10.1' == '10.1.0'.
+    """
+
+    def __init__(self, version):
+        self.version = str(version)
+        match = re.match(r'\d+(\.\d+)*', self.version)
+        self.parts = tuple(int(part) for part in match.group(0).split('.')
+                           ) if match else ()
+
+    def _compared(self, other):
+        if not isinstance(other, CephVersion):
+            other = CephVersion(other)
+        width = max(len(self.parts), len(other.parts))
+        return (self.parts + (0,) * (width - len(self.parts)),
+                other.parts + (0,) * (width - len(other.parts)))
+
+    def __eq__(self, other):
+        mine, theirs = self._compared(other)
+        return mine == theirs
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __lt__(self, other):
+        mine, theirs = self._compared(other)
+        return mine < theirs
+
+    def __ge__(self, other):
+        return not self.__lt__(other)
+
+    def __gt__(self, other):
+        mine, theirs = self._compared(other)
+        return mine > theirs
+
+    def __le__(self, other):
+        return not self.__gt__(other)
+
+    def __hash__(self):
+        parts = list(self.parts)
+        while parts and not parts[-1]:
+            parts.pop()
+        return hash(tuple(parts))
+
+    def __str__(self):
+        return self.version
+
+    def __repr__(self):
+        return 'CephVersion({!r})'.format(self.version)
+
+
 def ceph_version():
-    """Retrieve the local version of ceph."""
-    if os.path.exists('/usr/bin/ceph'):
-        cmd = ['ceph', '-v']
-        output = check_output(cmd)
+    """Retrieve the local version of ceph.
+
+    ``ceph -v`` is only run again once the ceph binary or the installed
+    ceph-common package changes; until then the version is served from
+    memory or, in later hooks, from unitdata.
+
+    :returns: CephVersion, or None if ceph is not installed
+    """
+    try:
+        mtime = os.stat(CEPH_BIN).st_mtime
+    except OSError:
+        return None
+    stamp = [mtime, installed_version('ceph-common')]
+    if _ceph_version.get('stamp') == stamp:
+        return _ceph_version['version']
+
+    db = kv()
+    cached = db.get(CEPH_VERSION_KEY)
+    if cached and cached.get('stamp') == stamp:
+        version = cached['version']
+    else:
+        output = check_output(['ceph', '-v'])
         if six.PY3:
             output = output.decode('UTF-8')
         output = output.split()
-        if len(output) > 3:
-            return output[2]
-        else:
-            return None
-    else:
-        return None
+        version = output[2] if len(output) > 3 else None
+        db.set(CEPH_VERSION_KEY, {'stamp': stamp, 'version': version})
+        db.flush()
+
+    version = CephVersion(version) if version else None
+    _ceph_version.update(stamp=stamp, version=version)
+    return version
 
 
 class CephBrokerRq(object):
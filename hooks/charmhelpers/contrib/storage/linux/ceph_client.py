@@ -0,0 +1,507 @@
+# Copyright 2014-2015 Canonical Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Clients for the Ceph admin commands run by charmhelpers.
+
+Each ``ceph --id <service> ...`` process pays for interpreter start up,
+reading the keyring and a cephx handshake with a monitor. A client runs
+monitor commands as one cephx user, through one of:
+
+- :class:`RadosCephClient`, which holds a single librados connection and
+  sends commands with ``mon_command`` (needs python-rados),
+- :class:`CLICephClient`, which runs the ``ceph`` CLI for each command,
+- :class:`FakeCephClient`, an in-memory cluster for tests and benchmarks.
+
+Commands are given as a prefix and a list of (name, value) arguments,
+named as in the monitor's command descriptions::
+
+    client = ceph_client('cinder-ceph')
+    client.mon_command('osd pool set', [('pool', 'cinder-ceph'),
+                                        ('var', 'size'), ('val', '3')])
+
+The CLI passes the values positionally, in order; librados sends them as
+the JSON command the CLI would have built. Boolean values are for CephBool
+arguments: the CLI passes True as ``--<name>`` and leaves False out.
+Failures raise
+CalledProcessError with the command's errno as the return code, whichever
+backend runs it.
+
+Multi-step operations queue their commands on a batch, which runs them in
+order over the client's session and stops at the first failure::
+
+    with client.batch() as batch:
+        batch.mon_command('osd tier add', [('pool', 'a'), ('tierpool', 'b')])
+        batch.mon_command('osd tier cache-mode', [('pool', 'b'),
+                                                  ('mode', 'readonly')])
+
+:func:`ceph_client` picks librados if it can connect, and the CLI
+otherwise. ``CHARM_CEPH_CLIENT`` can force 'librados', 'cli' or 'fake'.
+"""
+
+import atexit
+import errno
+import json
+import os
+
+import six
+
+from subprocess import (
+    check_output,
+    CalledProcessError,
+    PIPE,
+    Popen,
+)
+from charmhelpers.core.hookenv import (
+    log,
+    DEBUG,
+    WARNING,
+    ERROR,
+)
+
+CEPH_CLIENT_ENV = 'CHARM_CEPH_CLIENT'
+CEPH_CONF_FILE = '/etc/ceph/ceph.conf'
+# Seconds librados waits for a monitor before we fall back to the CLI.
+RADOS_CONNECT_TIMEOUT = 30
+# Objects naming an RBD image's header, for format 2 and format 1 images.
+RBD_HEADER_OBJECTS = ('rbd_id.{}', '{}.rbd')
+
+# Clients by cephx user, shared by every helper in the process.
+_clients = {}
+
+
+def ceph_client(service):
+    """Return the shared client for the cephx user service."""
+    client = _clients.get(service)
+    if client is None:
+        backend = os.environ.get(CEPH_CLIENT_ENV)
+        if backend == 'fake':
+            client = FakeCephClient(service)
+        elif backend == 'cli':
+            client = CLICephClient(service)
+        else:
+            client = RadosCephClient(service)
+        _clients[service] = client
+    return client
+
+
+class CephBatchError(CalledProcessError):
+    """A command in a batch failed; the commands after it were not run.
+
+    :ivar step: int: the failed command's position in the batch, from 1
+    :ivar steps: int: the number of commands in the batch
+    :ivar command: str: the failed command, eg. 'osd tier cache-mode'
+    """
+
+    def __init__(self, step, steps, command, error):
+        super(CephBatchError, self).__init__(error.returncode, error.cmd,
+                                             error.output)
+        self.step = step
+        self.steps = steps
+        self.command = command
+
+    def __str__(self):
+        return ("Step {} of {} ({}) failed with exit status {}; the {} "
+                "step(s) before it were applied: {}".format(
+                    self.step, self.steps, self.command, self.returncode,
+                    self.step - 1, (self.output or '').strip()))
+
+
+class CommandBatch(object):
+    """A sequence of commands run over one client session.
+
+    Used as a context manager, the batch runs when the block exits, unless
+    it raised.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.steps = []
+
+    def mon_command(self, prefix, args=(), format=None):
+        """Queue a monitor command; see CephClient.mon_command."""
+        self.steps.append((prefix, self.client.mon_command,
+                           (prefix, list(args), format)))
+        return self
+
+    def rados(self, args):
+        """Queue a rados command; see CephClient.rados."""
+        self.steps.append(('rados ' + ' '.join(args), self.client.rados,
+                           (list(args),)))
+        return self
+
+    def run(self):
+        """Run the queued commands in order, stopping at the first failure.
+
+        :returns: list of the commands' outputs
+        :raises: CephBatchError naming the command that failed
+        """
+        steps, self.steps = self.steps, []
+        outputs = []
+        for step, (command, func, args) in enumerate(steps, 1):
+            try:
+                outputs.append(func(*args))
+            except CalledProcessError as e:
+                error = CephBatchError(step, len(steps), command, e)
+                log(str(error), level=ERROR)
+                raise error
+        return outputs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.run()
+
+
+class CephClient(object):
+    """Runs Ceph admin commands as one cephx user."""
+
+    def __init__(self, service):
+        self.service = service
+
+    def batch(self):
+        """Return a new CommandBatch for this client."""
+        return CommandBatch(self)
+
+    def cli_args(self, prefix, args=(), format=None):
+        """Return the ceph CLI argument list for a monitor command."""
+        cmd = ['ceph', '--id', self.service] + prefix.split()
+        for name, value in args:
+            if isinstance(value, bool):
+                if value:
+                    cmd.append('--' + name.replace('_', '-'))
+            elif isinstance(value, (list, tuple)):
+                cmd.extend(str(v) for v in value)
+            else:
+                cmd.append(str(value))
+        if format:
+            cmd.append('--format={}'.format(format))
+        return cmd
+
+    def mon_command(self, prefix, args=(), format=None):
+        """Run a monitor command.
+
+        :param prefix: str: the command, eg. 'osd pool set'
+        :param args: list of (name, value) arguments, in CLI order
+        :param format: str: output format, eg. 'json'
+        :returns: str: the command's output
+        :raises: CalledProcessError if the command fails
+        """
+        raise NotImplementedError
+
+    def list_pools(self):
+        """Return the names of the cluster's pools."""
+        raise NotImplementedError
+
+    def rados(self, args):
+        """Run a rados command; returns its output."""
+        raise NotImplementedError
+
+    def rbd(self, args):
+        """Run an rbd command; returns its output."""
+        raise NotImplementedError
+
+    def image_exists(self, pool, image):
+        """Return whether the RBD image exists in pool, without listing
+        the pool."""
+        raise NotImplementedError
+
+    def list_images(self, pool):
+        """Yield the names of the RBD images in pool as they are listed.
+
+        :raises: CalledProcessError if the listing fails
+        """
+        raise NotImplementedError
+
+
+class CLICephClient(CephClient):
+    """Runs each command with the ceph, rados and rbd CLIs."""
+
+    def _run(self, cmd):
+        out = check_output(cmd)
+        if six.PY3:
+            out = out.decode('UTF-8')
+        return out
+
+    def mon_command(self, prefix, args=(), format=None):
+        return self._run(self.cli_args(prefix, args, format))
+
+    def list_pools(self):
+        return self.rados(['lspools']).split()
+
+    def rados(self, args):
+        return self._run(['rados', '--id', self.service] + list(args))
+
+    def rbd(self, args):
+        return self._run(['rbd', '--id', self.service] + list(args))
+
+    def image_exists(self, pool, image):
+        try:
+            self.rbd(['info', '--pool', pool, image])
+        except CalledProcessError:
+            return False
+        return True
+
+    def list_images(self, pool):
+        cmd = ['rbd', '--id', self.service, 'list', '--pool', pool]
+        proc = Popen(cmd, stdout=PIPE, universal_newlines=True)
+        try:
+            for line in proc.stdout:
+                if line.strip():
+                    yield line.strip()
+        except GeneratorExit:
+            # The caller stopped early; don't wait for the rest.
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode:
+            raise CalledProcessError(returncode, cmd)
+
+
+class RadosCephClient(CLICephClient):
+    """Sends monitor commands over a single librados connection.
+
+    The connection is made on first use. If python-rados is missing or the
+    cluster cannot be reached, commands are run with the CLI instead.
+    rados and rbd commands always use the CLI; image_exists() stats the
+    image's header object over the connection.
+    """
+
+    def __init__(self, service, conffile=CEPH_CONF_FILE):
+        super(RadosCephClient, self).__init__(service)
+        self.conffile = conffile
+        self._cluster = None
+
+    def cluster(self):
+        """Return the librados connection, or None if there isn't one."""
+        if self._cluster is None:
+            self._cluster = False
+            try:
+                import rados
+            except ImportError:
+                log('python-rados is not installed; running ceph commands '
+                    'with the CLI', level=DEBUG)
+                return None
+            try:
+                cluster = rados.Rados(
+                    rados_id=self.service, conffile=self.conffile,
+                    conf={'client_mount_timeout':
+                          str(RADOS_CONNECT_TIMEOUT)})
+                cluster.connect()
+            except Exception as e:
+                log('Unable to connect to ceph as {}, running ceph commands '
+                    'with the CLI: {}'.format(self.service, e),
+                    level=WARNING)
+                return None
+            atexit.register(cluster.shutdown)
+            self._cluster = cluster
+        return self._cluster or None
+
+    def mon_command(self, prefix, args=(), format=None):
+        cluster = self.cluster()
+        if cluster is None:
+            return super(RadosCephClient, self).mon_command(prefix, args,
+                                                            format)
+        command = dict(args)
+        command['prefix'] = prefix
+        if format:
+            command['format'] = format
+        ret, out, status = cluster.mon_command(json.dumps(command), b'')
+        if ret:
+            raise CalledProcessError(-ret, self.cli_args(prefix, args,
+                                                         format), status)
+        if six.PY3 and isinstance(out, bytes):
+            out = out.decode('UTF-8')
+        return out
+
+    def list_pools(self):
+        cluster = self.cluster()
+        if cluster is None:
+            return super(RadosCephClient, self).list_pools()
+        return cluster.list_pools()
+
+    def image_exists(self, pool, image):
+        cluster = self.cluster()
+        if cluster is None:
+            return super(RadosCephClient, self).image_exists(pool, image)
+        import rados
+        try:
+            ioctx = cluster.open_ioctx(pool)
+        except rados.ObjectNotFound:
+            return False
+        try:
+            for header in RBD_HEADER_OBJECTS:
+                try:
+                    ioctx.stat(header.format(image))
+                    return True
+                except rados.ObjectNotFound:
+                    pass
+            return False
+        finally:
+            ioctx.close()
+
+
+class FakeCephClient(CephClient):
+    """An in-memory cluster, for running helpers without Ceph.
+
+    The commands charmhelpers issues change or report :attr:`pools`,
+    :attr:`config_keys`, :attr:`erasure_profiles`, :attr:`images` (by pool)
+    and :attr:`osds`; every command is appended to :attr:`commands`.
+    Other commands succeed with no output.
+    """
+
+    def __init__(self, service, osds=3, mons=('mon0', 'mon1', 'mon2')):
+        super(FakeCephClient, self).__init__(service)
+        self.pools = {}
+        self.config_keys = {}
+        self.erasure_profiles = {'default': {'k': '2', 'm': '1',
+                                             'plugin': 'jerasure'}}
+        self.images = {}
+        self.osds = list(range(osds))
+        self.mons = list(mons)
+        self.commands = []
+
+    def _error(self, code, prefix, args, message=''):
+        return CalledProcessError(code, self.cli_args(prefix, args), message)
+
+    def _pool(self, prefix, args, name):
+        try:
+            return self.pools[name]
+        except KeyError:
+            raise self._error(errno.ENOENT, prefix, args,
+                              "unrecognized pool '{}'".format(name))
+
+    def _pool_details(self):
+        return [dict(pool, pool_name=name)
+                for name, pool in sorted(self.pools.items())]
+
+    def mon_command(self, prefix, args=(), format=None):
+        self.commands.append((prefix, list(args)))
+        a = dict(args)
+        if prefix == 'mon_status':
+            return json.dumps({'monmap': {'mons': [
+                {'name': name, 'rank': rank,
+                 'addr': '10.0.0.{}:6789/0'.format(rank + 1)}
+                for rank, name in enumerate(self.mons)]}})
+        if prefix == 'osd ls':
+            return json.dumps(self.osds)
+        if prefix == 'osd dump':
+            return json.dumps({
+                'epoch': len(self.commands),
+                'pools': self._pool_details(),
+                'osds': [{'osd': osd, 'up': 1, 'in': 1}
+                         for osd in self.osds]})
+        if prefix == 'osd pool ls':
+            if 'detail' in a:
+                return json.dumps(self._pool_details())
+            return json.dumps(sorted(self.pools))
+        if prefix == 'osd pool get':
+            pool = self._pool(prefix, args, a['pool'])
+            if a['var'] == 'all':
+                return json.dumps(dict(pool, pool=a['pool']))
+            return json.dumps({'pool': a['pool'],
+                               a['var']: pool.get(a['var'])})
+        if prefix == 'osd pool create':
+            erasure = a.get('pool_type') == 'erasure'
+            self.pools.setdefault(a['pool'], {
+                'pool': len(self.pools) + 1,
+                'type': 3 if erasure else 1,
+                'erasure_code_profile': a.get('erasure_code_profile', ''),
+                'pg_num': int(a['pg_num']),
+                'size': 3,
+                'cache_mode': 'none',
+                'application_metadata': {},
+                'snaps': [],
+                'quota_max_bytes': 0,
+            })
+        elif prefix == 'osd pool set':
+            self._pool(prefix, args, a['pool'])[a['var']] = a['val']
+        elif prefix == 'osd pool set-quota':
+            pool = self._pool(prefix, args, a['pool'])
+            pool['quota_' + a['field']] = int(a['val'])
+        elif prefix == 'osd pool delete':
+            self.pools.pop(a['pool'], None)
+            self.images.pop(a['pool'], None)
+        elif prefix == 'osd pool rename':
+            self._pool(prefix, args, a['srcpool'])
+            self.pools[a['destpool']] = self.pools.pop(a['srcpool'])
+            if a['srcpool'] in self.images:
+                self.images[a['destpool']] = self.images.pop(a['srcpool'])
+        elif prefix == 'osd pool application enable':
+            pool = self._pool(prefix, args, a['pool'])
+            pool['application_metadata'].setdefault(a['app'], {})
+        elif prefix == 'osd pool mksnap':
+            self._pool(prefix, args, a['pool'])['snaps'].append(a['snap'])
+        elif prefix == 'osd pool rmsnap':
+            snaps = self._pool(prefix, args, a['pool'])['snaps']
+            if a['snap'] in snaps:
+                snaps.remove(a['snap'])
+        elif prefix == 'osd tier cache-mode':
+            self._pool(prefix, args, a['pool'])['cache_mode'] = a['mode']
+        elif prefix == 'osd erasure-code-profile get':
+            try:
+                return json.dumps(self.erasure_profiles[a['name']])
+            except KeyError:
+                raise self._error(errno.ENOENT, prefix, args)
+        elif prefix == 'osd erasure-code-profile set':
+            self.erasure_profiles[a['name']] = dict(
+                item.split('=', 1) for item in a.get('profile', []))
+        elif prefix == 'osd erasure-code-profile rm':
+            self.erasure_profiles.pop(a['name'], None)
+        elif prefix in ('config-key get', 'config-key exists'):
+            if a['key'] not in self.config_keys:
+                raise self._error(errno.ENOENT, prefix, args)
+            if prefix == 'config-key get':
+                return self.config_keys[a['key']]
+        elif prefix in ('config-key put', 'config-key set'):
+            self.config_keys[a['key']] = a['val']
+        elif prefix in ('config-key del', 'config-key rm'):
+            self.config_keys.pop(a['key'], None)
+        elif prefix == 'config-key dump':
+            return json.dumps(dict(
+                item for item in self.config_keys.items()
+                if item[0].startswith(a.get('key', ''))))
+        return ''
+
+    def list_pools(self):
+        return sorted(self.pools)
+
+    def rados(self, args):
+        self.commands.append(('rados', list(args)))
+        if list(args) == ['lspools']:
+            return '\n'.join(self.list_pools()) + '\n'
+        return ''
+
+    def rbd(self, args):
+        self.commands.append(('rbd', list(args)))
+        args = list(args)
+        pool = args[args.index('--pool') + 1] if '--pool' in args else 'rbd'
+        if args[0] == 'list':
+            return ''.join('{}\n'.format(image)
+                           for image in self.images.get(pool, []))
+        if args[0] == 'create':
+            self.images.setdefault(pool, []).append(args[1])
+        return ''
+
+    def image_exists(self, pool, image):
+        self.commands.append(('rbd', ['info', '--pool', pool, image]))
+        return image in self.images.get(pool, [])
+
+    def list_images(self, pool):
+        self.commands.append(('rbd', ['list', '--pool', pool]))
+        for image in list(self.images.get(pool, [])):
+            yield image
@@ -22,16 +22,16 @@ from __future__ import print_function
 import copy
 from distutils.version import LooseVersion
 from functools import wraps
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 import glob
 import os
 import json
-import yaml
 import re
 import subprocess
 import sys
 import errno
 import tempfile
+import atexit as _py_atexit
 from subprocess import CalledProcessError
 
 import six
@@ -40,6 +40,10 @@ if not six.PY3:
 else:
     from collections import UserDict
 
+from charmhelpers.core.lazy import lazy_module
+
+# Only a few hook tools speak yaml; don't load it for every hook.
+yaml = lazy_module('yaml')
 
 CRITICAL = "CRITICAL"
 ERROR = "ERROR"
@@ -49,10 +53,99 @@ DEBUG = "DEBUG"
 TRACE = "TRACE"
 MARKER = object()
 
+# Number of units whose relation data is fetched concurrently.
+RELATION_FETCH_WORKERS = 4
+
+# Per-function result stores for @cached, keyed by the wrapped function.
 cache = {}
+# Maps each string argument seen by a cached call to the (store, key) pairs
+# it appears in, so flush() can drop entries without scanning every store.
+_cache_index = {}
+_KWARGS_MARK = object()
+
+
+class CacheStore(object):
+    """Memoized results of a single function, optionally bounded (LRU)."""
+
+    def __init__(self, name, maxsize=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        # The terms each key is indexed under in _cache_index.
+        self.terms = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.data[key]
+        if self.maxsize:
+            # Move to the most recently used end.
+            del self.data[key]
+            self.data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value, terms=None):
+        """Store value under key, indexed by terms (by default the string
+        arguments in key) for flush()."""
+        self.data[key] = value
+        if terms is None:
+            terms = _cache_key_terms(key)
+        self.terms[key] = terms
+        for term in terms:
+            _cache_index.setdefault(term, set()).add((self, key))
+        if self.maxsize:
+            while len(self.data) > self.maxsize:
+                self.discard(next(iter(self.data)))
+
+    def discard(self, key):
+        if self.data.pop(key, MARKER) is MARKER:
+            return
+        for term in self.terms.pop(key, ()):
+            entries = _cache_index.get(term)
+            if entries is not None:
+                entries.discard((self, key))
+                if not entries:
+                    del _cache_index[term]
+
+    def clear(self):
+        for key in list(self.data):
+            self.discard(key)
+
 
+def _cache_key(args, kwargs):
+    key = args
+    if kwargs:
+        key += (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+    return key
 
-def cached(func):
+
+def _cache_key_terms(key):
+    """Return the string arguments a cache key can be invalidated by.
+
+    Strings inside list, tuple and dict arguments count too.
+    """
+    pending = []
+    in_kwargs = False
+    for item in key:
+        if item is _KWARGS_MARK:
+            in_kwargs = True
+            continue
+        pending.append(item[1] if in_kwargs else item)
+    terms = []
+    while pending:
+        item = pending.pop()
+        if isinstance(item, six.string_types):
+            terms.append(item)
+        elif isinstance(item, dict):
+            pending.extend(item.keys())
+            pending.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            pending.extend(item)
+    return terms
+
+
+def cached(func=None, maxsize=None):
     """Cache return values for multiple executions of func + args
 
     For example::
@@ -64,17 +157,42 @@ def cached(func):
         unit_get('test')
 
     will cache the result of unit_get + 'test' for future calls.
+
+    Results are held in a store per function, optionally bounded to the
+    ``maxsize`` most recently used entries::
+
+        @cached(maxsize=32)
+        def storage_get(attribute=None, storage_id=None):
+            pass
     """
+    if func is None:
+        return lambda f: cached(f, maxsize=maxsize)
+
+    name = '{}.{}'.format(func.__module__, func.__name__)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        global cache
-        key = json.dumps((func, args, kwargs), sort_keys=True, default=str)
+        store = cache.get(func)
+        if store is None:
+            store = cache[func] = CacheStore(name, maxsize=maxsize)
+        key = _cache_key(args, kwargs)
+        terms = None
         try:
-            return cache[key]
+            return store.get(key)
         except KeyError:
             pass  # Drop out of the exception handler scope.
+        except TypeError:
+            # Unhashable arguments (eg. dicts); fall back to serializing
+            # them, indexed by the arguments they were serialized from.
+            terms = _cache_key_terms(key)
+            key = json.dumps(key, sort_keys=True, default=str)
+            try:
+                return store.get(key)
+            except KeyError:
+                pass
+        store.misses += 1
         res = func(*args, **kwargs)
-        cache[key] = res
+        store.set(key, res, terms)
         return res
     wrapper._wrapped = func
     return wrapper
@@ -82,22 +200,35 @@ def cached(func):
 
 def flush(key):
     """Flushes any entries from function cache where the
-    key is found in the function+args """
-    flush_list = []
-    for item in cache:
-        if key in item:
-            flush_list.append(item)
-    for item in flush_list:
-        del cache[item]
+    key is one of the function's arguments, eg. a relation id or unit """
+    for store, _key in list(_cache_index.pop(key, ())):
+        store.discard(_key)
 
 
-def log(message, level=None):
-    """Write a message to the juju log"""
+def cache_stats():
+    """Hit and miss counters for each cached function.
+
+    A high miss count points at hook tools still called repeatedly with
+    different arguments.
+
+    :returns: dict of function name to dict with hits, misses and size.
+    """
+    return dict((store.name, {'hits': store.hits,
+                              'misses': store.misses,
+                              'size': len(store.data)})
+                for store in cache.values())
+
+
+LOG_LEVELS = (TRACE, DEBUG, INFO, WARNING, ERROR, CRITICAL)
+# Largest message handed to a single juju-log call when flushing the buffer,
+# well inside the kernel's per-argument limit.
+LOG_FLUSH_CHUNK_SIZE = 64 * 1024
+
+
+def _juju_log(message, level=None):
     command = ['juju-log']
     if level:
         command += ['-l', level]
-    if not isinstance(message, six.string_types):
-        message = repr(message)
     command += [message]
     # Missing juju-log should not cause failures in unit tests
     # Send log output to stderr
@@ -113,6 +244,95 @@ def log(message, level=None):
             raise
 
 
+class LogSink(object):
+    """Destination for :func:`log` messages.
+
+    Messages below ``threshold``, if one is set, are dropped without
+    forking. When ``buffered``, the rest are held in memory and written by
+    :meth:`flush`, which joins consecutive messages of the same level into
+    one juju-log call. The buffer is flushed by :func:`_run_atexit`, and
+    again when the interpreter exits so that nothing is lost if the hook
+    fails.
+    """
+
+    def __init__(self, threshold=None, buffered=False):
+        self.threshold = threshold
+        self.buffered = buffered
+        self.messages = []
+        self._exit_handler = False
+
+    def accepts(self, level):
+        if self.threshold is None:
+            return True
+        try:
+            return (LOG_LEVELS.index(level or INFO) >=
+                    LOG_LEVELS.index(self.threshold))
+        except ValueError:
+            # Unknown levels are passed on for juju-log to deal with.
+            return True
+
+    def write(self, message, level=None):
+        if not self.buffered:
+            _juju_log(message, level)
+            return
+        if not self._exit_handler:
+            _py_atexit.register(self.flush)
+            self._exit_handler = True
+        # juju-log defaults to INFO; group unlevelled messages with those.
+        self.messages.append((level or INFO, message))
+
+    def flush(self):
+        messages, self.messages = self.messages, []
+        lines = []
+        size = 0
+        for i, (level, message) in enumerate(messages):
+            lines.append(message)
+            size += len(message) + 1
+            last = (i + 1 == len(messages) or messages[i + 1][0] != level)
+            if last or size >= LOG_FLUSH_CHUNK_SIZE:
+                _juju_log('\n'.join(lines), level)
+                lines = []
+                size = 0
+
+
+_log_sink = LogSink(
+    threshold=os.environ.get('CHARM_LOG_LEVEL', '').upper() or None,
+    # Only buffer inside a hook, where juju-log is available.
+    buffered=('JUJU_CONTEXT_ID' in os.environ and
+              os.environ.get('CHARM_LOG_BUFFER', '1') != '0'))
+
+
+def configure_log(threshold=None, buffered=None):
+    """Set the minimum level logged and whether messages are buffered.
+
+    :param threshold: Lowest level passed to juju-log, eg. INFO; an empty
+        string passes every level
+    :type threshold: Optional[str]
+    :param buffered: Hold messages until the end of the hook
+    :type buffered: Optional[bool]
+    """
+    if threshold is not None:
+        _log_sink.threshold = threshold or None
+    if buffered is not None:
+        if not buffered:
+            _log_sink.flush()
+        _log_sink.buffered = buffered
+
+
+def flush_log():
+    """Write out any buffered log messages."""
+    _log_sink.flush()
+
+
+def log(message, level=None):
+    """Write a message to the juju log"""
+    if not _log_sink.accepts(level):
+        return
+    if not isinstance(message, six.string_types):
+        message = repr(message)
+    _log_sink.write(message, level)
+
+
 class Serializable(UserDict):
     """Wrapper, an object that can be serialized to yaml or json"""
 
@@ -419,34 +639,212 @@ def config(scope=None):
         return None
 
 
-@cached
+class RelationSnapshot(object):
+    """In-memory view of the relation data visible to the current hook.
+
+    Juju presents a hook with a consistent view of remote relation data for
+    the lifetime of the hook, so each unit's settings are loaded in bulk with
+    a single ``relation-get -`` and attribute lookups are served from memory.
+    Relation ids and related units are held in the same way. The local unit's
+    settings are invalidated by :func:`relation_set`.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or RELATION_FETCH_WORKERS
+        self._ids = {}
+        self._units = {}
+        self._data = {}
+
+    def relation_ids(self, reltype):
+        if reltype not in self._ids:
+            _args = ['relation-ids', '--format=json', reltype]
+            self._ids[reltype] = json.loads(
+                subprocess.check_output(_args).decode('UTF-8')) or []
+        return self._ids[reltype]
+
+    def related_units(self, relid=None):
+        if relid not in self._units:
+            _args = ['relation-list', '--format=json']
+            if relid is not None:
+                _args.extend(('-r', relid))
+            self._units[relid] = json.loads(
+                subprocess.check_output(_args).decode('UTF-8')) or []
+        return self._units[relid]
+
+    def unit_data(self, rid=None, unit=None, prefetch=None):
+        """Return all settings for unit on relation rid.
+
+        A remote unit's lookup on the hook's own relation also loads the
+        settings of every other unit related on it, concurrently, since
+        callers almost always walk all of them. On other relations that
+        happens from the second remote unit looked up. Pass prefetch=True
+        or False to decide for yourself.
+        """
+        if (rid, unit) not in self._data:
+            if prefetch is None:
+                prefetch = self._walking(rid, unit)
+            if prefetch and rid is not None and unit is not None:
+                self.prefetch(rid)
+            if (rid, unit) not in self._data:
+                self._data[(rid, unit)] = self._fetch((rid, unit))
+        return self._data[(rid, unit)]
+
+    def _walking(self, rid, unit):
+        """Return True if a lookup of unit looks like a walk of rid."""
+        local = local_unit()
+        if rid is None or unit is None or unit == local:
+            return False
+        if rid == os.environ.get('JUJU_RELATION_ID'):
+            return True
+        return any(_rid == rid and _unit not in (None, local)
+                   for _rid, _unit in self._data)
+
+    def prefetch(self, rid):
+        """Load the settings of all units related on rid not yet held."""
+        keys = [(rid, u) for u in self.related_units(rid)
+                if (rid, u) not in self._data]
+        for key, data in zip(keys, _parallel_map(self._fetch, keys,
+                                                 self.workers)):
+            self._data[key] = data
+
+    def invalidate(self, rid=None, unit=None):
+        """Drop held settings for unit, on rid or on all relations.
+
+        Entries loaded without an explicit relation id or unit are always
+        dropped as they may refer to the same settings.
+        """
+        for key in list(self._data):
+            _rid, _unit = key
+            if (_unit in (unit, None) and
+                    (rid is None or _rid in (rid, None))):
+                del self._data[key]
+
+    def clear(self):
+        self._ids.clear()
+        self._units.clear()
+        self._data.clear()
+
+    @staticmethod
+    def _fetch(key):
+        rid, unit = key
+        _args = ['relation-get', '--format=json']
+        if rid:
+            _args.append('-r')
+            _args.append(rid)
+        _args.append('-')
+        if unit:
+            _args.append(unit)
+        try:
+            return json.loads(subprocess.check_output(_args).decode('UTF-8'))
+        except ValueError:
+            return None
+        except CalledProcessError as e:
+            if e.returncode == 2:
+                return None
+            raise
+
+
+def _parallel_map(func, items, workers):
+    """Map func over items using a small pool of threads, preserving order."""
+    items = list(items)
+    if workers < 2 or len(items) < 2:
+        return [func(item) for item in items]
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+_relation_snapshot = None
+
+
+def relation_snapshot():
+    """Return the RelationSnapshot for the current hook."""
+    global _relation_snapshot
+    if _relation_snapshot is None:
+        _relation_snapshot = RelationSnapshot()
+    return _relation_snapshot
+
+
 def relation_get(attribute=None, unit=None, rid=None):
     """Get relation information"""
-    _args = ['relation-get', '--format=json']
-    if rid:
-        _args.append('-r')
-        _args.append(rid)
-    _args.append(attribute or '-')
-    if unit:
-        _args.append(unit)
-    try:
-        return json.loads(subprocess.check_output(_args).decode('UTF-8'))
-    except ValueError:
+    data = relation_snapshot().unit_data(rid=rid, unit=unit)
+    if _relation_writes and unit == local_unit():
+        pending = _relation_writes.get(
+            rid or os.environ.get('JUJU_RELATION_ID'))
+        if pending:
+            data = dict(data or {})
+            data.update(pending)
+            for key in [k for k, v in pending.items() if v is None]:
+                del data[key]
+    if attribute is None:
+        # Callers are free to modify the returned settings.
+        return copy.copy(data)
+    if data is None:
         return None
-    except CalledProcessError as e:
-        if e.returncode == 2:
-            return None
-        raise
+    return data.get(attribute)
+
+
+# unitdata key holding the relation-set capabilities probed for the Juju
+# version the unit agent is running.
+RELATION_SET_CAPS_KEY = 'hookenv.relation-set-caps'
+# Reading --file from stdin is broken in Juju 1.23.2 (Bug #1454678).
+RELATION_SET_STDIN_MIN_VERSION = '2.0'
+
+
+def _yaml_dumper():
+    try:
+        return yaml.CSafeDumper
+    except AttributeError:
+        # libyaml bindings not available
+        return yaml.SafeDumper
+
+
+@cached
+def relation_set_capabilities():
+    """Determine how relation-set accepts settings.
+
+    relation-set is only probed (with ``--help``) once per Juju agent
+    version; the result is stored in unitdata so later hooks skip the fork.
+
+    :returns: dict with boolean 'file' (``--file`` is supported) and
+        'stdin' (``--file -`` reads settings from stdin) keys.
+    """
+    from charmhelpers.core import unitdata
+    try:
+        version = juju_version()
+    except (IndexError, OSError, CalledProcessError):
+        # Not running under a machine agent (eg. tests); don't persist.
+        version = None
+    db = unitdata.kv()
+    if version:
+        caps = db.get(RELATION_SET_CAPS_KEY)
+        if caps and caps.get('juju-version') == version:
+            return {'file': caps['file'], 'stdin': caps['stdin']}
+    accepts_file = "--file" in subprocess.check_output(
+        ['relation-set', '--help'], universal_newlines=True)
+    caps = {
+        'file': accepts_file,
+        'stdin': bool(accepts_file and version and
+                      LooseVersion(version) >=
+                      LooseVersion(RELATION_SET_STDIN_MIN_VERSION)),
+    }
+    if version:
+        db.set(RELATION_SET_CAPS_KEY, dict(caps, **{'juju-version': version}))
+        db.flush()
+    return caps
 
 
 def relation_set(relation_id=None, relation_settings=None, **kwargs):
-    """Set relation information for the current unit"""
+    """Set relation information for the current unit
+
+    While writes are batched (see :func:`batch_relation_writes`) the
+    settings are merged into the pending write for the relation instead.
+    """
     relation_settings = relation_settings if relation_settings else {}
-    relation_cmd_line = ['relation-set']
-    accepts_file = "--file" in subprocess.check_output(
-        relation_cmd_line + ["--help"], universal_newlines=True)
-    if relation_id is not None:
-        relation_cmd_line.extend(('-r', relation_id))
     settings = relation_settings.copy()
     settings.update(kwargs)
     for key, value in settings.items():
@@ -454,16 +852,37 @@ def relation_set(relation_id=None, relation_settings=None, **kwargs):
         # sites pass in things like dicts or numbers.
         if value is not None:
             settings[key] = "{}".format(value)
-    if accepts_file:
+    if _relation_writes is not None:
+        rid = relation_id or os.environ.get('JUJU_RELATION_ID')
+        _relation_writes.setdefault(rid, {}).update(settings)
+        return
+    _relation_set(relation_id, settings)
+
+
+def _relation_set(relation_id, settings):
+    relation_cmd_line = ['relation-set']
+    caps = relation_set_capabilities()
+    if relation_id is not None:
+        relation_cmd_line.extend(('-r', relation_id))
+    if caps['file']:
         # --file was introduced in Juju 1.23.2. Use it by default if
         # available, since otherwise we'll break if the relation data is
-        # too big. Ideally we should tell relation-set to read the data from
-        # stdin, but that feature is broken in 1.23.2: Bug #1454678.
-        with tempfile.NamedTemporaryFile(delete=False) as settings_file:
-            settings_file.write(yaml.safe_dump(settings).encode("utf-8"))
-        subprocess.check_call(
-            relation_cmd_line + ["--file", settings_file.name])
-        os.remove(settings_file.name)
+        # too big.
+        data = yaml.dump(settings, Dumper=_yaml_dumper()).encode("utf-8")
+        if caps['stdin']:
+            cmd = relation_cmd_line + ["--file", "-"]
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+            proc.communicate(data)
+            if proc.returncode:
+                raise CalledProcessError(proc.returncode, cmd)
+        else:
+            with tempfile.NamedTemporaryFile(delete=False) as settings_file:
+                settings_file.write(data)
+            try:
+                subprocess.check_call(
+                    relation_cmd_line + ["--file", settings_file.name])
+            finally:
+                os.remove(settings_file.name)
     else:
         for key, value in settings.items():
             if value is None:
@@ -472,9 +891,54 @@ def relation_set(relation_id=None, relation_settings=None, **kwargs):
                 relation_cmd_line.append('{}={}'.format(key, value))
         subprocess.check_call(relation_cmd_line)
     # Flush cache of any relation-gets for local unit
+    relation_snapshot().invalidate(
+        rid=relation_id or os.environ.get('JUJU_RELATION_ID'),
+        unit=local_unit())
     flush(local_unit())
 
 
+# Pending relation settings keyed by relation id while writes are batched.
+_relation_writes = None
+
+
+def batch_relation_writes():
+    """Defer relation_set calls until the end of the hook.
+
+    Settings written to the same relation are merged, and at most one
+    relation-set per relation is issued by :func:`commit_relation_writes`,
+    which runs from the hook's atexit callbacks. Keys already holding the
+    value being written are left alone, so remote units don't see a
+    relation-changed for a no-op write.
+
+    Writes still pending when a hook fails are dropped, as Juju would
+    discard them along with the rest of the hook's relation changes.
+    """
+    global _relation_writes
+    if _relation_writes is None:
+        _relation_writes = OrderedDict()
+        atexit(commit_relation_writes)
+
+
+def commit_relation_writes():
+    """Issue pending relation writes and stop batching."""
+    global _relation_writes
+    writes, _relation_writes = _relation_writes, None
+    if not writes:
+        return
+    for rid, settings in writes.items():
+        # Only our own settings are diffed against; don't load the remote
+        # units' along with them.
+        current = relation_snapshot().unit_data(
+            rid=rid, unit=local_unit(), prefetch=False) or {}
+        changes = dict((k, v) for k, v in settings.items()
+                       if current.get(k) != v)
+        if changes:
+            _relation_set(rid, changes)
+        else:
+            log('Skipping relation-set on {}: no changes'.format(rid),
+                level=DEBUG)
+
+
 def relation_clear(r_id=None):
     ''' Clears any relation data already set on relation r_id '''
     settings = relation_get(rid=r_id,
@@ -486,27 +950,18 @@ def relation_clear(r_id=None):
                  **settings)
 
 
-@cached
 def relation_ids(reltype=None):
     """A list of relation_ids"""
     reltype = reltype or relation_type()
-    relid_cmd_line = ['relation-ids', '--format=json']
     if reltype is not None:
-        relid_cmd_line.append(reltype)
-        return json.loads(
-            subprocess.check_output(relid_cmd_line).decode('UTF-8')) or []
+        return relation_snapshot().relation_ids(reltype)
     return []
 
 
-@cached
 def related_units(relid=None):
     """A list of related units"""
     relid = relid or relation_id()
-    units_cmd_line = ['relation-list', '--format=json']
-    if relid is not None:
-        units_cmd_line.extend(('-r', relid))
-    return json.loads(
-        subprocess.check_output(units_cmd_line).decode('UTF-8')) or []
+    return relation_snapshot().related_units(relid)
 
 
 @cached
@@ -545,11 +1000,89 @@ def relations_of_type(reltype=None):
     return relation_data
 
 
+def _yaml_loader():
+    try:
+        return yaml.CSafeLoader
+    except AttributeError:
+        # libyaml bindings not available
+        return yaml.SafeLoader
+
+
+# unitdata key holding facts that only change on upgrade-charm or an agent
+# upgrade, together with the fingerprint they were computed for.
+CHARM_FACTS_KEY = 'hookenv.charm-facts'
+JUJUD_GLOB = '/var/lib/juju/tools/machine-*/jujud'
+
+_charm_facts = None
+
+
+def _jujud_path():
+    # Per https://bugs.launchpad.net/juju-core/+bug/1455368/comments/1
+    return glob.glob(JUJUD_GLOB)[0]
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _charm_facts_fingerprint():
+    try:
+        with open(os.path.join(charm_dir(), 'revision')) as f:
+            revision = f.read().strip()
+    except (IOError, TypeError):
+        revision = None
+    try:
+        jujud = _jujud_path()
+    except IndexError:
+        jujud = None
+    return [revision,
+            _mtime(os.path.join(charm_dir() or '', 'metadata.yaml')),
+            jujud, _mtime(jujud)]
+
+
+def charm_fact(name, compute):
+    """Return a fact about the charm or model, computing it at most once.
+
+    Facts are persisted in unitdata and reused by later hooks until the
+    charm revision, metadata.yaml or the jujud binary change; they are always
+    recomputed in upgrade-charm.
+
+    :param name: Name of the fact
+    :param compute: Callable returning the (JSON serializable) value
+    """
+    global _charm_facts
+    from charmhelpers.core import unitdata
+    if not charm_dir():
+        # Outside of a hook there is no unit state to persist facts in.
+        return compute()
+    if _charm_facts is None:
+        fingerprint = _charm_facts_fingerprint()
+        stored = unitdata.kv().get(CHARM_FACTS_KEY) or {}
+        if (hook_name() == 'upgrade-charm' or
+                stored.get('fingerprint') != fingerprint):
+            stored = {'fingerprint': fingerprint, 'facts': {}}
+        _charm_facts = stored
+    facts = _charm_facts['facts']
+    if name not in facts:
+        facts[name] = compute()
+        db = unitdata.kv()
+        db.set(CHARM_FACTS_KEY, _charm_facts)
+        db.flush()
+    return facts[name]
+
+
+def _load_metadata():
+    with open(os.path.join(charm_dir(), 'metadata.yaml')) as md:
+        return yaml.load(md, Loader=_yaml_loader())
+
+
 @cached
 def metadata():
     """Get the current charm metadata.yaml contents as a python object"""
-    with open(os.path.join(charm_dir(), 'metadata.yaml')) as md:
-        return yaml.safe_load(md)
+    return copy.deepcopy(charm_fact('metadata', _load_metadata))
 
 
 def _metadata_unit(unit):
@@ -567,7 +1100,7 @@ def _metadata_unit(unit):
     if not os.path.exists(joineddir):
         return None
     with open(joineddir) as md:
-        return yaml.safe_load(md)
+        return yaml.load(md, Loader=_yaml_loader())
 
 
 @cached
@@ -1003,21 +1536,34 @@ def goal_state():
     return json.loads(subprocess.check_output(cmd).decode('UTF-8'))
 
 
+@cached
 @translate_exc(from_exc=OSError, to_exc=NotImplementedError)
 def is_leader():
     """Does the current unit hold the juju leadership
 
-    Uses juju to determine whether the current unit is the leader of its peers
+    Uses juju to determine whether the current unit is the leader of its peers.
+    Juju guarantees leadership for the remainder of a hook once confirmed, so
+    the answer is memoized.
     """
     cmd = ['is-leader', '--format=json']
     return json.loads(subprocess.check_output(cmd).decode('UTF-8'))
 
 
+# All leader settings, loaded by the first leader_get in the hook.
+_leader_settings = None
+
+
 @translate_exc(from_exc=OSError, to_exc=NotImplementedError)
 def leader_get(attribute=None):
     """Juju leader get value(s)"""
-    cmd = ['leader-get', '--format=json'] + [attribute or '-']
-    return json.loads(subprocess.check_output(cmd).decode('UTF-8'))
+    global _leader_settings
+    if _leader_settings is None:
+        cmd = ['leader-get', '--format=json', '-']
+        _leader_settings = json.loads(
+            subprocess.check_output(cmd).decode('UTF-8')) or {}
+    if attribute is None:
+        return copy.copy(_leader_settings)
+    return _leader_settings.get(attribute)
 
 
 @translate_exc(from_exc=OSError, to_exc=NotImplementedError)
@@ -1034,6 +1580,13 @@ def leader_set(settings=None, **kwargs):
         else:
             cmd.append('{}={}'.format(k, v))
     subprocess.check_call(cmd)
+    # Write through to the settings read by leader_get.
+    if _leader_settings is not None:
+        for k, v in settings.items():
+            if v is None or v == '':
+                _leader_settings.pop(k, None)
+            else:
+                _leader_settings[k] = '{}'.format(v)
 
 
 @translate_exc(from_exc=OSError, to_exc=NotImplementedError)
@@ -1088,13 +1641,15 @@ def resource_get(name):
         return False
 
 
+def _jujud_version():
+    return subprocess.check_output([_jujud_path(), 'version'],
+                                   universal_newlines=True).strip()
+
+
 @cached
 def juju_version():
     """Full version string (eg. '1.23.3.1-trusty-amd64')"""
-    # Per https://bugs.launchpad.net/juju-core/+bug/1455368/comments/1
-    jujud = glob.glob('/var/lib/juju/tools/machine-*/jujud')[0]
-    return subprocess.check_output([jujud, 'version'],
-                                   universal_newlines=True).strip()
+    return charm_fact('juju-version', _jujud_version)
 
 
 def has_juju_version(minimum_version):
@@ -1151,6 +1706,7 @@ def _run_atexit():
     for callback, args, kwargs in reversed(_atexit):
         callback(*args, **kwargs)
     del _atexit[:]
+    flush_log()
 
 
 @translate_exc(from_exc=OSError, to_exc=NotImplementedError)
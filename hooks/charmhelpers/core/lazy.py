@@ -0,0 +1,82 @@
+# Copyright 2014-2015 Canonical Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Deferred imports for hook entry points.
+
+Every hook imports the charm's hook module, but a handler typically uses a
+few of the helpers it references. These stand-ins import the real module
+the first time they are used, so a hook only loads what its handler needs::
+
+    templating = lazy_module('charmhelpers.contrib.openstack.templating')
+    apt_install = lazy_callable('charmhelpers.fetch', 'apt_install')
+
+A lazy callable looks its target up on every call, so patching the
+attribute on the source module (eg. in unit tests) still takes effect.
+"""
+
+import importlib
+
+
+class LazyModule(object):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def _load(self):
+        return importlib.import_module(self._lazy_name)
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __delattr__(self, attr):
+        delattr(self._load(), attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._lazy_name)
+
+
+class LazyCallable(object):
+    """Stand-in for a function or class that is imported when called."""
+
+    def __init__(self, module, name):
+        self.module = module
+        self.__name__ = name
+
+    def __call__(self, *args, **kwargs):
+        target = getattr(importlib.import_module(self.module), self.__name__)
+        return target(*args, **kwargs)
+
+    def __repr__(self):
+        return '<lazy callable {}.{}>'.format(self.module, self.__name__)
+
+
+def lazy_module(name):
+    """Return a stand-in for module name.
+
+    :param name: absolute module name, eg. 'charmhelpers.fetch'
+    """
+    return LazyModule(name)
+
+
+def lazy_callable(module, name):
+    """Return a stand-in for the function or class name in module.
+
+    :param module: absolute module name, eg. 'charmhelpers.fetch'
+    :param name: attribute of that module, eg. 'apt_install'
+    """
+    return LazyCallable(module, name)
@@ -0,0 +1,272 @@
+# Copyright 2014-2015 Canonical Limited.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Opt-in profiling of the commands a hook runs.
+
+When enabled, ``subprocess.call``, ``check_call``, ``check_output`` and
+``Popen`` are wrapped, both in the subprocess module and wherever
+charmhelpers modules imported them by name. Each call records the command,
+a coarse argument class (eg. ``osd pool create`` for ceph), its wall time
+and exit code; full argument lists are not kept as they can carry keys and
+secrets. A ``Popen`` process is timed from its start until it is waited
+for, eg. by ``communicate()``.
+
+At the end of the hook a JSON report with totals per tool, per ceph CLI verb
+and the slowest calls is written under the charm directory, and a summary is
+stored in unitdata against a row in the ``hooks`` table, so it can be
+compared across charm upgrades with ``kv().gethistory(PROFILE_KEY)``.
+
+Profiling is enabled by :func:`enable_if_requested` when ``CHARM_PROFILE``
+is set in the environment or the charm directory holds a
+``.profile-hooks`` file.
+"""
+
+import atexit
+import json
+import os
+import subprocess
+import sys
+import time
+
+import six
+
+from charmhelpers.core import hookenv
+
+PROFILE_KEY = 'hook-profile'
+PROFILE_FLAG_FILE = '.profile-hooks'
+PROFILE_DIR = '.hook-profiles'
+SLOWEST_CALLS = 10
+
+# Commands whose sub-command is worth breaking totals down by.
+CEPH_TOOLS = ('ceph', 'rados', 'rbd')
+VERB_TOOLS = CEPH_TOOLS + ('apt-get', 'apt-mark', 'systemctl', 'service')
+# ceph sub-commands identified by three words (eg. 'osd pool set').
+CEPH_LONG_VERBS = ('osd pool', 'osd tier', 'osd erasure-code-profile',
+                   'osd crush')
+# ceph, rados and rbd options followed by a value.
+CEPH_VALUE_OPTIONS = ('--id', '--user', '-n', '--name', '-c', '--conf',
+                      '-k', '--keyring', '-p', '--pool', '--format',
+                      '--size', '--secret')
+
+WRAPPED = ('call', 'check_call', 'check_output', 'Popen')
+
+_originals = {}
+_calls = []
+_hook_succeeded = False
+# Wrapped calls in progress; the calls and Popen they make (eg. py2's
+# check_call runs call) are not recorded again.
+_running = []
+
+
+def classify(cmd):
+    """Return the tool name and argument class for a command.
+
+    :param cmd: argument list or shell command string
+    :returns: tuple of (tool, verb); verb is None for tools not broken down
+    """
+    if isinstance(cmd, six.string_types):
+        cmd = cmd.split()
+    if not cmd:
+        return None, None
+    tool = os.path.basename(cmd[0])
+    if tool not in VERB_TOOLS:
+        return tool, None
+    words = []
+    args = iter(cmd[1:])
+    for arg in args:
+        if arg.startswith('-'):
+            if '=' not in arg and arg in CEPH_VALUE_OPTIONS:
+                next(args, None)
+            continue
+        words.append(arg)
+    if tool == 'ceph':
+        length = 3 if ' '.join(words[:2]) in CEPH_LONG_VERBS else 2
+    else:
+        length = 1
+    return tool, ' '.join(words[:length]) or None
+
+
+def _record(tool, verb, start, exit_code):
+    _calls.append({
+        'tool': tool,
+        'verb': verb,
+        'duration': time.time() - start,
+        'exit-code': exit_code,
+    })
+
+
+def _wrap(name, func):
+    if name == 'Popen':
+        return _wrap_popen(func)
+
+    def wrapper(*args, **kwargs):
+        cmd = args[0] if args else kwargs.get('args')
+        tool, verb = classify(cmd)
+        exit_code = 0
+        start = time.time()
+        nested = bool(_running)
+        _running.append(name)
+        try:
+            result = func(*args, **kwargs)
+            if name == 'call':
+                exit_code = result
+            return result
+        except subprocess.CalledProcessError as e:
+            exit_code = e.returncode
+            raise
+        except OSError as e:
+            exit_code = -e.errno if e.errno else -1
+            raise
+        finally:
+            _running.pop()
+            if not nested:
+                _record(tool, verb, start, exit_code)
+    wrapper._profiled = func
+    return wrapper
+
+
+def _wrap_popen(popen):
+    class ProfiledPopen(popen):
+        """Popen that records the process once it has been waited for."""
+
+        def __init__(self, *args, **kwargs):
+            self._profile = None
+            if not _running:
+                cmd = args[0] if args else kwargs.get('args')
+                self._profile = classify(cmd) + (time.time(),)
+            try:
+                super(ProfiledPopen, self).__init__(*args, **kwargs)
+            except OSError as e:
+                self._recorded(-e.errno if e.errno else -1)
+                raise
+
+        def wait(self, *args, **kwargs):
+            returncode = super(ProfiledPopen, self).wait(*args, **kwargs)
+            self._recorded(returncode)
+            return returncode
+
+        def _recorded(self, exit_code):
+            if self._profile is not None:
+                _record(*(self._profile + (exit_code,)))
+                self._profile = None
+
+    ProfiledPopen._profiled = popen
+    return ProfiledPopen
+
+
+def enable():
+    """Start recording subprocess calls for this hook."""
+    if _originals:
+        return
+    for name in WRAPPED:
+        _originals[name] = getattr(subprocess, name)
+        setattr(subprocess, name, _wrap(name, _originals[name]))
+    # Modules that did 'from subprocess import check_call' hold their own
+    # reference; modules imported from now on pick up the wrappers.
+    for modname, module in list(sys.modules.items()):
+        if not modname.startswith('charmhelpers.') or module is None:
+            continue
+        for name in WRAPPED:
+            if getattr(module, name, None) is _originals[name]:
+                setattr(module, name, getattr(subprocess, name))
+    hookenv.atexit(_mark_succeeded)
+    atexit.register(_write_report)
+
+
+def enable_if_requested():
+    """Enable profiling if requested by the environment or a flag file."""
+    charm_dir = hookenv.charm_dir() or ''
+    if (os.environ.get('CHARM_PROFILE') or
+            os.path.exists(os.path.join(charm_dir, PROFILE_FLAG_FILE))):
+        enable()
+
+
+def report():
+    """Summarise the calls recorded so far.
+
+    :returns: dict with per tool and per ceph verb totals, the slowest
+        calls and, if the hook used apt, cache reuse counts and the time
+        spent running apt and waiting for the dpkg lock.
+    """
+    def _add(totals, key, call):
+        entry = totals.setdefault(key, {'calls': 0, 'time': 0.0,
+                                        'failures': 0})
+        entry['calls'] += 1
+        entry['time'] += call['duration']
+        if call['exit-code']:
+            entry['failures'] += 1
+
+    tools = {}
+    ceph_verbs = {}
+    for call in _calls:
+        _add(tools, call['tool'], call)
+        if call['tool'] in CEPH_TOOLS:
+            _add(ceph_verbs, '{} {}'.format(call['tool'], call['verb']),
+                 call)
+    slowest = sorted(_calls, key=lambda c: c['duration'], reverse=True)
+    data = {
+        'hook': hookenv.hook_name(),
+        'calls': len(_calls),
+        'time': sum(c['duration'] for c in _calls),
+        'tools': tools,
+        'ceph-verbs': ceph_verbs,
+        'slowest': slowest[:SLOWEST_CALLS],
+    }
+    # Only reported if the hook used fetch; don't import it just for this.
+    fetch = sys.modules.get('charmhelpers.fetch.ubuntu')
+    if fetch is not None:
+        data['apt-cache'] = fetch.apt_cache_stats()
+        data['apt-runs'] = fetch.apt_run_stats()
+    return data
+
+
+def _mark_succeeded():
+    global _hook_succeeded
+    _hook_succeeded = True
+
+
+def _write_report():
+    """Write the hook's report and, if the hook succeeded, record it.
+
+    Runs at interpreter exit so that calls made after the hook's atexit
+    callbacks (eg. workload status) are included. Failed hooks are not
+    recorded in unitdata: committing would also commit their other, partial,
+    unitdata changes.
+    """
+    data = report()
+    charm_dir = hookenv.charm_dir()
+    if charm_dir:
+        path = os.path.join(charm_dir, PROFILE_DIR)
+        try:
+            if not os.path.isdir(path):
+                os.mkdir(path)
+            with open(os.path.join(path, '{}.json'.format(data['hook'])),
+                      'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            hookenv.log('Unable to write hook profile: {}'.format(e),
+                        level=hookenv.WARNING)
+            hookenv.flush_log()
+    if _hook_succeeded:
+        from charmhelpers.core import unitdata
+        summary = dict((k, data[k]) for k in ('calls', 'time', 'tools',
+                                               'ceph-verbs'))
+        db = unitdata.kv()
+        if db.revision:
+            # The hook's own flush has already run.
+            db.set(PROFILE_KEY, summary)
+            db.flush()
+        else:
+            with db.hook_scope(data['hook']):
+                db.set(PROFILE_KEY, summary)
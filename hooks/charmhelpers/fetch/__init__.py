@@ -92,8 +92,18 @@ add_source = fetch.add_source
 
 if __platform__ == "ubuntu":
     apt_cache = fetch.apt_cache
+    apt_cache_stats = fetch.apt_cache_stats
+    invalidate_apt_cache = fetch.invalidate_apt_cache
     apt_install = fetch.apt_install
+    stage_local_packages = fetch.stage_local_packages
+    local_packages = fetch.local_packages
+    queue_apt_install = fetch.queue_apt_install
+    batch_apt_installs = fetch.batch_apt_installs
+    commit_apt_installs = fetch.commit_apt_installs
     apt_update = fetch.apt_update
+    apt_lists_fresh = fetch.apt_lists_fresh
+    apt_run_stats = fetch.apt_run_stats
+    dpkg_lock_held = fetch.dpkg_lock_held
     apt_upgrade = fetch.apt_upgrade
     apt_purge = fetch.apt_purge
     apt_mark = fetch.apt_mark
@@ -101,6 +111,11 @@ if __platform__ == "ubuntu":
     apt_unhold = fetch.apt_unhold
     import_key = fetch.import_key
     get_upstream_version = fetch.get_upstream_version
+    dpkg_status_stamp = fetch.dpkg_status_stamp
+    dpkg_status_index = fetch.dpkg_status_index
+    DPKG_UNINSTALLED = fetch.DPKG_UNINSTALLED
+    installed_version = fetch.installed_version
+    upstream_version = fetch.upstream_version
 elif __platform__ == "centos":
     yum_search = fetch.yum_search
 
@@ -13,10 +13,17 @@
 # limitations under the License.
 
 from collections import OrderedDict
+import fcntl
+import glob
+import json
 import os
 import platform
 import re
+import shutil
 import six
+import struct
+import sys
+import tarfile
 import time
 import subprocess
 from tempfile import NamedTemporaryFile
@@ -25,7 +32,9 @@ from charmhelpers.core.host import (
     lsb_release
 )
 from charmhelpers.core.hookenv import (
+    atexit,
     log,
+    resource_get,
     DEBUG,
     WARNING,
 )
@@ -170,50 +179,346 @@ CLOUD_ARCHIVE_POCKETS = {
 
 
 APT_NO_LOCK = 100  # The return code for "couldn't acquire lock" in APT.
+# What apt reports when it exits APT_NO_LOCK because the lock is held; it
+# uses the same exit code for every other error.
+APT_NO_LOCK_MESSAGE = 'Could not get lock'
 CMD_RETRY_DELAY = 10  # Wait 10 seconds between command retries.
 CMD_RETRY_COUNT = 3  # Retry a failing fatal command X times.
+# Locks taken by apt (lock-frontend, since apt 1.5) and dpkg; they are
+# fcntl locks, released as soon as the holder exits.
+DPKG_LOCKS = ('/var/lib/dpkg/lock-frontend', '/var/lib/dpkg/lock')
+# struct flock: l_type, l_whence, l_start, l_len and l_pid. Python builds
+# with large file support, so the offsets are 64 bit everywhere.
+DPKG_FLOCK_FORMAT = 'hhqqi'
+DPKG_LOCK_POLL = 0.5  # Seconds between checks of a held dpkg lock.
+DPKG_LOCK_TIMEOUT = 600  # Give up on apt commands after this many seconds.
+# Rewritten by dpkg whenever a package is installed, upgraded or removed.
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+# Package lists written by apt-get update, and the sources they come from.
+APT_LISTS_DIR = '/var/lib/apt/lists'
+APT_SOURCES = '/etc/apt/sources.list*'
+# Seconds after which the lists are updated even if no source changed.
+APT_LISTS_MAX_AGE = 24 * 60 * 60
+
+# dpkg status index, persisted next to the unit state database.
+DPKG_INDEX_FILE = '.dpkg-status-index.json'
+# Current states in which dpkg has no version of a package unpacked.
+DPKG_UNINSTALLED = ('not-installed', 'config-files')
+
+# dpkg_status_index() result, with the dpkg status it reflects.
+_dpkg_index = {}
+# Packages staged from a charm resource by stage_local_packages().
+LOCAL_PACKAGES_DIR = '/var/cache/charm-packages'
+LOCAL_PACKAGES_INDEX = 'Packages'
+LOCAL_PACKAGES_SOURCE = '.source'
+
+# local_packages() result, dropped when packages are staged again.
+_local_packages = None
+# Packages queued by queue_apt_install() while installs are batched, keyed
+# by the options they are installed with.
+_install_plan = None
+# apt_cache() results by in_memory flag, with the dpkg status they reflect.
+_apt_caches = {}
+_apt_cache_stats = {'builds': 0, 'hits': 0, 'invalidations': 0}
+# Time spent in apt commands, and waiting for others to release the lock.
+_apt_run_stats = {'runs': 0, 'run-time': 0.0,
+                  'lock-waits': 0, 'lock-wait-time': 0.0}
 
 
 def filter_installed_packages(packages):
     """Return a list of packages that require installation."""
-    cache = apt_cache()
-    _pkgs = []
-    for package in packages:
-        try:
-            p = cache[package]
-            p.current_ver or _pkgs.append(package)
-        except KeyError:
-            log('Package {} has no installation candidate.'.format(package),
-                level='WARNING')
-            _pkgs.append(package)
-    return _pkgs
+    return [package for package in packages
+            if installed_version(package) is None]
 
 
 def apt_cache(in_memory=True, progress=None):
-    """Build and return an apt cache."""
+    """Build and return an apt cache.
+
+    Building a cache is slow and memory hungry, so one is shared by every
+    caller in the process. It is rebuilt after apt_install(), apt_upgrade(),
+    apt_purge() and apt_update(), or if the dpkg status changes under it.
+    """
+    stamp = dpkg_status_stamp()
+    cached = _apt_caches.get(in_memory)
+    if cached and cached[0] == stamp:
+        _apt_cache_stats['hits'] += 1
+        return cached[1]
     from apt import apt_pkg
     apt_pkg.init()
     if in_memory:
         apt_pkg.config.set("Dir::Cache::pkgcache", "")
         apt_pkg.config.set("Dir::Cache::srcpkgcache", "")
-    return apt_pkg.Cache(progress)
+    cache = apt_pkg.Cache(progress)
+    _apt_caches[in_memory] = (stamp, cache)
+    _apt_cache_stats['builds'] += 1
+    return cache
+
+
+def invalidate_apt_cache():
+    """Drop the shared apt cache; the next apt_cache() call rebuilds it."""
+    if _apt_caches:
+        _apt_cache_stats['invalidations'] += 1
+        _apt_caches.clear()
+
+
+def apt_cache_stats():
+    """Return how often the shared apt cache was built, reused and dropped.
+
+    @returns dict with 'builds', 'hits' and 'invalidations' counts
+    """
+    return dict(_apt_cache_stats)
 
 
 def apt_install(packages, options=None, fatal=False):
-    """Install one or more packages."""
+    """Install one or more packages.
+
+    Packages staged by stage_local_packages() are installed from their
+    .deb files first, so that apt finds them installed rather than
+    fetching them from the archive as dependencies of the others.
+    """
     if options is None:
         options = ['--option=Dpkg::Options::=--force-confold']
 
-    cmd = ['apt-get', '--assume-yes']
-    cmd.extend(options)
-    cmd.append('install')
     if isinstance(packages, six.string_types):
-        cmd.append(packages)
-    else:
-        cmd.extend(packages)
-    log("Installing {} with options: {}".format(packages,
-                                                options))
+        packages = [packages]
+    packages = _with_local_packages(packages)
+    debs = [p for p in packages if p.endswith('.deb')]
+    packages = [p for p in packages if p not in debs]
+
+    try:
+        if debs:
+            _install_debs(debs, options, fatal)
+        if packages:
+            cmd = ['apt-get', '--assume-yes']
+            cmd.extend(options)
+            cmd.append('install')
+            cmd.extend(packages)
+            log("Installing {} with options: {}".format(packages,
+                                                        options))
+            _run_apt_command(cmd, fatal)
+    finally:
+        invalidate_apt_cache()
+
+
+def _install_debs(debs, options, fatal):
+    """Install .deb files with dpkg, then let apt install from the archive
+    whatever they depend on and was not among them.
+
+    apt-get only installs from files since apt 1.1, which trusty lacks.
+    """
+    dpkg_options = [o.split('=', 2)[2] for o in options
+                    if o.startswith('--option=Dpkg::Options::=')]
+    dpkg_cmd = ['dpkg', '--install'] + dpkg_options + debs
+    log("Installing {} with dpkg".format(debs))
+    result = _run_apt_command(dpkg_cmd)
+    if not result:
+        return
+    # dpkg leaves packages with missing dependencies unconfigured.
+    cmd = ['apt-get', '--assume-yes'] + options + ['--fix-broken', 'install']
+    log("Installing missing dependencies of {}".format(debs))
     _run_apt_command(cmd, fatal)
+    missing = [name for name, staged in local_packages().items()
+               if staged['path'] in debs and installed_version(name) is None]
+    if fatal and missing:
+        raise subprocess.CalledProcessError(result, dpkg_cmd)
+
+
+def stage_local_packages(resource='packages'):
+    """Unpack a charm resource of pre-downloaded packages.
+
+    The resource is a tarball of .deb files and the Packages index for
+    them, as written by ``dpkg-scanpackages . > Packages``. Once staged,
+    apt_install() installs the packages it finds there from the local
+    files, and only goes to the archive for anything else.
+
+    The resource is only unpacked again when it changes.
+
+    :param resource: str: name of the resource in metadata.yaml
+    :returns: int: the number of packages staged
+    """
+    global _local_packages
+    try:
+        path = resource_get(resource)
+    except OSError:
+        # resource-get is not available before Juju 2.0.
+        path = None
+    path = path.strip() if path else None
+    # An empty file is the placeholder attached at deploy time.
+    if not path or not os.path.getsize(path):
+        log('No {} resource to stage packages from'.format(resource),
+            level=DEBUG)
+        return 0
+
+    st = os.stat(path)
+    source = '{} {} {}'.format(path, st.st_mtime, st.st_size)
+    marker = os.path.join(LOCAL_PACKAGES_DIR, LOCAL_PACKAGES_SOURCE)
+    try:
+        with open(marker) as f:
+            if f.read() == source:
+                return len(local_packages())
+    except IOError:
+        pass
+
+    if os.path.isdir(LOCAL_PACKAGES_DIR):
+        shutil.rmtree(LOCAL_PACKAGES_DIR)
+    os.makedirs(LOCAL_PACKAGES_DIR)
+    with tarfile.open(path) as tar:
+        for member in tar.getmembers():
+            # Flatten the tarball, and never write outside the directory.
+            name = os.path.basename(member.name)
+            if not member.isfile() or not (
+                    name.endswith('.deb') or name == LOCAL_PACKAGES_INDEX):
+                continue
+            member.name = name
+            tar.extract(member, LOCAL_PACKAGES_DIR)
+    with open(marker, 'w') as f:
+        f.write(source)
+    _local_packages = None
+    staged = len(local_packages())
+    log('Staged {} packages from the {} resource'.format(staged, resource))
+    return staged
+
+
+def _dependency_names(depends):
+    """Return the package names in a Depends field.
+
+    Only the first of a set of alternatives is used.
+    """
+    names = []
+    for group in depends.split(','):
+        name = group.split('|')[0].split('(')[0].strip()
+        if name:
+            names.append(name.split(':')[0])
+    return names
+
+
+def local_packages():
+    """Return the packages staged by stage_local_packages().
+
+    @returns dict of package name to a dict with the 'version', 'path' of
+        the .deb file and the names it 'depends' on
+    """
+    global _local_packages
+    if _local_packages is not None:
+        return _local_packages
+    _local_packages = {}
+    index = os.path.join(LOCAL_PACKAGES_DIR, LOCAL_PACKAGES_INDEX)
+    if not os.path.exists(index):
+        return _local_packages
+    for fields in _read_stanzas(index, ('Package', 'Version', 'Filename',
+                                        'Depends', 'Pre-Depends')):
+        if 'Filename' not in fields:
+            continue
+        path = os.path.join(LOCAL_PACKAGES_DIR,
+                            os.path.basename(fields['Filename']))
+        if not os.path.exists(path):
+            continue
+        _local_packages[fields['Package']] = {
+            'version': fields.get('Version'),
+            'path': path,
+            'depends': _dependency_names(
+                fields.get('Pre-Depends', '') + ',' +
+                fields.get('Depends', '')),
+        }
+    return _local_packages
+
+
+def _with_local_packages(packages):
+    """Swap packages for their staged .deb files where there are any.
+
+    Staged dependencies that are not installed yet are added as well, so
+    apt only fetches from the archive what was not staged.
+    """
+    local = local_packages()
+    if not local:
+        return packages
+    result = []
+    pending = []
+    for package in packages:
+        name, sep, version = package.partition('=')
+        staged = local.get(name)
+        if (staged and installed_version(name) is None and
+                (not sep or staged['version'] == version)):
+            pending.append(name)
+        else:
+            result.append(package)
+    seen = set()
+    while pending:
+        name = pending.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        result.append(local[name]['path'])
+        pending.extend(dep for dep in local[name]['depends']
+                       if dep in local and installed_version(dep) is None)
+    return result
+
+
+def queue_apt_install(packages, options=None, fatal=False):
+    """Install packages at the end of the hook, if installs are batched.
+
+    Use this rather than apt_install() only for packages nothing needs
+    until the hook is over; apt_install() always installs straight away.
+    Without :func:`batch_apt_installs` the packages are installed now.
+    """
+    if _install_plan is None:
+        apt_install(packages, options, fatal)
+        return
+    if options is None:
+        options = ['--option=Dpkg::Options::=--force-confold']
+    if isinstance(packages, six.string_types):
+        packages = [packages]
+    plan = _install_plan.setdefault(tuple(options),
+                                    {'packages': [], 'fatal': False})
+    plan['packages'].extend(p for p in packages
+                            if p not in plan['packages'])
+    plan['fatal'] = plan['fatal'] or fatal
+    log("Queued {} for install".format(packages), level=DEBUG)
+
+
+def batch_apt_installs():
+    """Defer queue_apt_install calls until the end of the hook.
+
+    Packages queued with the same options are installed by a single
+    apt-get transaction from :func:`commit_apt_installs`, which runs from
+    the hook's atexit callbacks. Packages that are already installed (at
+    the version requested, for 'name=version') are left out, so re-running
+    a hook does not run apt-get at all.
+
+    apt_install() is not affected: its callers may import what they
+    installed straight away. Installs still pending when a hook fails are
+    dropped.
+    """
+    global _install_plan
+    if _install_plan is None:
+        _install_plan = OrderedDict()
+        atexit(commit_apt_installs)
+
+
+def _install_satisfied(package):
+    """Return True if package, or 'package=version', is installed."""
+    name, sep, version = package.partition('=')
+    installed = installed_version(name)
+    if installed is None:
+        return False
+    return not sep or installed == version
+
+
+def commit_apt_installs():
+    """Install queued packages and stop batching."""
+    global _install_plan
+    plan, _install_plan = _install_plan, None
+    if not plan:
+        return
+    for options, queued in plan.items():
+        required = [p for p in queued['packages']
+                    if not _install_satisfied(p)]
+        if required:
+            apt_install(required, list(options), queued['fatal'])
+        else:
+            log('Skipping apt-get install: {} already installed'.format(
+                queued['packages']), level=DEBUG)
 
 
 def apt_upgrade(options=None, fatal=False, dist=False):
@@ -228,13 +533,66 @@ def apt_upgrade(options=None, fatal=False, dist=False):
     else:
         cmd.append('upgrade')
     log("Upgrading with options: {}".format(options))
-    _run_apt_command(cmd, fatal)
+    try:
+        _run_apt_command(cmd, fatal)
+    finally:
+        invalidate_apt_cache()
+
+
+def _newest_mtime(paths, skip=()):
+    """Return the newest mtime of paths and, for directories, their files.
 
+    @returns mtime, or None if there is nothing to stat
+    """
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime)
+        except OSError:
+            continue
+        if not os.path.isdir(path):
+            continue
+        for name in os.listdir(path):
+            child = os.path.join(path, name)
+            if name in skip or os.path.isdir(child):
+                continue
+            try:
+                mtimes.append(os.stat(child).st_mtime)
+            except OSError:
+                pass
+    return max(mtimes) if mtimes else None
+
+
+def apt_lists_fresh(max_age=APT_LISTS_MAX_AGE):
+    """Return True if the package lists are newer than every apt source,
+    and were updated less than max_age seconds ago.
+
+    Directories count as well as the files in them, so removing a source
+    from sources.list.d makes the lists stale.
+    """
+    lists = _newest_mtime([APT_LISTS_DIR], skip=('lock',))
+    sources = _newest_mtime(glob.glob(APT_SOURCES))
+    if lists is None or sources is None:
+        return False
+    return lists > sources and 0 <= time.time() - lists < max_age
 
-def apt_update(fatal=False):
-    """Update local apt cache."""
+
+def apt_update(fatal=False, skip_fresh=False):
+    """Update local apt cache.
+
+    With skip_fresh, the update is skipped if apt_lists_fresh(): the
+    package lists are newer than the apt sources and less than
+    APT_LISTS_MAX_AGE old.
+    """
+    if skip_fresh and apt_lists_fresh():
+        log('Skipping apt-get update: package lists are up to date',
+            level=DEBUG)
+        return
     cmd = ['apt-get', 'update']
-    _run_apt_command(cmd, fatal)
+    try:
+        _run_apt_command(cmd, fatal)
+    finally:
+        invalidate_apt_cache()
 
 
 def apt_purge(packages, fatal=False):
@@ -245,7 +603,10 @@ def apt_purge(packages, fatal=False):
     else:
         cmd.extend(packages)
     log("Purging {}".format(packages))
-    _run_apt_command(cmd, fatal)
+    try:
+        _run_apt_command(cmd, fatal)
+    finally:
+        invalidate_apt_cache()
 
 
 def apt_mark(packages, mark, fatal=False):
@@ -551,42 +912,259 @@ def _run_with_retries(cmd, max_retries=CMD_RETRY_COUNT, retry_exitcodes=(1,),
             time.sleep(CMD_RETRY_DELAY)
 
 
-def _run_apt_command(cmd, fatal=False):
-    """Run an apt command with optional retries.
+def dpkg_lock_held():
+    """Return True if another process holds one of the dpkg locks.
+
+    The locks are only tested (F_GETLK), never taken, so apt or dpkg run
+    by another charm at the same time is not locked out by the check.
+    """
+    for path in DPKG_LOCKS:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            # Missing, or not ours to read; apt will report either.
+            continue
+        try:
+            flock = struct.pack(DPKG_FLOCK_FORMAT, fcntl.F_WRLCK, os.SEEK_SET,
+                                0, 0, 0)
+            flock = fcntl.fcntl(fd, fcntl.F_GETLK, flock)
+        finally:
+            os.close(fd)
+        if struct.unpack(DPKG_FLOCK_FORMAT, flock)[0] != fcntl.F_UNLCK:
+            return True
+    return False
+
+
+def wait_for_dpkg_lock(deadline):
+    """Wait until no other process holds the dpkg locks.
+
+    :param: deadline: float: time.time() at which to give up.
+    :returns: bool: True if the locks are free, False if deadline passed.
+    """
+    if not dpkg_lock_held():
+        return True
+    log('Waiting for another process to release the dpkg lock', level=DEBUG)
+    start = time.time()
+    free = False
+    while time.time() < deadline:
+        time.sleep(min(DPKG_LOCK_POLL, deadline - time.time()))
+        if not dpkg_lock_held():
+            free = True
+            break
+    waited = time.time() - start
+    _apt_run_stats['lock-waits'] += 1
+    _apt_run_stats['lock-wait-time'] += waited
+    log('Waited {:.1f}s for the dpkg lock'.format(waited), level=DEBUG)
+    return free
+
+
+def apt_run_stats():
+    """Return the time apt commands took, and spent waiting for the lock.
+
+    @returns dict with 'runs', 'run-time', 'lock-waits' and 'lock-wait-time'
+    """
+    return dict(_apt_run_stats)
+
+
+def _run_apt_command(cmd, fatal=False, timeout=None):
+    """Run an apt command once the dpkg lock is free.
+
+    Rather than sleeping a fixed time when apt cannot take the lock, wait
+    for its holder to release it and run again straight away. Only fatal
+    commands are run again, and only when they failed for want of the lock.
 
     :param: cmd: str: The apt command to run.
     :param: fatal: bool: Whether the command's output should be checked and
         retried.
+    :param: timeout: int: Seconds to give up after; defaults to
+        DPKG_LOCK_TIMEOUT.
+    :returns: int: the exit code of a non-fatal command
     """
     # Provide DEBIAN_FRONTEND=noninteractive if not present in the environment.
-    cmd_env = {
-        'DEBIAN_FRONTEND': os.environ.get('DEBIAN_FRONTEND', 'noninteractive')}
+    env = os.environ.copy()
+    env.setdefault('DEBIAN_FRONTEND', 'noninteractive')
+    if timeout is None:
+        timeout = DPKG_LOCK_TIMEOUT
+    deadline = time.time() + timeout
 
-    if fatal:
-        _run_with_retries(
-            cmd, cmd_env=cmd_env, retry_exitcodes=(1, APT_NO_LOCK,),
-            retry_message="Couldn't acquire DPKG lock")
-    else:
-        env = os.environ.copy()
-        env.update(cmd_env)
-        subprocess.call(cmd, env=env)
+    retry_count = 0
+    while True:
+        if not wait_for_dpkg_lock(deadline):
+            log("Timed out after {}s waiting for the dpkg lock to run "
+                "'{}'".format(timeout, " ".join(cmd)), level=WARNING)
+            if fatal:
+                raise subprocess.CalledProcessError(APT_NO_LOCK, cmd)
+            return APT_NO_LOCK
+        start = time.time()
+        proc = subprocess.Popen(cmd, env=env, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        _, err = proc.communicate()
+        result = proc.returncode
+        sys.stderr.write(err)
+        _apt_run_stats['runs'] += 1
+        _apt_run_stats['run-time'] += time.time() - start
+        if result == 0 or not fatal:
+            return result
+        if (result == APT_NO_LOCK and time.time() < deadline and
+                (APT_NO_LOCK_MESSAGE in err or dpkg_lock_held())):
+            # Another process took the lock first; wait for it again. The
+            # pause covers locks we cannot probe, eg. when not run as root.
+            time.sleep(DPKG_LOCK_POLL)
+            continue
+        retry_count += 1
+        if result != 1 or retry_count > CMD_RETRY_COUNT:
+            raise subprocess.CalledProcessError(result, cmd)
+        log("Failed executing '{}'. Will retry in {} seconds".format(
+            " ".join(cmd), CMD_RETRY_DELAY))
+        time.sleep(CMD_RETRY_DELAY)
+
+
+def dpkg_status_stamp():
+    """Return the mtime and size of the dpkg status file.
+
+    Anything derived from the installed packages can be cached against
+    this; it changes whenever dpkg changes the state of a package.
+
+    @returns (mtime, size) or None if the status file cannot be read
+    """
+    try:
+        st = os.stat(DPKG_STATUS)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
 
 
-def get_upstream_version(package):
-    """Determine upstream version based on installed package
+def _dpkg_index_path():
+    """Return the path of the persisted dpkg status index.
 
-    @returns None (if not installed) or the upstream version
+    It is kept next to the unit state database (see core.unitdata).
+
+    @returns None when there is no unit state directory to keep it in, eg.
+             outside a hook or with an in-memory database
     """
-    import apt_pkg
-    cache = apt_cache()
-    try:
-        pkg = cache[package]
-    except Exception:
-        # the package is unknown to the current apt cache.
+    db_path = os.environ.get('UNIT_STATE_DB')
+    if db_path is None and os.environ.get('CHARM_DIR'):
+        db_path = os.path.join(os.environ['CHARM_DIR'], '.unit-state.db')
+    if not db_path or db_path == ':memory:' or not os.path.dirname(db_path):
         return None
+    return os.path.join(os.path.dirname(db_path), DPKG_INDEX_FILE)
+
+
+def _read_stanzas(path, keys):
+    """Stream the stanzas of a Debian control file, eg. dpkg's status.
+
+    Only single line fields named in keys are kept.
+
+    @returns generator of dicts of field name to value
+    """
+    fields = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                if fields:
+                    yield fields
+                fields = {}
+            elif line[0] not in ' \t':
+                key, sep, value = line.partition(':')
+                if key in keys:
+                    fields[key] = value.strip()
+    if fields:
+        yield fields
+
+
+def _parse_dpkg_status(path=None):
+    """Stream a dpkg status file, keeping only what the index needs.
+
+    @returns dict of package name to [state, version], where state is the
+        current state field of Status, eg. 'installed' or 'config-files'
+    """
+    packages = {}
+    for fields in _read_stanzas(path or DPKG_STATUS,
+                                ('Package', 'Status', 'Version')):
+        name = fields.get('Package')
+        state = fields.get('Status', '').split()[-1:]
+        if not name or not state:
+            continue
+        # Multi-arch packages have a stanza per architecture; prefer one
+        # that has a version unpacked, as apt's current_ver does.
+        if name in packages and packages[name][0] not in DPKG_UNINSTALLED:
+            continue
+        packages[name] = [state[0], fields.get('Version')]
+    return packages
+
+
+def _persist_dpkg_index(index, path):
+    tmp = '{}.{}'.format(path, os.getpid())
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        log('Unable to persist dpkg status index to {}'.format(path),
+            level='DEBUG')
+
 
-    if not pkg.current_ver:
-        # package is known, but no version is currently installed.
+def dpkg_status_index():
+    """Return the name, state and version of every package dpkg knows.
+
+    This answers "is it installed?" and "which version?" without loading
+    apt_pkg. The index is persisted next to the unit state database, when
+    there is one, and only rebuilt when the dpkg status file changes.
+
+    @returns dict of package name to [state, version]
+    """
+    stamp = dpkg_status_stamp()
+    if stamp is None:
+        return {}
+    stamp = list(stamp)
+    if _dpkg_index.get('stamp') == stamp:
+        return _dpkg_index['packages']
+    path = _dpkg_index_path()
+    index = None
+    if path is not None:
+        try:
+            with open(path) as f:
+                index = json.load(f)
+            if index.get('stamp') != stamp:
+                index = None
+        except (IOError, OSError, ValueError):
+            index = None
+    if index is None:
+        index = {'stamp': stamp, 'packages': _parse_dpkg_status()}
+        if path is not None:
+            _persist_dpkg_index(index, path)
+    _dpkg_index.clear()
+    _dpkg_index.update(index)
+    return index['packages']
+
+
+def installed_version(package):
+    """Return the full version of an installed package.
+
+    @returns None (if not installed) or the version, eg. '2:13.0.1-0ubuntu1'
+    """
+    state, version = dpkg_status_index().get(package, (None, None))
+    if state is None or state in DPKG_UNINSTALLED:
         return None
+    return version
+
+
+def upstream_version(version):
+    """Return the upstream part of a Debian version string.
+
+    This matches apt_pkg.upstream_version(): everything up to the first
+    ':' (the epoch) and from the last '-' (the Debian revision) is dropped.
+    """
+    version = version.split(':', 1)[-1]
+    return version.rsplit('-', 1)[0]
+
 
-    return apt_pkg.upstream_version(pkg.current_ver.ver_str)
+def get_upstream_version(package):
+    """Determine upstream version based on installed package
+
+    @returns None (if not installed) or the upstream version
+    """
+    version = installed_version(package)
+    if version is None:
+        return None
+    return upstream_version(version)
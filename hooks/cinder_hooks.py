@@ -20,20 +20,22 @@ import json
 import uuid
 
 from cinder_utils import (
+    forget_status_inputs,
+    record_status_inputs,
     register_configs,
     restart_map,
     scrub_old_style_ceph,
+    status_inputs_changed,
     PACKAGES,
     REQUIRED_INTERFACES,
     VERSION_PACKAGE,
 )
-from cinder_contexts import CephSubordinateContext
-from charmhelpers.contrib.openstack.context import CephContext
 
 from charmhelpers.core.hookenv import (
     Hooks,
     UnregisteredHookError,
     config,
+    hook_name,
     service_name,
     relation_set,
     relation_ids,
@@ -42,28 +44,50 @@ from charmhelpers.core.hookenv import (
     leader_get,
     leader_set,
     is_leader,
+    batch_relation_writes,
 )
-from charmhelpers.fetch import apt_install, apt_update
 from charmhelpers.core.host import (
     restart_on_change,
     service_restart,
 )
-from charmhelpers.contrib.storage.linux.ceph import (
-    send_request_if_needed,
-    is_request_complete,
-    ensure_ceph_keyring,
-    CephBrokerRq,
-    delete_keyring,
-)
+from charmhelpers.core import profiler
+from charmhelpers.core.lazy import lazy_callable
 from charmhelpers.payload.execd import execd_preinstall
-from charmhelpers.contrib.openstack.utils import (
-    set_os_workload_status,
-    os_application_version_set,
-)
+
+# NOTE: every hook imports this module; defer the helpers that pull in
+#       the apt bindings, jinja2, netaddr, netifaces, psutil and dnspython
+#       until a handler calls them.
+CephSubordinateContext = lazy_callable('cinder_contexts',
+                                       'CephSubordinateContext')
+CephContext = lazy_callable('charmhelpers.contrib.openstack.context',
+                            'CephContext')
+queue_apt_install = lazy_callable('charmhelpers.fetch', 'queue_apt_install')
+apt_update = lazy_callable('charmhelpers.fetch', 'apt_update')
+batch_apt_installs = lazy_callable('charmhelpers.fetch', 'batch_apt_installs')
+stage_local_packages = lazy_callable('charmhelpers.fetch',
+                                     'stage_local_packages')
+send_request_if_needed = lazy_callable(
+    'charmhelpers.contrib.storage.linux.ceph', 'send_request_if_needed')
+is_request_complete = lazy_callable(
+    'charmhelpers.contrib.storage.linux.ceph', 'is_request_complete')
+ensure_ceph_keyring = lazy_callable(
+    'charmhelpers.contrib.storage.linux.ceph', 'ensure_ceph_keyring')
+CephBrokerRq = lazy_callable(
+    'charmhelpers.contrib.storage.linux.ceph', 'CephBrokerRq')
+delete_keyring = lazy_callable(
+    'charmhelpers.contrib.storage.linux.ceph', 'delete_keyring')
+set_os_workload_status = lazy_callable(
+    'charmhelpers.contrib.openstack.utils', 'set_os_workload_status')
+os_application_version_set = lazy_callable(
+    'charmhelpers.contrib.openstack.utils', 'os_application_version_set')
 
 
 hooks = Hooks()
 
+# NOTE: opt-in profiling of hook tool and ceph command runs; enabled
+#       before register_configs() so its commands are included.
+profiler.enable_if_requested()
+
 CONFIGS = register_configs()
 
 
@@ -72,8 +96,9 @@ def install():
     status_set('maintenance', 'Executing pre-install')
     execd_preinstall()
     status_set('maintenance', 'Installing apt packages')
-    apt_update(fatal=True)
-    apt_install(PACKAGES, fatal=True)
+    stage_local_packages()
+    apt_update(fatal=True, skip_fresh=True)
+    queue_apt_install(PACKAGES, fatal=True)
 
 
 @hooks.hook('ceph-relation-joined')
@@ -219,10 +244,44 @@ def ceph_access_joined(relation_id=None):
     )
 
 
-if __name__ == '__main__':
+@hooks.hook('update-status')
+def update_status():
+    # NOTE: the workload status is assessed on the way out of every hook.
+    pass
+
+
+def assess_status():
+    set_os_workload_status(CONFIGS, REQUIRED_INTERFACES)
+    os_application_version_set(VERSION_PACKAGE)
+    record_status_inputs()
+
+
+def main(args):
+    # NOTE: update-status runs every few minutes on every unit; unless an
+    #       input to the status changed since it was last set, there is
+    #       nothing to evaluate or write.
+    if hook_name() == 'update-status':
+        if not status_inputs_changed():
+            sys.exit(0)
+    else:
+        # NOTE: any other hook may set a status and then fail, after which
+        #       the recorded inputs still match; forget them so the next
+        #       update-status sets the status again.
+        forget_status_inputs()
+    # NOTE: ceph_changed and leader_settings_changed fan out to every
+    #       storage-backend and ceph-access relation; coalesce the writes
+    #       so each relation sees at most one relation-set per hook.
+    batch_relation_writes()
+    # NOTE: packages install() queues are installed, if any are missing,
+    #       in one apt-get transaction once the hook succeeds. apt_install
+    #       calls elsewhere still install straight away.
+    batch_apt_installs()
     try:
-        hooks.execute(sys.argv)
+        hooks.execute(args)
     except UnregisteredHookError as e:
         log('Unknown hook {} - skipping.'.format(e))
-    set_os_workload_status(CONFIGS, REQUIRED_INTERFACES)
-    os_application_version_set(VERSION_PACKAGE)
+    assess_status()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
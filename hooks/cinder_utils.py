@@ -14,6 +14,8 @@
 
 from __future__ import print_function
 
+import hashlib
+import json
 import os
 import re
 
@@ -22,21 +24,27 @@ from tempfile import NamedTemporaryFile
 
 
 from charmhelpers.core.hookenv import (
+    relation_get,
     relation_ids,
+    related_units,
     service_name,
 )
 
-from charmhelpers.contrib.openstack import (
-    templating,
-    context,
+from charmhelpers.core.host import mkdir
+from charmhelpers.core.unitdata import kv
+from charmhelpers.core.lazy import (
+    lazy_callable,
+    lazy_module,
 )
 
-from charmhelpers.contrib.openstack.utils import (
-    get_os_codename_package,
-)
-
-from charmhelpers.contrib.openstack.alternatives import install_alternative
-from charmhelpers.core.host import mkdir
+# NOTE: these pull in jinja2, netaddr, netifaces, psutil and the apt
+#       bindings; only load them once configs are actually registered.
+templating = lazy_module('charmhelpers.contrib.openstack.templating')
+context = lazy_module('charmhelpers.contrib.openstack.context')
+get_os_codename_package = lazy_callable(
+    'charmhelpers.contrib.openstack.utils', 'get_os_codename_package')
+install_alternative = lazy_callable(
+    'charmhelpers.contrib.openstack.alternatives', 'install_alternative')
 
 
 PACKAGES = [
@@ -49,6 +57,15 @@ REQUIRED_INTERFACES = {
     'ceph': ['ceph'],
 }
 
+# ceph relation settings that decide whether the ceph context is complete.
+CEPH_STATUS_KEYS = ('auth', 'key', 'ceph-public-address', 'private-address')
+
+DPKG_STATUS = '/var/lib/dpkg/status'
+
+# unitdata key holding the fingerprint of the status inputs as of the last
+# time the workload status and application version were set.
+STATUS_FINGERPRINT_KEY = 'cinder-ceph.status-fingerprint'
+
 CHARM_CEPH_CONF = '/var/lib/charm/{}/ceph.conf'
 CEPH_CONF = '/etc/ceph/ceph.conf'
 
@@ -63,44 +80,92 @@ def ceph_config_file():
     return CHARM_CEPH_CONF.format(service_name())
 
 
+class LazyConfigRenderer(object):
+    """Stand-in for the OSConfigRenderer returned by register_configs().
+
+    The renderer and its contexts are only built when first used, eg. for
+    complete_contexts() at the end of a hook. Looking up the installed
+    OpenStack release (which builds an apt cache), creating the config
+    directories and installing the ceph.conf alternative are further
+    deferred until a config is rendered or written.
+    """
+
+    # Renderer attributes that need the release and the config directories.
+    RENDER_ATTRS = ('openstack_release', 'render', 'set_release', 'write',
+                    'write_all')
+
+    def __init__(self, confs):
+        self._confs = confs
+        self._configs = None
+        self._prepared = False
+
+    def _renderer(self):
+        if self._configs is None:
+            configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
+                                                  openstack_release=None)
+            for conf in self._confs:
+                CONFIG_FILES[conf]['hook_contexts'] = hook_contexts(conf)
+                configs.register(conf, CONFIG_FILES[conf]['hook_contexts'])
+            self._configs = configs
+        return self._configs
+
+    def _prepare(self):
+        configs = self._renderer()
+        if self._prepared:
+            return
+        # if called without anything installed (eg during install hook)
+        # just default to earliest supported release. configs dont get
+        # touched till post-install, anyway.
+        release = (get_os_codename_package('cinder-common', fatal=False) or
+                   'folsom')
+        configs.set_release(release)
+        if ceph_config_file() in self._confs:
+            # Ensure charm ceph configuration directory actually exists
+            mkdir(os.path.dirname(ceph_config_file()))
+            mkdir(os.path.dirname(CEPH_CONF))
+            # Install ceph config as an alternative for co-location with
+            # ceph and ceph-osd charms - nova-compute ceph.conf will be
+            # lower priority that both of these but thats OK
+            if not os.path.exists(ceph_config_file()):
+                # touch file for pre-templated generation
+                open(ceph_config_file(), 'w').close()
+            install_alternative(os.path.basename(CEPH_CONF),
+                                CEPH_CONF, ceph_config_file())
+        self._prepared = True
+
+    def __getattr__(self, attr):
+        if attr in self.RENDER_ATTRS:
+            self._prepare()
+        return getattr(self._renderer(), attr)
+
+
+def hook_contexts(conf):
+    """Return the context generators for a config file."""
+    if conf == ceph_config_file():
+        return [context.CephContext()]
+    return []
+
+
 def register_configs():
     """
     Register config files with their respective contexts.
     Regstration of some configs may not be required depending on
     existing of certain relations.
-    """
-    # if called without anything installed (eg during install hook)
-    # just default to earliest supported release. configs dont get touched
-    # till post-install, anyway.
-    release = get_os_codename_package('cinder-common', fatal=False) or 'folsom'
-    configs = templating.OSConfigRenderer(templates_dir=TEMPLATES,
-                                          openstack_release=release)
 
+    The files and their services are recorded in CONFIG_FILES straight
+    away, for restart_map(); everything else is left to the returned
+    LazyConfigRenderer.
+    """
     confs = []
 
     if relation_ids('ceph'):
-        # Add charm ceph configuration to resources and
-        # ensure directory actually exists
-        mkdir(os.path.dirname(ceph_config_file()))
-        mkdir(os.path.dirname(CEPH_CONF))
-        # Install ceph config as an alternative for co-location with
-        # ceph and ceph-osd charms - nova-compute ceph.conf will be
-        # lower priority that both of these but thats OK
-        if not os.path.exists(ceph_config_file()):
-            # touch file for pre-templated generation
-            open(ceph_config_file(), 'w').close()
-        install_alternative(os.path.basename(CEPH_CONF),
-                            CEPH_CONF, ceph_config_file())
+        # Add charm ceph configuration to resources
         CONFIG_FILES[ceph_config_file()] = {
-            'hook_contexts': [context.CephContext()],
             'services': ['cinder-volume'],
         }
         confs.append(ceph_config_file())
 
-    for conf in confs:
-        configs.register(conf, CONFIG_FILES[conf]['hook_contexts'])
-
-    return configs
+    return LazyConfigRenderer(confs)
 
 
 def restart_map():
@@ -137,3 +202,50 @@ def scrub_old_style_ceph():
                 if not ceph_match(line):
                     print(line, end='', file=outfile)
             os.rename(outfile.name, input_file.name)
+
+
+def status_fingerprint():
+    """Return a digest of the inputs to the workload status.
+
+    Covers the required relations, the ceph settings that decide whether
+    they are complete, the paused flag and, for the application version,
+    the dpkg status file's mtime.
+    """
+    relations = []
+    for names in sorted(REQUIRED_INTERFACES.values()):
+        for name in names:
+            for rid in relation_ids(name):
+                units = []
+                for unit in related_units(rid):
+                    data = relation_get(rid=rid, unit=unit) or {}
+                    units.append([unit, [data.get(k)
+                                         for k in CEPH_STATUS_KEYS]])
+                relations.append([rid, units])
+    try:
+        dpkg_mtime = os.stat(DPKG_STATUS).st_mtime
+    except OSError:
+        dpkg_mtime = None
+    inputs = [relations, bool(kv().get('unit-paused')), dpkg_mtime]
+    return hashlib.sha256(
+        json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def status_inputs_changed():
+    """Whether the status inputs changed since the status was last set."""
+    return kv().get(STATUS_FINGERPRINT_KEY) != status_fingerprint()
+
+
+def record_status_inputs():
+    """Record the status inputs the workload status was just set for."""
+    db = kv()
+    db.set(STATUS_FINGERPRINT_KEY, status_fingerprint())
+    db.flush()
+
+
+def forget_status_inputs():
+    """Forget the recorded status inputs, so the next update-status sets
+    the workload status whether or not they changed."""
+    db = kv()
+    if db.get(STATUS_FINGERPRINT_KEY) is not None:
+        db.unset(STATUS_FINGERPRINT_KEY)
+        db.flush()
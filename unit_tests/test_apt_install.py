@@ -0,0 +1,143 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from mock import call, patch
+
+import charmhelpers.fetch.ubuntu as fetch
+
+OPTIONS = ['--option=Dpkg::Options::=--force-confold']
+
+INSTALLED = {
+    'ceph-common': '12.2.4-0ubuntu1',
+    'libc6': '2.27-3ubuntu1',
+}
+
+
+class QueuedInstallTests(unittest.TestCase):
+
+    def setUp(self):
+        self.exit_callbacks = []
+        for target, kwargs in (
+                ('_install_plan', {'new': None}),
+                ('log', {}),
+                ('atexit', {'new': self.exit_callbacks.append}),
+                ('installed_version', {'side_effect': INSTALLED.get}),
+                ('apt_install', {})):
+            patcher = patch.object(fetch, target, **kwargs)
+            setattr(self, target.strip('_'), patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def test_installed_now_without_batching(self):
+        fetch.queue_apt_install('python-rbd', fatal=True)
+        self.apt_install.assert_called_once_with('python-rbd', None, True)
+
+    def test_queued_installs_merged(self):
+        fetch.batch_apt_installs()
+        fetch.batch_apt_installs()
+        fetch.queue_apt_install(['python-rados', 'python-rbd'])
+        fetch.queue_apt_install(['python-rbd', 'ceph-fuse'], fatal=True)
+        fetch.queue_apt_install('qemu-utils',
+                                options=['--no-install-recommends'])
+        self.apt_install.assert_not_called()
+        self.assertEqual(self.exit_callbacks, [fetch.commit_apt_installs])
+        fetch.commit_apt_installs()
+        self.assertEqual(self.apt_install.call_args_list, [
+            call(['python-rados', 'python-rbd', 'ceph-fuse'], OPTIONS, True),
+            call(['qemu-utils'], ['--no-install-recommends'], False),
+        ])
+        # Batching stops once the queue is committed.
+        fetch.queue_apt_install('lvm2')
+        self.apt_install.assert_called_with('lvm2', None, False)
+
+    def test_satisfied_packages_dropped(self):
+        fetch.batch_apt_installs()
+        fetch.queue_apt_install(['ceph-common', 'python-rbd',
+                                 'libc6=2.27-3ubuntu1',
+                                 'ceph-common=13.2.1-0ubuntu1'])
+        fetch.commit_apt_installs()
+        self.apt_install.assert_called_once_with(
+            ['python-rbd', 'ceph-common=13.2.1-0ubuntu1'], OPTIONS, False)
+
+    def test_nothing_to_install(self):
+        fetch.batch_apt_installs()
+        fetch.queue_apt_install(['ceph-common', 'libc6'], fatal=True)
+        fetch.commit_apt_installs()
+        self.apt_install.assert_not_called()
+
+
+class AptListsFreshTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.lists = os.path.join(self.tmp, 'lists')
+        os.mkdir(self.lists)
+        self.sources = os.path.join(self.tmp, 'sources.list')
+        for path in (os.path.join(self.lists, 'lock'),
+                     os.path.join(self.lists, 'archive_Packages'),
+                     self.sources):
+            open(path, 'w').close()
+        self.now = time.time()
+        self.age(self.sources, 7200)
+        self.age(self.lists, 3600)
+        self.age(os.path.join(self.lists, 'archive_Packages'), 3600)
+        for target, kwargs in (
+                ('APT_LISTS_DIR', {'new': self.lists}),
+                ('APT_SOURCES', {'new': self.sources + '*'}),
+                ('log', {}),
+                ('_run_apt_command', {'return_value': 0})):
+            patcher = patch.object(fetch, target, **kwargs)
+            setattr(self, target.strip('_'), patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def age(self, path, seconds):
+        mtime = self.now - seconds
+        os.utime(path, (mtime, mtime))
+
+    def test_fresh(self):
+        self.assertTrue(fetch.apt_lists_fresh())
+        fetch.apt_update(skip_fresh=True)
+        self.run_apt_command.assert_not_called()
+
+    def test_source_changed(self):
+        self.age(self.sources, 60)
+        self.assertFalse(fetch.apt_lists_fresh())
+        fetch.apt_update(fatal=True, skip_fresh=True)
+        self.run_apt_command.assert_called_once_with(['apt-get', 'update'],
+                                                     True)
+
+    def test_too_old(self):
+        self.assertFalse(fetch.apt_lists_fresh(max_age=1800))
+        self.age(self.sources, fetch.APT_LISTS_MAX_AGE + 7200)
+        for path in (self.lists,
+                     os.path.join(self.lists, 'archive_Packages')):
+            self.age(path, fetch.APT_LISTS_MAX_AGE + 3600)
+        self.assertFalse(fetch.apt_lists_fresh())
+        # The lock is touched by every apt run, not only by updates.
+        self.age(os.path.join(self.lists, 'lock'), 0)
+        self.assertFalse(fetch.apt_lists_fresh())
+        fetch.apt_update(skip_fresh=True)
+        self.run_apt_command.assert_called_once_with(['apt-get', 'update'],
+                                                     False)
+
+    def test_updated_unless_asked_to_skip(self):
+        fetch.apt_update()
+        self.run_apt_command.assert_called_once_with(['apt-get', 'update'],
+                                                     False)
@@ -0,0 +1,161 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import fcntl
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+import charmhelpers.fetch.ubuntu as fetch
+
+LOCK_MESSAGE = ('E: Could not get lock /var/lib/dpkg/lock-frontend - open '
+                '(11: Resource temporarily unavailable)\n')
+
+
+class FakeClock(object):
+    """Stands in for the time module; sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def flock(l_type):
+    return struct.pack(fetch.DPKG_FLOCK_FORMAT, l_type, os.SEEK_SET, 0, 0,
+                       1234 if l_type != fcntl.F_UNLCK else 0)
+
+
+class DpkgLockTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.locks = [os.path.join(self.tmp, name)
+                      for name in ('lock-frontend', 'lock')]
+        for path in self.locks:
+            open(path, 'w').close()
+        self.clock = FakeClock()
+        self.held = []
+        self.runs = []
+        self.results = []
+        for target, value in (
+                ('charmhelpers.fetch.ubuntu.DPKG_LOCKS', self.locks),
+                ('charmhelpers.fetch.ubuntu.time', self.clock),
+                ('charmhelpers.fetch.ubuntu.log', MagicMock()),
+                ('charmhelpers.fetch.ubuntu.sys.stderr', MagicMock()),
+                ('charmhelpers.fetch.ubuntu._apt_run_stats',
+                 {'runs': 0, 'run-time': 0.0,
+                  'lock-waits': 0, 'lock-wait-time': 0.0}),
+                ('charmhelpers.fetch.ubuntu.fcntl.fcntl', self.fcntl),
+                ('charmhelpers.fetch.ubuntu.subprocess.Popen', self.popen)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fcntl(self, fd, cmd, arg):
+        self.assertEqual(cmd, fcntl.F_GETLK)
+        held = self.held.pop(0) if self.held else False
+        return flock(fcntl.F_WRLCK if held else fcntl.F_UNLCK)
+
+    def popen(self, cmd, **kwargs):
+        self.runs.append(cmd)
+        returncode, err = self.results.pop(0)
+        proc = MagicMock(returncode=returncode)
+        proc.communicate.return_value = (None, err)
+        self.clock.now += 2
+        return proc
+
+
+class DpkgLockHeldTests(DpkgLockTestCase):
+
+    def test_free(self):
+        self.assertFalse(fetch.dpkg_lock_held())
+
+    def test_held(self):
+        self.held = [False, True]
+        self.assertTrue(fetch.dpkg_lock_held())
+
+    def test_unreadable_lock_skipped(self):
+        os.unlink(self.locks[0])
+        self.held = [True]
+        self.assertTrue(fetch.dpkg_lock_held())
+        os.unlink(self.locks[1])
+        self.assertFalse(fetch.dpkg_lock_held())
+
+
+class RunAptCommandTests(DpkgLockTestCase):
+
+    def test_retried_when_lock_taken(self):
+        self.results = [(100, LOCK_MESSAGE), (0, '')]
+        self.assertEqual(fetch._run_apt_command(['apt-get', 'update'],
+                                                fatal=True), 0)
+        self.assertEqual(len(self.runs), 2)
+        self.assertEqual(fetch.apt_run_stats(), {
+            'runs': 2, 'run-time': 4.0,
+            'lock-waits': 0, 'lock-wait-time': 0.0})
+
+    def test_retried_when_lock_held(self):
+        # When not run as root, apt reports a different error, but the probe
+        # still sees the lock.
+        self.results = [(100, 'E: Unable to lock directory\n'), (0, '')]
+        self.held = [False, False, True, True, False, False]
+        fetch._run_apt_command(['apt-get', 'update'], fatal=True)
+        self.assertEqual(len(self.runs), 2)
+        stats = fetch.apt_run_stats()
+        self.assertEqual(stats['lock-waits'], 1)
+        self.assertEqual(stats['lock-wait-time'], fetch.DPKG_LOCK_POLL)
+
+    def test_failed_without_lock(self):
+        self.results = [(100, 'E: Unable to correct problems\n')]
+        with self.assertRaises(fetch.subprocess.CalledProcessError) as e:
+            fetch._run_apt_command(['apt-get', 'install', 'x'], fatal=True)
+        self.assertEqual(e.exception.returncode, 100)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_non_fatal_run_once(self):
+        self.results = [(100, LOCK_MESSAGE)]
+        self.assertEqual(fetch._run_apt_command(['apt-get', 'update']), 100)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_deadline_exceeded(self):
+        self.held = [True] * 1000
+        with self.assertRaises(fetch.subprocess.CalledProcessError) as e:
+            fetch._run_apt_command(['apt-get', 'update'], fatal=True,
+                                   timeout=30)
+        self.assertEqual(e.exception.returncode, fetch.APT_NO_LOCK)
+        self.assertEqual(self.runs, [])
+        self.assertEqual(self.clock.now, 1030.0)
+        self.assertEqual(fetch.apt_run_stats(), {
+            'runs': 0, 'run-time': 0.0,
+            'lock-waits': 1, 'lock-wait-time': 30.0})
+
+    def test_deadline_exceeded_while_retrying(self):
+        self.results = [(100, LOCK_MESSAGE)] * 20
+        with self.assertRaises(fetch.subprocess.CalledProcessError) as e:
+            fetch._run_apt_command(['apt-get', 'update'], fatal=True,
+                                   timeout=10)
+        self.assertEqual(e.exception.returncode, fetch.APT_NO_LOCK)
+        # Each run takes 2s and is followed by a DPKG_LOCK_POLL pause; the
+        # fifth ends after the deadline.
+        self.assertEqual(len(self.runs), 5)
+        self.assertEqual(self.clock.now, 1012.0)
@@ -0,0 +1,321 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+
+from subprocess import CalledProcessError
+
+from mock import MagicMock, patch
+
+from charmhelpers.contrib.storage.linux import ceph, ceph_client
+from charmhelpers.core import unitdata
+
+LUMINOUS = ceph.CephVersion('12.2.4')
+NAUTILUS = ceph.CephVersion('14.2.1')
+SERVICE = 'admin'
+
+
+class CephTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.version = LUMINOUS
+        self.atexit = []
+        self.db = unitdata.Storage(':memory:')
+        for target, value in (
+                ('charmhelpers.contrib.storage.linux.ceph.ceph_version',
+                 lambda: self.version),
+                ('charmhelpers.contrib.storage.linux.ceph.log', MagicMock()),
+                ('charmhelpers.contrib.storage.linux.ceph_client.log',
+                 MagicMock()),
+                ('charmhelpers.contrib.storage.linux.ceph_client._clients',
+                 {}),
+                ('charmhelpers.core.hookenv._atexit', self.atexit),
+                ('charmhelpers.core.unitdata._KV', self.db)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def make_cluster(self):
+        """Return a fake cluster with a pool and a writeback cache tier."""
+        cluster = ceph_client.FakeCephClient(SERVICE)
+        for pool in ('cinder', 'cinder-cache'):
+            cluster.mon_command('osd pool create',
+                                [('pool', pool), ('pg_num', 8)])
+        cluster.pools['cinder-cache']['cache_mode'] = 'writeback'
+        del cluster.commands[:]
+        return cluster
+
+    def use(self, client):
+        ceph_client._clients[SERVICE] = client
+        return client
+
+    def run_fake(self, func, *args):
+        """Run func over a FakeCephClient; returns the commands issued."""
+        cluster = self.use(self.make_cluster())
+        func(*args)
+        return cluster.commands
+
+    def run_cli(self, func, *args):
+        """Run func over the CLI; returns the argument lists run."""
+        cluster = self.make_cluster()
+        argv = []
+
+        def check_output(cmd):
+            argv.append(cmd)
+            if cmd[3:6] == ['osd', 'pool', 'ls']:
+                return json.dumps(cluster._pool_details()).encode('UTF-8')
+            return b''
+
+        self.use(ceph_client.CLICephClient(SERVICE))
+        with patch.object(ceph_client, 'check_output', check_output):
+            func(*args)
+        return argv
+
+    def run_rados(self, func, *args):
+        """Run func over librados; returns the monitor commands sent, as
+        decoded JSON."""
+        cluster = self.make_cluster()
+        sent = []
+
+        def mon_command(cmd, inbuf):
+            command = json.loads(cmd)
+            sent.append(dict(command))
+            prefix = command.pop('prefix')
+            format = command.pop('format', None)
+            try:
+                out = cluster.mon_command(prefix, list(command.items()),
+                                          format)
+            except CalledProcessError as e:
+                return -e.returncode, b'', e.output
+            return 0, out.encode('UTF-8'), ''
+
+        client = self.use(ceph_client.RadosCephClient(SERVICE))
+        client._cluster = MagicMock()
+        client._cluster.mon_command.side_effect = mon_command
+        with patch.object(ceph_client, 'check_output', return_value=b''):
+            func(*args)
+        return sent
+
+
+class DeletePoolTests(CephTestCase):
+
+    def test_luminous(self):
+        self.assertEqual(
+            self.run_fake(ceph.delete_pool, SERVICE, 'cinder'),
+            [('osd pool delete',
+              [('pool', 'cinder'), ('pool2', 'cinder'),
+               ('sure', '--yes-i-really-really-mean-it')])])
+        self.assertEqual(
+            self.run_cli(ceph.delete_pool, SERVICE, 'cinder'),
+            [['ceph', '--id', SERVICE, 'osd', 'pool', 'delete', 'cinder',
+              'cinder', '--yes-i-really-really-mean-it']])
+        self.assertEqual(
+            self.run_rados(ceph.delete_pool, SERVICE, 'cinder'),
+            [{'prefix': 'osd pool delete', 'pool': 'cinder',
+              'pool2': 'cinder', 'sure': '--yes-i-really-really-mean-it'}])
+
+    def test_nautilus(self):
+        self.version = NAUTILUS
+        self.assertEqual(
+            self.run_fake(ceph.delete_pool, SERVICE, 'cinder'),
+            [('osd pool delete',
+              [('pool', 'cinder'), ('pool2', 'cinder'),
+               ('yes_i_really_really_mean_it', True)])])
+        self.assertEqual(
+            self.run_cli(ceph.delete_pool, SERVICE, 'cinder'),
+            [['ceph', '--id', SERVICE, 'osd', 'pool', 'delete', 'cinder',
+              'cinder', '--yes-i-really-really-mean-it']])
+        self.assertEqual(
+            self.run_rados(ceph.delete_pool, SERVICE, 'cinder'),
+            [{'prefix': 'osd pool delete', 'pool': 'cinder',
+              'pool2': 'cinder', 'yes_i_really_really_mean_it': True}])
+
+
+class RemoveCacheTierTests(CephTestCase):
+
+    def remove_cache_tier(self):
+        ceph.Pool(SERVICE, 'cinder').remove_cache_tier('cinder-cache')
+
+    def cli_commands(self):
+        prefix = ['ceph', '--id', SERVICE]
+        return [
+            prefix + ['osd', 'pool', 'ls', 'detail', '--format=json'],
+            prefix + ['osd', 'tier', 'cache-mode', 'cinder-cache', 'forward',
+                      '--yes-i-really-mean-it'],
+            ['rados', '--id', SERVICE, '-p', 'cinder-cache',
+             'cache-flush-evict-all'],
+            prefix + ['osd', 'tier', 'remove-overlay', 'cinder'],
+            prefix + ['osd', 'tier', 'remove', 'cinder', 'cinder-cache'],
+        ]
+
+    def rados_commands(self, confirmation):
+        return [
+            {'prefix': 'osd pool ls', 'detail': 'detail', 'format': 'json'},
+            dict([confirmation], prefix='osd tier cache-mode',
+                 pool='cinder-cache', mode='forward'),
+            {'prefix': 'osd tier remove-overlay', 'pool': 'cinder'},
+            {'prefix': 'osd tier remove', 'pool': 'cinder',
+             'tierpool': 'cinder-cache'},
+        ]
+
+    def test_luminous(self):
+        commands = self.run_fake(self.remove_cache_tier)
+        self.assertEqual(commands[1], (
+            'osd tier cache-mode',
+            [('pool', 'cinder-cache'), ('mode', 'forward'),
+             ('sure', '--yes-i-really-mean-it')]))
+        self.assertEqual(self.run_cli(self.remove_cache_tier),
+                         self.cli_commands())
+        self.assertEqual(
+            self.run_rados(self.remove_cache_tier),
+            self.rados_commands(('sure', '--yes-i-really-mean-it')))
+
+    def test_nautilus(self):
+        self.version = NAUTILUS
+        commands = self.run_fake(self.remove_cache_tier)
+        self.assertEqual(commands[1], (
+            'osd tier cache-mode',
+            [('pool', 'cinder-cache'), ('mode', 'forward'),
+             ('yes_i_really_mean_it', True)]))
+        self.assertEqual(self.run_cli(self.remove_cache_tier),
+                         self.cli_commands())
+        self.assertEqual(
+            self.run_rados(self.remove_cache_tier),
+            self.rados_commands(('yes_i_really_mean_it', True)))
+
+
+class ErasureProfileTests(CephTestCase):
+
+    def create_profile(self):
+        ceph.create_erasure_profile(SERVICE, 'default', data_chunks=3,
+                                    coding_chunks=2)
+
+    def test_force_luminous(self):
+        argv = self.run_cli(self.create_profile)
+        self.assertEqual(argv[-1][-1], '--force')
+        command = self.run_rados(self.create_profile)[-1]
+        self.assertEqual(command['force'], '--force')
+
+    def test_force_nautilus(self):
+        self.version = NAUTILUS
+        argv = self.run_cli(self.create_profile)
+        self.assertEqual(argv[-1][-1], '--force')
+        command = self.run_rados(self.create_profile)[-1]
+        self.assertIs(command['force'], True)
+
+
+class CommandBatchTests(CephTestCase):
+
+    def test_step_report(self):
+        cluster = self.use(self.make_cluster())
+        pool = ceph.Pool(SERVICE, 'cinder')
+        with self.assertRaises(ceph_client.CephBatchError) as raised:
+            pool.add_cache_tier('missing', 'readonly')
+        error = raised.exception
+        self.assertEqual((error.step, error.steps, error.command),
+                         (2, 4, 'osd tier cache-mode'))
+        self.assertEqual(
+            str(error),
+            "Step 2 of 4 (osd tier cache-mode) failed with exit status 2; "
+            "the 1 step(s) before it were applied: unrecognized pool "
+            "'missing'")
+        self.assertEqual([prefix for prefix, _ in cluster.commands],
+                         ['osd tier add', 'osd tier cache-mode'])
+
+    def test_not_run_when_block_raises(self):
+        cluster = self.use(self.make_cluster())
+        with self.assertRaises(ValueError):
+            with ceph_client.ceph_client(SERVICE).batch() as batch:
+                batch.mon_command('osd pool delete', [('pool', 'cinder')])
+                raise ValueError()
+        self.assertEqual(cluster.commands, [])
+
+
+class ClusterQueryTests(CephTestCase):
+
+    def setUp(self):
+        super(ClusterQueryTests, self).setUp()
+        self.now = 1000.0
+        for target, value in (
+                ('charmhelpers.contrib.storage.linux.ceph.time.time',
+                 lambda: self.now),
+                ('charmhelpers.contrib.storage.linux.ceph.config',
+                 lambda key=None: None)):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.cluster = self.use(self.make_cluster())
+
+    def queries(self, prefix):
+        return [args for command, args in self.cluster.commands
+                if command == prefix]
+
+    def test_uncached_without_max_age(self):
+        ceph.get_osds(SERVICE)
+        ceph.get_osds(SERVICE)
+        self.assertEqual(len(self.queries('osd ls')), 2)
+        self.assertEqual(self.db.getrange(ceph.CLUSTER_QUERY_KEY), {})
+
+    def test_ttl_expiry(self):
+        ceph.get_osds(SERVICE, max_age=300)
+        self.now += 299
+        self.assertEqual(ceph.get_osds(SERVICE, max_age=300), [0, 1, 2])
+        self.assertEqual(len(self.queries('osd ls')), 1)
+        self.now += 2
+        ceph.get_osds(SERVICE, max_age=300)
+        self.assertEqual(len(self.queries('osd ls')), 2)
+
+    def test_kept_per_service(self):
+        ceph.get_osds(SERVICE, max_age=300)
+        other = ceph_client.FakeCephClient('other')
+        ceph_client._clients['other'] = other
+        ceph.get_osds('other', max_age=300)
+        self.assertEqual(len(other.commands), 1)
+
+    def test_missing_pool_not_cached(self):
+        self.assertFalse(ceph.pool_exists(SERVICE, 'glance', max_age=60))
+        self.cluster.mon_command('osd pool create',
+                                 [('pool', 'glance'), ('pg_num', 8)])
+        self.assertTrue(ceph.pool_exists(SERVICE, 'glance', max_age=60))
+
+    def test_get_pgs_reuses_osd_list(self):
+        ceph.ReplicatedPool(SERVICE, 'glance', replicas=3)
+        ceph.ReplicatedPool(SERVICE, 'nova', replicas=3)
+        self.assertEqual(len(self.queries('osd ls')), 1)
+
+    def test_create_reuses_existing_pool(self):
+        pool = ceph.ReplicatedPool(SERVICE, 'cinder', replicas=3)
+        pool.create()
+        pool.create()
+        self.assertEqual(len(self.queries('osd pool get')), 1)
+        self.assertEqual(self.queries('osd pool create'), [])
+
+    def test_invalidated_by_delete_pool(self):
+        self.assertTrue(ceph.pool_exists(SERVICE, 'cinder', max_age=60))
+        ceph.delete_pool(SERVICE, 'cinder')
+        self.assertFalse(ceph.pool_exists(SERVICE, 'cinder', max_age=60))
+
+    def test_invalidated_by_rename_pool(self):
+        self.assertTrue(ceph.pool_exists(SERVICE, 'cinder', max_age=60))
+        ceph.rename_pool(SERVICE, 'cinder', 'cinder-old')
+        self.assertFalse(ceph.pool_exists(SERVICE, 'cinder', max_age=60))
+
+    def test_saved_when_hook_completes(self):
+        ceph.get_osds(SERVICE, max_age=300)
+        self.assertEqual(self.atexit, [(self.db.flush, (), {})])
+
+    def test_invalidate_without_cached_results_writes_nothing(self):
+        ceph.delete_pool(SERVICE, 'cinder')
+        self.assertEqual(self.atexit, [])
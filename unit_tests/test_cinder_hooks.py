@@ -16,6 +16,8 @@ from mock import MagicMock, patch, call, ANY
 import json
 import cinder_utils as utils
 
+from charmhelpers.core import unitdata
+
 from test_utils import (
     CharmTestCase,
 )
@@ -46,8 +48,9 @@ TO_PATCH = [
     'leader_set',
     'is_leader',
     # charmhelpers.core.host
-    'apt_install',
+    'queue_apt_install',
     'apt_update',
+    'stage_local_packages',
     # charmhelpers.contrib.hahelpers.cluster_utils
     'execd_preinstall',
     'CephSubordinateContext',
@@ -66,8 +69,10 @@ class TestCinderHooks(CharmTestCase):
     def test_install(self, mock_config):
         hooks.hooks.execute(['hooks/install'])
         self.assertTrue(self.execd_preinstall.called)
-        self.assertTrue(self.apt_update.called)
-        self.apt_install.assert_called_with(['ceph-common'], fatal=True)
+        self.stage_local_packages.assert_called_once_with()
+        self.apt_update.assert_called_once_with(fatal=True, skip_fresh=True)
+        self.queue_apt_install.assert_called_with(['ceph-common'],
+                                                  fatal=True)
 
     @patch('charmhelpers.core.hookenv.config')
     @patch('os.mkdir')
@@ -273,3 +278,43 @@ class TestCinderHooks(CharmTestCase):
             relation_settings={'key': 'mykey',
                                'secret-uuid': 'newuuid'}
         )
+
+    @patch.object(hooks, 'record_status_inputs')
+    @patch.object(hooks, 'set_os_workload_status')
+    def test_assess_status(self, set_os_workload_status,
+                           record_status_inputs):
+        hooks.assess_status()
+        set_os_workload_status.assert_called_with(
+            hooks.CONFIGS, hooks.REQUIRED_INTERFACES)
+        self.os_application_version_set.assert_called_with('cinder-common')
+        record_status_inputs.assert_called_with()
+
+    @patch.object(hooks, 'batch_apt_installs')
+    @patch.object(hooks, 'batch_relation_writes')
+    @patch.object(hooks, 'set_os_workload_status')
+    @patch.object(hooks, 'hook_name')
+    @patch.object(utils, 'status_fingerprint')
+    @patch.object(utils, 'kv')
+    def test_failed_hook_status_repaired_by_update_status(
+            self, kv, status_fingerprint, hook_name, set_os_workload_status,
+            batch_relation_writes, batch_apt_installs):
+        kv.return_value = unitdata.Storage(':memory:')
+        status_fingerprint.return_value = 'abc'
+        # A hook sets the status and records its inputs.
+        hook_name.return_value = 'config-changed'
+        hooks.main(['hooks/config-changed'])
+        self.assertEqual(set_os_workload_status.call_count, 1)
+        # update-status has nothing to do while they are unchanged.
+        hook_name.return_value = 'update-status'
+        self.assertRaises(SystemExit, hooks.main, ['hooks/update-status'])
+        self.assertEqual(set_os_workload_status.call_count, 1)
+        # The next hook sets a status and fails; it is resolved without
+        # a retry.
+        hook_name.return_value = 'ceph-relation-changed'
+        with patch.object(hooks.hooks, 'execute', side_effect=ValueError):
+            self.assertRaises(ValueError, hooks.main,
+                              ['hooks/ceph-relation-changed'])
+        self.assertEqual(set_os_workload_status.call_count, 1)
+        hook_name.return_value = 'update-status'
+        hooks.main(['hooks/update-status'])
+        self.assertEqual(set_os_workload_status.call_count, 2)
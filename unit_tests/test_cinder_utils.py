@@ -49,6 +49,13 @@ class TestCinderUtils(CharmTestCase):
         self.get_os_codename_package.return_value = 'grizzly'
         self.relation_ids.return_value = ['ceph:0']
         configs = cinder_utils.register_configs()
+        # Nothing is looked up or created until a config is written.
+        self.get_os_codename_package.assert_not_called()
+        self.mkdir.assert_not_called()
+        self.install_alternative.assert_not_called()
+        configs.write_all()
+        self.templating.OSConfigRenderer.return_value.set_release.\
+            assert_called_with('grizzly')
         calls = []
         for conf in [cinder_utils.ceph_config_file()]:
             calls.append(
@@ -65,6 +72,80 @@ class TestCinderUtils(CharmTestCase):
             cinder_utils.CEPH_CONF, cinder_utils.ceph_config_file()
         )
 
+    @patch('os.path.exists')
+    def test_register_configs_complete_contexts(self, exists):
+        exists.return_value = True
+        self.relation_ids.return_value = ['ceph:0']
+        configs = cinder_utils.register_configs()
+        configs.complete_contexts()
+        renderer = self.templating.OSConfigRenderer.return_value
+        renderer.register.assert_called_with(
+            cinder_utils.ceph_config_file(),
+            cinder_utils.CONFIG_FILES[
+                cinder_utils.ceph_config_file()]['hook_contexts'])
+        renderer.complete_contexts.assert_called_with()
+        self.get_os_codename_package.assert_not_called()
+        self.mkdir.assert_not_called()
+        self.install_alternative.assert_not_called()
+
+    def test_restart_map_before_render(self):
+        self.relation_ids.return_value = ['ceph:0']
+        cinder_utils.register_configs()
+        self.assertEqual(cinder_utils.restart_map(),
+                         {cinder_utils.ceph_config_file(): ['cinder-volume']})
+        self.templating.OSConfigRenderer.assert_not_called()
+
+    @patch.object(cinder_utils, 'kv')
+    @patch.object(cinder_utils, 'relation_get')
+    @patch.object(cinder_utils, 'related_units')
+    @patch('os.stat')
+    def test_status_fingerprint(self, stat, related_units, relation_get,
+                                kv):
+        stat.return_value.st_mtime = 1530000000.0
+        kv.return_value.get.return_value = None
+        self.relation_ids.return_value = ['ceph:0']
+        related_units.return_value = ['ceph-mon/0']
+        settings = {'auth': 'cephx', 'key': 'akey',
+                    'ceph-public-address': '10.0.0.1'}
+        relation_get.side_effect = lambda rid, unit: dict(settings)
+        fingerprint = cinder_utils.status_fingerprint()
+        self.assertEqual(cinder_utils.status_fingerprint(), fingerprint)
+        # Settings the status does not depend on are ignored.
+        settings['broker-rsp-cinder-ceph-0'] = '{}'
+        self.assertEqual(cinder_utils.status_fingerprint(), fingerprint)
+        settings['key'] = 'otherkey'
+        self.assertNotEqual(cinder_utils.status_fingerprint(), fingerprint)
+        settings['key'] = 'akey'
+        kv.return_value.get.return_value = True
+        self.assertNotEqual(cinder_utils.status_fingerprint(), fingerprint)
+        kv.return_value.get.return_value = None
+        stat.return_value.st_mtime = 1540000000.0
+        self.assertNotEqual(cinder_utils.status_fingerprint(), fingerprint)
+
+    @patch.object(cinder_utils, 'kv')
+    @patch.object(cinder_utils, 'status_fingerprint')
+    def test_status_inputs_changed(self, status_fingerprint, kv):
+        status_fingerprint.return_value = 'abc'
+        kv.return_value.get.return_value = None
+        self.assertTrue(cinder_utils.status_inputs_changed())
+        cinder_utils.record_status_inputs()
+        kv.return_value.set.assert_called_with(
+            cinder_utils.STATUS_FINGERPRINT_KEY, 'abc')
+        kv.return_value.flush.assert_called_with()
+        kv.return_value.get.return_value = 'abc'
+        self.assertFalse(cinder_utils.status_inputs_changed())
+
+    @patch.object(cinder_utils, 'kv')
+    def test_forget_status_inputs(self, kv):
+        kv.return_value.get.return_value = None
+        cinder_utils.forget_status_inputs()
+        kv.return_value.flush.assert_not_called()
+        kv.return_value.get.return_value = 'abc'
+        cinder_utils.forget_status_inputs()
+        kv.return_value.unset.assert_called_with(
+            cinder_utils.STATUS_FINGERPRINT_KEY)
+        kv.return_value.flush.assert_called_with()
+
     def test_set_ceph_kludge(self):
         pass
         """
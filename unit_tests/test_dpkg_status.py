@@ -0,0 +1,189 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+
+import charmhelpers.fetch.ubuntu as fetch
+
+# Versions of packages from the Ubuntu and Ubuntu Cloud Archive pockets,
+# with the upstream version apt_pkg.upstream_version() returns for each.
+VERSION_CORPUS = [
+    ('2:13.0.1-0ubuntu1', '13.0.1'),
+    ('2:12.0.4-0ubuntu1~cloud0', '12.0.4'),
+    ('12.2.4-0ubuntu0.18.04.1', '12.2.4'),
+    ('13.2.1+dfsg1-0ubuntu2.18.10.1~cloud0', '13.2.1+dfsg1'),
+    ('2.17.0-0ubuntu1', '2.17.0'),
+    ('1:2.8.0-0ubuntu1~cloud0', '2.8.0'),
+    ('2.7.15~rc1-1', '2.7.15~rc1'),
+    ('3.6.5-3ubuntu1', '3.6.5'),
+    ('1.0+dfsg-1', '1.0+dfsg'),
+    ('237-3ubuntu10.3', '237'),
+    ('1.1.0g-2ubuntu4.1', '1.1.0g'),
+    ('1:1.2.11.dfsg-0ubuntu2', '1.2.11.dfsg'),
+    ('1:9.11.3+dfsg-1ubuntu1.1', '9.11.3+dfsg'),
+    ('2:4.7.6+dfsg~ubuntu-0ubuntu2.2', '4.7.6+dfsg~ubuntu'),
+    ('2.27-3ubuntu1', '2.27'),
+    ('0.8.0+git20170824-1', '0.8.0+git20170824'),
+    ('1:2.2.9-7ubuntu5', '2.2.9'),
+    ('5.1.1+20170618-2', '5.1.1+20170618'),
+    ('2.30-21ubuntu1~18.04', '2.30'),
+    ('1.8.2-1ubuntu1', '1.8.2'),
+    ('1:7.6p1-4ubuntu0.1', '7.6p1'),
+    ('3.0pl1-128.1ubuntu1', '3.0pl1'),
+    ('0.99.4-1ubuntu1', '0.99.4'),
+    ('20180409', '20180409'),
+    ('0.9.7.10ubuntu1', '0.9.7.10ubuntu1'),
+    ('1.19.0.5ubuntu2', '1.19.0.5ubuntu2'),
+    ('2018d-1', '2018d'),
+    ('1:0.1.3-1', '0.1.3'),
+    ('0.4.2-1-2', '0.4.2-1'),
+    ('1:2:3-4', '2:3'),
+    ('1.0-', '1.0'),
+    ('', ''),
+]
+
+DPKG_STATUS = """\
+Package: ceph-common
+Status: install ok installed
+Priority: optional
+Architecture: amd64
+Version: 12.2.4-0ubuntu1
+Description: common utilities to mount and interact with a ceph storage cluster
+ Ceph is a massively scalable, open-source, distributed
+ storage system that runs on commodity hardware.
+ .
+ Version: 0.0 is not a field
+
+Package: cinder-common
+Status: deinstall ok config-files
+Architecture: all
+Version: 2:12.0.4-0ubuntu1
+Config-Version: 2:12.0.4-0ubuntu1
+
+Package: libc6
+Status: install ok installed
+Architecture: i386
+Multi-Arch: same
+Version: 2.27-3ubuntu1
+
+Package: libc6
+Status: deinstall ok not-installed
+Architecture: amd64
+Multi-Arch: same
+
+Package: python-rbd
+Status: install ok half-configured
+Architecture: amd64
+Version: 12.2.4-0ubuntu1
+"""
+
+
+class UpstreamVersionTests(unittest.TestCase):
+
+    def test_corpus(self):
+        for version, upstream in VERSION_CORPUS:
+            self.assertEqual(fetch.upstream_version(version), upstream,
+                             version)
+
+    def test_matches_apt_pkg(self):
+        try:
+            import apt_pkg
+        except ImportError:
+            raise unittest.SkipTest('apt_pkg is not available')
+        apt_pkg.init()
+        for version, _ in VERSION_CORPUS:
+            self.assertEqual(fetch.upstream_version(version),
+                             apt_pkg.upstream_version(version), version)
+
+
+class DpkgStatusIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.status = os.path.join(self.tmp, 'status')
+        with open(self.status, 'w') as f:
+            f.write(DPKG_STATUS)
+        for target, value in (
+                ('charmhelpers.fetch.ubuntu.DPKG_STATUS', self.status),
+                ('charmhelpers.fetch.ubuntu._dpkg_index', {}),
+                ('os.environ', {'CHARM_DIR': self.tmp})):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.index_path = os.path.join(self.tmp, fetch.DPKG_INDEX_FILE)
+
+    def test_index(self):
+        self.assertEqual(fetch.dpkg_status_index(), {
+            'ceph-common': ['installed', '12.2.4-0ubuntu1'],
+            'cinder-common': ['config-files', '2:12.0.4-0ubuntu1'],
+            'libc6': ['installed', '2.27-3ubuntu1'],
+            'python-rbd': ['half-configured', '12.2.4-0ubuntu1'],
+        })
+
+    def test_installed_version(self):
+        self.assertEqual(fetch.installed_version('ceph-common'),
+                         '12.2.4-0ubuntu1')
+        self.assertEqual(fetch.installed_version('python-rbd'),
+                         '12.2.4-0ubuntu1')
+        self.assertIsNone(fetch.installed_version('cinder-common'))
+        self.assertIsNone(fetch.installed_version('ceph'))
+
+    def test_get_upstream_version(self):
+        self.assertEqual(fetch.get_upstream_version('ceph-common'), '12.2.4')
+        self.assertIsNone(fetch.get_upstream_version('cinder-common'))
+
+    def test_filter_installed_packages(self):
+        self.assertEqual(
+            fetch.filter_installed_packages(
+                ['ceph-common', 'cinder-common', 'ceph', 'libc6']),
+            ['cinder-common', 'ceph'])
+
+    def test_index_persisted(self):
+        fetch.dpkg_status_index()
+        with open(self.index_path) as f:
+            persisted = json.load(f)
+        self.assertEqual(persisted['stamp'],
+                         list(fetch.dpkg_status_stamp()))
+        fetch._dpkg_index.clear()
+        with patch.object(fetch, '_parse_dpkg_status') as parse:
+            self.assertEqual(fetch.dpkg_status_index(), persisted['packages'])
+            parse.assert_not_called()
+
+    def test_index_rebuilt_when_status_changes(self):
+        fetch.dpkg_status_index()
+        with open(self.status, 'a') as f:
+            f.write('\nPackage: ceph\nStatus: install ok installed\n'
+                    'Version: 12.2.4-0ubuntu1\n')
+        self.assertEqual(fetch.installed_version('ceph'), '12.2.4-0ubuntu1')
+        fetch._dpkg_index.clear()
+        self.assertEqual(fetch.installed_version('ceph'), '12.2.4-0ubuntu1')
+
+    def test_index_not_persisted_without_state_dir(self):
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(self.tmp)
+        for env in ({}, {'UNIT_STATE_DB': ':memory:'},
+                    {'UNIT_STATE_DB': '.unit-state.db'}):
+            fetch._dpkg_index.clear()
+            with patch.dict('os.environ', env, clear=True):
+                self.assertEqual(fetch.installed_version('libc6'),
+                                 '2.27-3ubuntu1')
+            self.assertFalse(os.path.exists(self.index_path), env)
@@ -0,0 +1,436 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+from mock import MagicMock, patch
+
+from charmhelpers.core import hookenv, unitdata
+
+relation_set_capabilities = hookenv.relation_set_capabilities
+
+LOCAL_UNIT = 'cinder-ceph/0'
+RID = 'ceph-access:1'
+
+
+class FakeHookTools(object):
+    """Answers relation and leader hook tools from in-memory settings."""
+
+    def __init__(self):
+        self.relations = {RID: {LOCAL_UNIT: {'key': 'old'},
+                                'nova-compute/0': {'secret': 'abc'},
+                                'nova-compute/1': {'secret': 'abc'}}}
+        self.leader = {'uuid': '1234'}
+        self.calls = []
+
+    def check_output(self, cmd, *args, **kwargs):
+        self.calls.append(cmd)
+        if cmd[0] == 'relation-list':
+            rid = cmd[cmd.index('-r') + 1]
+            units = [u for u in self.relations[rid] if u != LOCAL_UNIT]
+            return json.dumps(sorted(units)).encode('UTF-8')
+        if cmd[0] == 'relation-get':
+            rid = cmd[cmd.index('-r') + 1]
+            unit = cmd[-1]
+            return json.dumps(self.relations[rid][unit]).encode('UTF-8')
+        if cmd[0] == 'leader-get':
+            return json.dumps(self.leader).encode('UTF-8')
+        raise AssertionError('unexpected hook tool {}'.format(cmd))
+
+    def check_call(self, cmd, *args, **kwargs):
+        self.calls.append(cmd)
+        if '--file' in cmd:
+            with open(cmd[cmd.index('--file') + 1]) as settings_file:
+                self.set_from_yaml(cmd, settings_file.read())
+            return 0
+        settings = dict(arg.split('=', 1) for arg in cmd if '=' in arg)
+        self.update(cmd, settings)
+        return 0
+
+    def popen(self, cmd, *args, **kwargs):
+        self.calls.append(cmd)
+        proc = MagicMock(returncode=0)
+        proc.communicate.side_effect = (
+            lambda data: self.set_from_yaml(cmd, data.decode('UTF-8')))
+        return proc
+
+    def set_from_yaml(self, cmd, data):
+        self.update(cmd, {key: value or ''
+                          for key, value in yaml.safe_load(data).items()})
+
+    def update(self, cmd, settings):
+        if cmd[0] == 'relation-set':
+            target = self.relations[cmd[cmd.index('-r') + 1]][LOCAL_UNIT]
+        elif cmd[0] == 'leader-set':
+            target = self.leader
+        else:
+            raise AssertionError('unexpected hook tool {}'.format(cmd))
+        for key, value in settings.items():
+            if value:
+                target[key] = value
+            else:
+                target.pop(key, None)
+
+    def tool_calls(self, tool):
+        return [cmd for cmd in self.calls if cmd[0] == tool]
+
+
+class HookenvTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tools = FakeHookTools()
+        self.atexit = []
+        for target, value in (
+                ('os.environ', {'JUJU_UNIT_NAME': LOCAL_UNIT}),
+                ('charmhelpers.core.hookenv._relation_snapshot', None),
+                ('charmhelpers.core.hookenv._relation_writes', None),
+                ('charmhelpers.core.hookenv._leader_settings', None),
+                ('charmhelpers.core.hookenv._atexit', self.atexit)):
+            self.patch(target, value)
+        self.patch('charmhelpers.core.hookenv.relation_set_capabilities',
+                   lambda: {'file': False, 'stdin': False})
+        self.patch('subprocess.check_output', self.tools.check_output)
+        self.patch('subprocess.check_call', self.tools.check_call)
+
+    def patch(self, target, value):
+        patcher = patch(target, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class CachedTests(unittest.TestCase):
+
+    def setUp(self):
+        for target in ('charmhelpers.core.hookenv.cache',
+                       'charmhelpers.core.hookenv._cache_index'):
+            patcher = patch(target, {})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def lookup(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        return len(self.calls)
+
+    def test_bounded_lru(self):
+        lookup = hookenv.cached(self.lookup, maxsize=2)
+        lookup('a')
+        lookup('b')
+        lookup('a')
+        lookup('c')
+        # b was the least recently used.
+        self.assertEqual(lookup('a'), 1)
+        self.assertEqual(lookup('b'), 4)
+        self.assertEqual(sorted(hookenv._cache_index), ['a', 'b'])
+
+    def test_flush_by_argument(self):
+        lookup = hookenv.cached(self.lookup)
+        lookup('ceph:1', 'ceph-mon/0')
+        lookup('ceph:2', 'ceph-mon/0')
+        hookenv.flush('ceph:1')
+        self.assertEqual(lookup('ceph:1', 'ceph-mon/0'), 3)
+        self.assertEqual(lookup('ceph:2', 'ceph-mon/0'), 2)
+        hookenv.flush('ceph-mon/0')
+        self.assertEqual(hookenv._cache_index, {})
+        self.assertEqual(lookup('ceph:2', 'ceph-mon/0'), 4)
+
+    def test_keyword_values_indexed(self):
+        lookup = hookenv.cached(self.lookup)
+        lookup(unit='ceph-mon/0')
+        hookenv.flush('unit')
+        self.assertEqual(lookup(unit='ceph-mon/0'), 1)
+        hookenv.flush('ceph-mon/0')
+        self.assertEqual(lookup(unit='ceph-mon/0'), 2)
+
+    def test_unhashable_arguments(self):
+        lookup = hookenv.cached(self.lookup)
+        settings = {'key': ['ceph-mon/0', 'ceph-mon/1']}
+        lookup('ceph:1', settings)
+        self.assertEqual(lookup('ceph:1', dict(settings)), 1)
+        hookenv.flush('ceph-mon/1')
+        self.assertEqual(lookup('ceph:1', settings), 2)
+        hookenv.flush('ceph:1')
+        self.assertEqual(hookenv._cache_index, {})
+
+    def test_cache_stats(self):
+        lookup = hookenv.cached(self.lookup, maxsize=1)
+        lookup('a')
+        lookup('a')
+        lookup('b')
+        name = '{}.lookup'.format(type(self).__module__)
+        self.assertEqual(hookenv.cache_stats(), {
+            name: {'hits': 1, 'misses': 2, 'size': 1}})
+
+
+class RelationSnapshotTests(HookenvTestCase):
+
+    def test_relation_set_invalidates_local_settings(self):
+        self.assertEqual(hookenv.relation_get('key', LOCAL_UNIT, RID), 'old')
+        hookenv.relation_set(RID, key='new')
+        self.assertEqual(hookenv.relation_get('key', LOCAL_UNIT, RID), 'new')
+        self.assertEqual(len(self.tools.tool_calls('relation-get')), 2)
+
+    def test_remote_settings_survive_relation_set(self):
+        hookenv.relation_get(unit='nova-compute/0', rid=RID)
+        hookenv.relation_get(unit='nova-compute/1', rid=RID)
+        fetched = len(self.tools.calls)
+        hookenv.relation_set(RID, key='new')
+        self.assertEqual(hookenv.relation_get('secret', 'nova-compute/0', RID),
+                         'abc')
+        self.assertEqual(len(self.tools.calls), fetched + 1)
+
+    def test_local_lookup_does_not_prefetch(self):
+        hookenv.relation_get(unit=LOCAL_UNIT, rid=RID)
+        self.assertEqual(self.tools.tool_calls('relation-list'), [])
+        self.assertEqual(len(self.tools.tool_calls('relation-get')), 1)
+
+    def test_walk_prefetches_remaining_units(self):
+        hookenv.relation_get(unit='nova-compute/0', rid=RID)
+        self.assertEqual(self.tools.tool_calls('relation-list'), [])
+        hookenv.relation_get(unit='nova-compute/1', rid=RID)
+        self.assertEqual(len(self.tools.tool_calls('relation-list')), 1)
+        self.assertEqual(len(self.tools.tool_calls('relation-get')), 2)
+
+
+class RelationSetTests(HookenvTestCase):
+
+    def setUp(self):
+        super(RelationSetTests, self).setUp()
+        self.version = '2.4.1-bionic-amd64'
+        self.help = 'usage: relation-set [options] key=value [key=value ...]'
+        for target, value in (
+                ('charmhelpers.core.hookenv.relation_set_capabilities',
+                 relation_set_capabilities),
+                ('charmhelpers.core.hookenv.cache', {}),
+                ('charmhelpers.core.hookenv._cache_index', {}),
+                ('charmhelpers.core.hookenv.juju_version',
+                 lambda: self.version),
+                ('charmhelpers.core.unitdata._KV',
+                 unitdata.Storage(':memory:')),
+                ('subprocess.check_output', self.check_output),
+                ('subprocess.Popen', self.tools.popen)):
+            self.patch(target, value)
+
+    def check_output(self, cmd, *args, **kwargs):
+        if cmd == ['relation-set', '--help']:
+            self.tools.calls.append(cmd)
+            return self.help + '\n'
+        return self.tools.check_output(cmd, *args, **kwargs)
+
+    def new_hook(self):
+        hookenv.cache.clear()
+        hookenv._cache_index.clear()
+
+    def probes(self):
+        return self.tools.calls.count(['relation-set', '--help'])
+
+    def test_capabilities_persisted_per_juju_version(self):
+        self.help += '\n  --file  file containing key-value pairs'
+        caps = {'file': True, 'stdin': True}
+        self.assertEqual(hookenv.relation_set_capabilities(), caps)
+        self.assertEqual(
+            unitdata.kv().get(hookenv.RELATION_SET_CAPS_KEY),
+            dict(caps, **{'juju-version': '2.4.1-bionic-amd64'}))
+        self.new_hook()
+        self.assertEqual(hookenv.relation_set_capabilities(), caps)
+        self.assertEqual(self.probes(), 1)
+        # An upgraded agent is probed again.
+        self.version = '2.5.0-bionic-amd64'
+        self.new_hook()
+        self.assertEqual(hookenv.relation_set_capabilities(), caps)
+        self.assertEqual(self.probes(), 2)
+        self.assertEqual(
+            unitdata.kv().get(hookenv.RELATION_SET_CAPS_KEY)['juju-version'],
+            '2.5.0-bionic-amd64')
+
+    def test_stdin_needs_juju_2(self):
+        self.help += '\n  --file  file containing key-value pairs'
+        self.version = '1.25.13-trusty-amd64'
+        self.assertEqual(hookenv.relation_set_capabilities(),
+                         {'file': True, 'stdin': False})
+        self.version = '2.0.0-xenial-amd64'
+        self.new_hook()
+        self.assertEqual(hookenv.relation_set_capabilities(),
+                         {'file': True, 'stdin': True})
+
+    def test_capabilities_not_persisted_without_version(self):
+        def no_agent():
+            raise OSError('jujud not found')
+        self.version = None
+        self.patch('charmhelpers.core.hookenv.juju_version', no_agent)
+        self.assertEqual(hookenv.relation_set_capabilities(),
+                         {'file': False, 'stdin': False})
+        self.assertIsNone(unitdata.kv().get(hookenv.RELATION_SET_CAPS_KEY))
+        self.new_hook()
+        hookenv.relation_set_capabilities()
+        self.assertEqual(self.probes(), 2)
+
+    def test_settings_sent_on_stdin(self):
+        self.help += '\n  --file  file containing key-value pairs'
+        hookenv.relation_set(RID, key='new', other=None)
+        self.assertEqual(self.tools.tool_calls('relation-set')[1:],
+                         [['relation-set', '-r', RID, '--file', '-']])
+        self.assertEqual(hookenv.relation_get(unit=LOCAL_UNIT, rid=RID),
+                         {'key': 'new'})
+
+    def test_settings_file_fallback(self):
+        self.help += '\n  --file  file containing key-value pairs'
+        self.version = '1.25.13-trusty-amd64'
+        hookenv.relation_set(RID, key='new')
+        cmd = self.tools.tool_calls('relation-set')[-1]
+        self.assertEqual(cmd[:4], ['relation-set', '-r', RID, '--file'])
+        self.assertFalse(os.path.exists(cmd[4]))
+        self.assertEqual(len(self.tools.calls), 2)
+        self.assertEqual(hookenv.relation_get('key', LOCAL_UNIT, RID), 'new')
+
+    def test_key_value_arguments_without_file(self):
+        hookenv.relation_set(RID, key='new')
+        self.assertEqual(self.tools.tool_calls('relation-set')[1:],
+                         [['relation-set', '-r', RID, 'key=new']])
+
+
+class RelationWriteBatchTests(HookenvTestCase):
+
+    def commit(self):
+        for callback, args, kwargs in reversed(self.atexit):
+            callback(*args, **kwargs)
+
+    def test_writes_merged_and_diffed(self):
+        hookenv.batch_relation_writes()
+        hookenv.relation_set(RID, key='old', other='1')
+        hookenv.relation_set(RID, {'other': '2'})
+        self.assertEqual(self.tools.tool_calls('relation-set'), [])
+        self.commit()
+        self.assertEqual(self.tools.tool_calls('relation-set'),
+                         [['relation-set', '-r', RID, 'other=2']])
+
+    def test_no_op_write_skipped(self):
+        hookenv.batch_relation_writes()
+        hookenv.relation_set(RID, key='old')
+        self.commit()
+        self.assertEqual(self.tools.tool_calls('relation-set'), [])
+        self.assertEqual(self.tools.tool_calls('relation-list'), [])
+
+    def test_pending_writes_visible_to_relation_get(self):
+        hookenv.batch_relation_writes()
+        hookenv.relation_set(RID, key=None, other='1')
+        self.assertEqual(hookenv.relation_get(unit=LOCAL_UNIT, rid=RID),
+                         {'other': '1'})
+
+
+class LeaderSettingsTests(HookenvTestCase):
+
+    def test_leader_set_writes_through(self):
+        self.assertEqual(hookenv.leader_get('uuid'), '1234')
+        hookenv.leader_set({'uuid': '5678', 'extra': 'x'})
+        hookenv.leader_set(extra=None)
+        self.assertEqual(hookenv.leader_get(), {'uuid': '5678'})
+        self.assertEqual(len(self.tools.tool_calls('leader-get')), 1)
+
+
+class LogSinkTests(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(hookenv, '_juju_log')
+        self.juju_log = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(hookenv._py_atexit, 'register')
+        self.register = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unbuffered_passes_every_level(self):
+        sink = hookenv.LogSink()
+        for level in hookenv.LOG_LEVELS:
+            self.assertTrue(sink.accepts(level))
+
+    def test_threshold(self):
+        sink = hookenv.LogSink(threshold=hookenv.INFO)
+        self.assertFalse(sink.accepts(hookenv.DEBUG))
+        self.assertTrue(sink.accepts(None))
+        self.assertTrue(sink.accepts(hookenv.ERROR))
+
+    def test_buffer_flushed_when_hook_raises(self):
+        sink = hookenv.LogSink(buffered=True)
+        hooks = hookenv.Hooks()
+
+        @hooks.hook('install')
+        def install():
+            sink.write('first', hookenv.DEBUG)
+            sink.write('second', hookenv.DEBUG)
+            sink.write('boom', hookenv.ERROR)
+            raise ValueError('boom')
+
+        with patch.object(hookenv, '_log_sink', sink):
+            self.assertRaises(ValueError, hooks.execute, ['hooks/install'])
+        self.juju_log.assert_not_called()
+        # The interpreter's exit handler writes what the hook logged.
+        self.register.assert_called_once_with(sink.flush)
+        self.register.call_args[0][0]()
+        self.assertEqual(
+            [c[0] for c in self.juju_log.call_args_list],
+            [('first\nsecond', hookenv.DEBUG), ('boom', hookenv.ERROR)])
+
+
+class CharmFactTests(unittest.TestCase):
+
+    def setUp(self):
+        self.charm_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.charm_dir)
+        with open(os.path.join(self.charm_dir, 'revision'), 'w') as f:
+            f.write('1\n')
+        self.env = {'CHARM_DIR': self.charm_dir,
+                    'JUJU_HOOK_NAME': 'config-changed'}
+        for target, value in (
+                ('os.environ', self.env),
+                ('charmhelpers.core.hookenv._charm_facts', None),
+                ('charmhelpers.core.hookenv.JUJUD_GLOB',
+                 os.path.join(self.charm_dir, 'jujud-*')),
+                ('charmhelpers.core.unitdata._KV', unitdata.Storage(
+                    os.path.join(self.charm_dir, '.unit-state.db')))):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def next_hook(self, name):
+        self.env['JUJU_HOOK_NAME'] = name
+        hookenv._charm_facts = None
+
+    def test_reused_by_later_hooks(self):
+        self.assertEqual(hookenv.charm_fact('fact', self.compute), 1)
+        self.next_hook('config-changed')
+        self.assertEqual(hookenv.charm_fact('fact', self.compute), 1)
+
+    def test_recomputed_on_upgrade_charm(self):
+        hookenv.charm_fact('fact', self.compute)
+        self.next_hook('upgrade-charm')
+        self.assertEqual(hookenv.charm_fact('fact', self.compute), 2)
+        self.next_hook('config-changed')
+        self.assertEqual(hookenv.charm_fact('fact', self.compute), 2)
+
+    def test_recomputed_when_revision_changes(self):
+        hookenv.charm_fact('fact', self.compute)
+        with open(os.path.join(self.charm_dir, 'revision'), 'w') as f:
+            f.write('2\n')
+        self.next_hook('config-changed')
+        self.assertEqual(hookenv.charm_fact('fact', self.compute), 2)
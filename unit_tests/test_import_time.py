@@ -0,0 +1,122 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+HOOKS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'hooks')
+
+# Cold-start import time allowed for cinder_hooks, in milliseconds, as
+# reported by -X importtime. It is generous so a loaded CI machine passes.
+IMPORT_BUDGET_MS = 500
+
+# Loaded by handlers that need them, never by importing cinder_hooks.
+DEFERRED_MODULES = [
+    'apt_pkg',
+    'charmhelpers.contrib.openstack.context',
+    'charmhelpers.contrib.openstack.templating',
+    'charmhelpers.contrib.openstack.utils',
+    'charmhelpers.contrib.storage.linux.ceph',
+    'charmhelpers.fetch',
+    'cinder_contexts',
+    'dns',
+    'jinja2',
+    'netaddr',
+    'netifaces',
+    'psutil',
+    'yaml',
+]
+
+MARKER = '--- cinder_hooks ---'
+
+IMPORT_CINDER_HOOKS = """
+import json
+import sys
+sys.path.insert(0, {hooks_dir!r})
+sys.stderr.write({marker!r} + '\\n')
+import cinder_utils
+# NOTE: registering configs runs hook tools; only imports are checked.
+cinder_utils.register_configs = lambda: None
+import cinder_hooks
+{call}
+json.dump([m for m in sys.modules if sys.modules[m]], sys.stdout)
+"""
+
+
+def import_cinder_hooks(call='', importtime=False):
+    """Import cinder_hooks in a fresh interpreter.
+
+    :param call: str: statement run after the import, eg. to call one of
+        the module's lazy callables
+    :param importtime: bool: run the interpreter with -X importtime
+    :returns: tuple of the modules loaded and, with importtime, the
+        cumulative time in milliseconds of each module imported at top
+        level.
+    """
+    cmd = [sys.executable]
+    if importtime:
+        cmd.extend(['-X', 'importtime'])
+    cmd.extend(['-c', IMPORT_CINDER_HOOKS.format(
+        hooks_dir=HOOKS_DIR, marker=MARKER, call=call)])
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    out, err = proc.communicate()
+    if proc.returncode:
+        raise AssertionError('importing cinder_hooks failed:\n' + err)
+    top_level = {}
+    if importtime:
+        # import time: self [us] | cumulative | imported package
+        for line in err.split(MARKER, 1)[-1].splitlines():
+            fields = line.split('|')
+            if (len(fields) != 3 or not line.startswith('import time:') or
+                    fields[2].startswith('  ')):
+                continue
+            top_level[fields[2].strip()] = int(fields[1]) / 1000.0
+    return json.loads(out), top_level
+
+
+def loaded(name, modules):
+    return name in modules or any(m.startswith(name + '.') for m in modules)
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_heavy_modules_deferred(self):
+        modules, _ = import_cinder_hooks()
+        self.assertEqual(
+            [name for name in DEFERRED_MODULES if loaded(name, modules)], [])
+
+    def test_lazy_callable_loads_its_module(self):
+        modules, _ = import_cinder_hooks(call='cinder_hooks.CephBrokerRq()')
+        self.assertIn('charmhelpers.contrib.storage.linux.ceph', modules)
+
+    @unittest.skipIf(sys.version_info < (3, 7),
+                     '-X importtime needs python 3.7 or later')
+    def test_import_budget(self):
+        # The first run may have to byte-compile.
+        runs = [import_cinder_hooks(importtime=True)[1] for _ in range(3)]
+        top_level = min(runs, key=lambda r: sum(r.values()))
+        elapsed = sum(top_level.values())
+        slowest = sorted(top_level.items(), key=lambda i: i[1],
+                         reverse=True)[:10]
+        self.assertLessEqual(
+            elapsed, IMPORT_BUDGET_MS,
+            'importing cinder_hooks took {:.1f}ms (budget {}ms){}'.format(
+                elapsed, IMPORT_BUDGET_MS,
+                ''.join('\n  {:8.1f}ms {}'.format(t, name)
+                        for name, t in slowest)))
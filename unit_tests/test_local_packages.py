@@ -0,0 +1,214 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from mock import patch
+
+import charmhelpers.fetch.ubuntu as fetch
+
+# Packages index of the dummy packages, as dpkg-scanpackages writes it.
+PACKAGES = """\
+Package: ceph-common
+Version: 12.2.4-0ubuntu1
+Architecture: amd64
+Depends: librados2 (= 12.2.4-0ubuntu1), librbd1 (= 12.2.4-0ubuntu1), \
+python-rados | python3-rados, libc6 (>= 2.14)
+Filename: ./ceph-common_12.2.4-0ubuntu1_amd64.deb
+Description: common utilities to mount and interact with a ceph storage
+ cluster
+
+Package: librados2
+Version: 12.2.4-0ubuntu1
+Architecture: amd64
+Pre-Depends: multiarch-support
+Depends: libc6 (>= 2.14)
+Filename: ./librados2_12.2.4-0ubuntu1_amd64.deb
+
+Package: librbd1
+Version: 12.2.4-0ubuntu1
+Architecture: amd64
+Depends: librados2 (= 12.2.4-0ubuntu1)
+Filename: ./librbd1_12.2.4-0ubuntu1_amd64.deb
+
+Package: python-rados
+Version: 12.2.4-0ubuntu1
+Architecture: amd64
+Depends: librados2 (= 12.2.4-0ubuntu1), python:any (>= 2.7.5-5~)
+Filename: ./python-rados_12.2.4-0ubuntu1_amd64.deb
+"""
+
+INSTALLED = {
+    'libc6': '2.27-3ubuntu1',
+    'librbd1': '12.2.4-0ubuntu1',
+    'python': '2.7.15~rc1-1',
+}
+
+
+class LocalPackagesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.staging = os.path.join(self.tmp, 'staging')
+        self.resource = self.make_resource()
+        for target, kwargs in (
+                ('LOCAL_PACKAGES_DIR', {'new': self.staging}),
+                ('_local_packages', {'new': None}),
+                ('log', {}),
+                ('resource_get', {'return_value': self.resource + '\n'}),
+                ('installed_version', {'side_effect': INSTALLED.get}),
+                ('_run_apt_command', {'return_value': 0})):
+            patcher = patch.object(fetch, target, **kwargs)
+            setattr(self, target.strip('_'), patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def make_resource(self):
+        """Write a tarball of dummy packages and their index."""
+        build = os.path.join(self.tmp, 'build', 'debs')
+        os.makedirs(build)
+        with open(os.path.join(build, 'Packages'), 'w') as f:
+            f.write(PACKAGES)
+        for line in PACKAGES.splitlines():
+            if line.startswith('Filename: '):
+                name = os.path.basename(line.split(': ', 1)[1])
+                with open(os.path.join(build, name), 'w') as f:
+                    f.write('dummy package\n')
+        path = os.path.join(self.tmp, 'packages.tar.gz')
+        with tarfile.open(path, 'w:gz') as tar:
+            tar.add(build, arcname='debs')
+        return path
+
+    def deb(self, name):
+        return os.path.join(self.staging,
+                            '{}_12.2.4-0ubuntu1_amd64.deb'.format(name))
+
+    def commands(self):
+        """Return the apt and dpkg commands run."""
+        return [c[0][0] for c in self.run_apt_command.call_args_list]
+
+    def installed(self):
+        """Return the packages passed to apt-get install or dpkg."""
+        packages = []
+        for cmd in self.commands():
+            if cmd[0] == 'dpkg':
+                packages.extend(p for p in cmd if p.endswith('.deb'))
+            else:
+                packages.extend(cmd[cmd.index('install') + 1:])
+        return packages
+
+    def test_stage(self):
+        self.assertEqual(fetch.stage_local_packages(), 4)
+        self.resource_get.assert_called_once_with('packages')
+        self.assertEqual(sorted(os.listdir(self.staging)), [
+            '.source',
+            'Packages',
+            'ceph-common_12.2.4-0ubuntu1_amd64.deb',
+            'librados2_12.2.4-0ubuntu1_amd64.deb',
+            'librbd1_12.2.4-0ubuntu1_amd64.deb',
+            'python-rados_12.2.4-0ubuntu1_amd64.deb',
+        ])
+        self.assertEqual(fetch.local_packages()['ceph-common']['depends'],
+                         ['librados2', 'librbd1', 'python-rados', 'libc6'])
+
+    def test_stage_unchanged_resource(self):
+        fetch.stage_local_packages()
+        with patch.object(fetch.tarfile, 'open') as tar_open:
+            self.assertEqual(fetch.stage_local_packages(), 4)
+        tar_open.assert_not_called()
+
+    def test_stage_without_resource(self):
+        self.resource_get.return_value = False
+        self.assertEqual(fetch.stage_local_packages(), 0)
+        empty = os.path.join(self.tmp, 'empty.tar.gz')
+        open(empty, 'w').close()
+        self.resource_get.return_value = empty
+        self.assertEqual(fetch.stage_local_packages(), 0)
+        self.assertFalse(os.path.exists(self.staging))
+
+    def test_install_prefers_staged_packages(self):
+        fetch.stage_local_packages()
+        fetch.apt_install(['ceph-common', 'cinder-common'], fatal=True)
+        # librbd1 is installed already and cinder-common was not staged.
+        # The staged packages go in first, so apt does not fetch them as
+        # dependencies of cinder-common.
+        debs = [self.deb('ceph-common'), self.deb('librados2'),
+                self.deb('python-rados')]
+        self.assertEqual(self.commands(), [
+            ['dpkg', '--install', '--force-confold'] + debs,
+            ['apt-get', '--assume-yes',
+             '--option=Dpkg::Options::=--force-confold', 'install',
+             'cinder-common'],
+        ])
+
+    def test_install_staged_dependency_before_archive_package(self):
+        fetch.stage_local_packages()
+        installed = dict(INSTALLED)
+        self.installed_version.side_effect = installed.get
+
+        def run_apt_command(cmd, fatal=False):
+            if cmd[0] == 'dpkg':
+                installed['librados2'] = '12.2.4-0ubuntu1'
+            else:
+                # apt would fetch librados2 from the archive otherwise.
+                self.assertIn('librados2', installed)
+            return 0
+
+        self.run_apt_command.side_effect = run_apt_command
+        fetch.apt_install(['librados2', 'rbd-nbd'], options=[], fatal=True)
+        self.assertEqual(self.commands(), [
+            ['dpkg', '--install', self.deb('librados2')],
+            ['apt-get', '--assume-yes', 'install', 'rbd-nbd'],
+        ])
+
+    def test_install_fixes_missing_dependencies(self):
+        fetch.stage_local_packages()
+        installed = dict(INSTALLED)
+        self.installed_version.side_effect = installed.get
+
+        def run_apt_command(cmd, fatal=False):
+            if cmd[0] == 'dpkg':
+                return 1
+            installed['librados2'] = '12.2.4-0ubuntu1'
+            return 0
+
+        self.run_apt_command.side_effect = run_apt_command
+        fetch.apt_install(['librados2'], options=[], fatal=True)
+        self.assertEqual(self.commands(), [
+            ['dpkg', '--install', self.deb('librados2')],
+            ['apt-get', '--assume-yes', '--fix-broken', 'install'],
+        ])
+        self.run_apt_command.assert_called_with(self.commands()[1], True)
+
+    def test_install_debs_failed(self):
+        fetch.stage_local_packages()
+        self.run_apt_command.side_effect = [2, 0]
+        self.assertRaises(fetch.subprocess.CalledProcessError,
+                          fetch.apt_install, ['librados2'], fatal=True)
+
+    def test_install_pinned_version(self):
+        fetch.stage_local_packages()
+        fetch.apt_install('librados2=12.2.4-0ubuntu2')
+        self.assertEqual(self.installed(), ['librados2=12.2.4-0ubuntu2'])
+        self.run_apt_command.reset_mock()
+        fetch.apt_install('librados2=12.2.4-0ubuntu1')
+        self.assertEqual(self.installed(), [self.deb('librados2')])
+
+    def test_install_without_staged_packages(self):
+        fetch.apt_install(['ceph-common'])
+        self.assertEqual(self.installed(), ['ceph-common'])
@@ -0,0 +1,101 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from mock import patch
+
+from charmhelpers.contrib.openstack import utils
+from charmhelpers.core import unitdata
+
+VERSIONS = {
+    'cinder-common': '12.0.4',
+    'ceph-common': '12.2.4',
+}
+
+
+class ApplicationVersionSetTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stamp = (1534000000.0, 81920)
+        self.versions = dict(VERSIONS)
+        for target, kwargs in (
+                ('dpkg_status_stamp', {'new': lambda: self.stamp}),
+                ('get_upstream_version',
+                 {'side_effect': lambda package: self.versions.get(package)}),
+                ('os_release', {'return_value': 'queens'}),
+                ('application_version_set', {})):
+            patcher = patch.object(utils, target, **kwargs)
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(unitdata, '_KV', unitdata.Storage(':memory:'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def versions_set(self):
+        return [args[0] for args, _ in
+                self.application_version_set.call_args_list]
+
+    def test_cached(self):
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(unitdata.kv().get(utils.APPLICATION_VERSION_KEY), {
+            'package': 'cinder-common',
+            'dpkg-status': [1534000000.0, 81920],
+            'version': '12.0.4',
+        })
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(self.versions_set(), ['12.0.4'])
+        self.get_upstream_version.assert_called_once_with('cinder-common')
+
+    def test_package_changed(self):
+        utils.os_application_version_set('cinder-common')
+        utils.os_application_version_set('ceph-common')
+        self.assertEqual(self.versions_set(), ['12.0.4', '12.2.4'])
+        utils.os_application_version_set('ceph-common')
+        self.assertEqual(len(self.versions_set()), 2)
+
+    def test_dpkg_status_changed(self):
+        utils.os_application_version_set('cinder-common')
+        # An upgrade rewrites the dpkg status file.
+        self.stamp = (1534003600.0, 82944)
+        self.versions['cinder-common'] = '12.0.5'
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(self.versions_set(), ['12.0.4', '12.0.5'])
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(self.get_upstream_version.call_count, 2)
+
+    def test_dpkg_status_changed_without_upgrade(self):
+        utils.os_application_version_set('cinder-common')
+        self.stamp = (1534003600.0, 82944)
+        utils.os_application_version_set('cinder-common')
+        # The version is looked up again, but it has not changed.
+        self.assertEqual(self.get_upstream_version.call_count, 2)
+        self.assertEqual(self.versions_set(), ['12.0.4'])
+        self.assertEqual(
+            unitdata.kv().get(utils.APPLICATION_VERSION_KEY)['dpkg-status'],
+            [1534003600.0, 82944])
+
+    def test_codename_not_cached(self):
+        del self.versions['cinder-common']
+        utils.os_application_version_set('cinder-common')
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(self.versions_set(), ['queens', 'queens'])
+        self.assertIsNone(unitdata.kv().get(utils.APPLICATION_VERSION_KEY))
+
+    def test_not_cached_without_dpkg_status(self):
+        self.stamp = None
+        utils.os_application_version_set('cinder-common')
+        utils.os_application_version_set('cinder-common')
+        self.assertEqual(self.versions_set(), ['12.0.4', '12.0.4'])
+        self.assertIsNone(unitdata.kv().get(utils.APPLICATION_VERSION_KEY))
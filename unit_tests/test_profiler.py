@@ -0,0 +1,162 @@
+# Copyright 2018 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+
+from mock import MagicMock, patch
+
+from charmhelpers.core import profiler
+
+
+class ClassifyTests(unittest.TestCase):
+
+    def test_ceph(self):
+        self.assertEqual(
+            profiler.classify(['ceph', '--id', 'admin', 'osd', 'pool',
+                               'create', 'cinder', '64']),
+            ('ceph', 'osd pool create'))
+        self.assertEqual(
+            profiler.classify(['ceph', '--id', 'admin', 'osd', 'ls',
+                               '--format', 'json']),
+            ('ceph', 'osd ls'))
+        self.assertEqual(
+            profiler.classify('ceph --id=admin mon_status --format=json'),
+            ('ceph', 'mon_status'))
+
+    def test_rados_and_rbd(self):
+        self.assertEqual(
+            profiler.classify(['rbd', '--id', 'admin', 'list', '--pool',
+                               'cinder']),
+            ('rbd', 'list'))
+        self.assertEqual(
+            profiler.classify(['rados', '--id', 'admin', '-p', 'cinder',
+                               'cache-flush-evict-all']),
+            ('rados', 'cache-flush-evict-all'))
+
+    def test_other_tools(self):
+        self.assertEqual(
+            profiler.classify(['apt-get', '--assume-yes', 'install', 'x']),
+            ('apt-get', 'install'))
+        self.assertEqual(profiler.classify(['/usr/bin/dpkg', '-i', 'x.deb']),
+                         ('dpkg', None))
+        self.assertEqual(profiler.classify(['relation-set', '--file', '-']),
+                         ('relation-set', None))
+        self.assertEqual(profiler.classify([]), (None, None))
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        for target, value in (
+                ('charmhelpers.core.profiler._calls', self.calls),
+                ('charmhelpers.core.profiler._running', []),
+                ('charmhelpers.core.hookenv.hook_name',
+                 lambda: 'config-changed')):
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def record(self, tool, verb, duration, exit_code=0):
+        self.calls.append({'tool': tool, 'verb': verb,
+                           'duration': duration, 'exit-code': exit_code})
+
+
+class ReportTests(ProfilerTestCase):
+
+    def test_totals(self):
+        self.record('ceph', 'osd pool get', 0.5)
+        self.record('ceph', 'osd pool get', 0.25, exit_code=2)
+        self.record('rbd', 'list', 1.0)
+        self.record('relation-set', None, 0.125)
+        data = profiler.report()
+        self.assertEqual(data['hook'], 'config-changed')
+        self.assertEqual(data['calls'], 4)
+        self.assertEqual(data['time'], 1.875)
+        self.assertEqual(data['tools'], {
+            'ceph': {'calls': 2, 'time': 0.75, 'failures': 1},
+            'rbd': {'calls': 1, 'time': 1.0, 'failures': 0},
+            'relation-set': {'calls': 1, 'time': 0.125, 'failures': 0},
+        })
+        self.assertEqual(data['ceph-verbs'], {
+            'ceph osd pool get': {'calls': 2, 'time': 0.75, 'failures': 1},
+            'rbd list': {'calls': 1, 'time': 1.0, 'failures': 0},
+        })
+        self.assertEqual([c['tool'] for c in data['slowest']],
+                         ['rbd', 'ceph', 'ceph', 'relation-set'])
+
+    @patch('charmhelpers.core.hookenv.charm_dir', lambda: None)
+    @patch('charmhelpers.core.profiler._hook_succeeded', True)
+    @patch('charmhelpers.core.unitdata.kv')
+    def test_recorded_inside_hook_scope(self, kv):
+        kv.return_value.revision = 3
+        self.record('ceph', 'osd ls', 0.5)
+        profiler._write_report()
+        kv.return_value.set.assert_called_once_with(profiler.PROFILE_KEY, {
+            'calls': 1, 'time': 0.5,
+            'tools': {'ceph': {'calls': 1, 'time': 0.5, 'failures': 0}},
+            'ceph-verbs': {
+                'ceph osd ls': {'calls': 1, 'time': 0.5, 'failures': 0}},
+        })
+        kv.return_value.flush.assert_called_once_with()
+
+
+class WrapTests(ProfilerTestCase):
+
+    def setUp(self):
+        super(WrapTests, self).setUp()
+        popen = profiler._wrap('Popen', subprocess.Popen)
+        patcher = patch.object(subprocess, 'Popen', popen)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_popen_recorded_when_waited_for(self):
+        proc = subprocess.Popen(['sh', '-c', 'cat >/dev/null; exit 3'],
+                                stdin=subprocess.PIPE)
+        self.assertEqual(self.calls, [])
+        proc.communicate(b'key=value')
+        proc.wait()
+        self.assertEqual([(c['tool'], c['exit-code']) for c in self.calls],
+                         [('sh', 3)])
+
+    def test_popen_missing_command(self):
+        self.assertRaises(OSError, subprocess.Popen, ['/nonexistent/rbd'])
+        self.assertEqual([(c['tool'], c['exit-code']) for c in self.calls],
+                         [('rbd', -2)])
+
+    def test_wrapped_call_recorded_once(self):
+        check_output = profiler._wrap('check_output',
+                                      subprocess.check_output)
+        self.assertEqual(check_output(['echo', 'ok']).strip(), b'ok')
+        self.assertEqual([c['tool'] for c in self.calls], ['echo'])
+
+    def test_nested_call_recorded_once(self):
+        call = profiler._wrap('call', subprocess.call)
+
+        def check_call(cmd):
+            if call(cmd):
+                raise subprocess.CalledProcessError(1, cmd)
+
+        check_call = profiler._wrap('check_call', check_call)
+        check_call(['true'])
+        self.assertEqual([c['tool'] for c in self.calls], ['true'])
+
+    def test_failed_call(self):
+        check_call = profiler._wrap('check_call', MagicMock(
+            side_effect=subprocess.CalledProcessError(100, ['apt-get'])))
+        self.assertRaises(subprocess.CalledProcessError, check_call,
+                          ['apt-get', 'update'])
+        self.assertEqual(self.calls[0]['verb'], 'update')
+        self.assertEqual(self.calls[0]['exit-code'], 100)